@@ -0,0 +1,446 @@
+# action_journal.py — write-ahead log for state-changing banking actions
+#
+# Card blocks and contact updates used to change a dict in memory (and, on
+# SQLite, write the whole document inside the /process turn), so a restart of
+# the in-memory store silently unblocked cards. Mutations now go through an
+# append-only JSON-lines log (ACTION_LOG):
+#   - ActionJournal.append() buffers the record; one flusher writes and fsyncs
+#     everything buffered so far in a thread, so concurrent calls share one
+#     fsync (group commit) and the event loop never waits on the disk
+#   - a caller is confirmed once its record is committed (`committed()`)
+#   - committed records are applied to the customer store in the background;
+#     until then JournaledCustomerRepository overlays them on reads, so the
+#     next turn already sees the blocked card
+#   - on startup the log is replayed into the store (everything for the
+#     in-memory store, only past the applied watermark for SQLite)
+# Several uvicorn workers can't share one log (each would number records and
+# track the watermark on its own), so each process claims a slot on first use:
+# ACTION_LOG itself, else ACTION_LOG.1, .2 ... , held by an exclusive lock on
+# <slot>.lock for the life of the process, with its own seq and .applied file.
+# Nothing is created on disk before the repository is first used.
+# Every mutation sets a value, so replaying a record twice is harmless. A batch
+# the store refuses is retried, never skipped, so the watermark only covers a
+# contiguous prefix of the log. If a log write fails its records are cut from
+# the file and their overlay is dropped: the caller is told, nothing changed.
+# Every COMPACT_EVERY applied actions the log is rewritten without what a
+# restart no longer needs: records the SQLite store already holds, or, for the
+# in-memory store, records a later one overrides. The last record is always
+# kept; it carries the sequence number.
+
+import asyncio
+import contextvars
+import copy
+import heapq
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from customer_store import MUTATION_TARGETS, MUTATIONS, CustomerRepository, SQLiteCustomerRepository, normalise_phone
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger("action_journal")
+
+MAX_SLOTS = 64
+COMPACT_EVERY = 1000   # applied actions between log compactions
+
+# Sequence number of the last record appended by the current task and not yet waited on by
+# committed(). A /media-stream task lives for the whole call, so committed() clears it: a later
+# turn that appends nothing must not wait on (or fail with) an earlier turn's record
+_last_appended = contextvars.ContextVar("last_appended", default=0)
+
+
+def slot_path(base: str, n: int) -> str:
+    return base if n == 0 else f"{base}.{n}"
+
+
+def slot_paths(base: str) -> list:
+    """Logs of every slot that has one, slot 0 first."""
+    return [p for p in (slot_path(base, n) for n in range(MAX_SLOTS)) if os.path.exists(p)]
+
+
+def try_lock(fh) -> bool:
+    """Exclusive, non-blocking lock on an open file, released when it is closed."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _read_watermark(path: str) -> int:
+    """Highest seq of the log at `path` that the store already holds."""
+    try:
+        with open(path + ".applied") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_watermark(path: str, seq: int):
+    with open(path + ".applied", "w") as f:
+        f.write(str(seq))
+
+
+def _latest(records: list) -> list:
+    """Records not overridden by a later one (everything the in-memory store needs on replay)."""
+    seen, kept = set(), []
+    for record in reversed(records):
+        targets = {(record["phone"], t) for t in MUTATION_TARGETS[record["action"]](record["args"])}
+        if not targets <= seen:
+            kept.append(record)
+        seen |= targets
+    return kept[::-1]
+
+
+class ActionJournal:
+    def __init__(self, path: str, fsync: bool = True, group_commit: bool = True):
+        self.base = path
+        self.path = path                   # this process's slot, once open() has claimed one
+        self.fsync = fsync
+        self.group_commit = group_commit   # False: one write+fsync per record (baseline)
+        self.last_seq = self.committed_seq = 0
+        self._file = None
+        self._lock = None
+        self._buffer = []                  # (seq, line, record) appended, not yet written
+        self._waiters = []                 # (seq, future)
+        self._failed = deque(maxlen=256)   # (first seq, last seq, error) of batches that were not written
+        self._flusher = None
+        self._compact = None               # keep(records) for a rewrite the flusher has yet to do
+        self.on_commit = None              # callback(records) after each durable batch
+        self.on_failure = None             # callback(records) after a batch could not be written
+        self.stats = {"appended": 0, "commits": 0, "max_batch": 0, "commit_seconds": 0.0, "compacted": 0}
+
+    def open(self) -> "ActionJournal":
+        """Claim the first slot no other process holds and recover its sequence number."""
+        if self._file is not None:
+            return self
+        os.makedirs(os.path.dirname(os.path.abspath(self.base)), exist_ok=True)
+        for n in range(MAX_SLOTS):
+            lock = open(slot_path(self.base, n) + ".lock", "a")
+            if try_lock(lock):
+                break
+            lock.close()
+        else:
+            raise RuntimeError(f"all {MAX_SLOTS} slots of action log {self.base} are held by other processes")
+        self.path, self._lock = slot_path(self.base, n), lock
+        self.last_seq = self.committed_seq = self._recover_seq()
+        self._file = open(self.path, "ab", buffering=0)   # unbuffered: a failed write leaves nothing behind to retry
+        return self
+
+    def _recover_seq(self) -> int:
+        last = 0
+        for record in self.replay():
+            last = record["seq"]
+        return last
+
+    def replay(self, after: int = 0, path: str = None):
+        """Committed records with seq > after, oldest first. A torn last line is skipped."""
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.warning("skipping torn record at the end of %s", path)
+                    continue
+                if record["seq"] > after:
+                    yield record
+
+    def append(self, action: str, phone: str, args: dict) -> int:
+        """Buffer one record for the next group commit; returns its sequence number."""
+        self.open()
+        self.last_seq += 1
+        record = {"seq": self.last_seq, "ts": time.time(), "action": action, "phone": phone, "args": args}
+        self._buffer.append((self.last_seq, (json.dumps(record, separators=(",", ":")) + "\n").encode(), record))
+        self.stats["appended"] += 1
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return self.last_seq
+
+    async def wait(self, seq: int = None):
+        """Return once record `seq` (default: everything appended so far) is durable; raise if it was lost."""
+        seq = self.last_seq if seq is None else seq
+        for first, last, error in self._failed:
+            if first <= seq <= last:
+                raise error
+        if seq <= self.committed_seq:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((seq, future))
+        await future
+
+    async def _flush(self):
+        # Whatever piles up while one batch is being written and fsynced becomes the next batch
+        while self._buffer or self._compact:
+            if self._compact:
+                keep, self._compact = self._compact, None
+                try:
+                    await asyncio.to_thread(self._rewrite, keep)
+                except Exception as e:
+                    log.warning("compacting action log %s failed: %s", self.path, e)
+                continue
+            if self.group_commit:
+                batch, self._buffer = self._buffer, []
+            else:
+                batch, self._buffer = self._buffer[:1], self._buffer[1:]
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, b"".join(line for _, line, _ in batch))
+            except Exception as e:
+                log.error("action log write failed (%d records): %s", len(batch), e)
+                self._failed.append((batch[0][0], batch[-1][0], e))
+                self._resolve(batch[-1][0], e)
+                if self.on_failure:
+                    self.on_failure([record for _, _, record in batch])
+                continue
+            self.stats["commits"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["commit_seconds"] += time.perf_counter() - t0
+            self.committed_seq = batch[-1][0]
+            self._resolve(self.committed_seq)
+            if self.on_commit:
+                self.on_commit([record for _, _, record in batch])
+
+    def _write(self, data: bytes):
+        fd = self._file.fileno()
+        size = os.fstat(fd).st_size
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self._file.write(view):]
+            if self.fsync:
+                os.fsync(fd)
+        except Exception:
+            # Callers are told these records failed: don't let a replay apply them
+            os.ftruncate(fd, size)
+            raise
+
+    def compact(self, keep):
+        """Have the flusher rewrite the log, between two writes, with only keep(records) plus the last record."""
+        self._compact = keep
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+
+    def _rewrite(self, keep):
+        records = list(self.replay())
+        kept = keep(records)
+        if records and (not kept or kept[-1]["seq"] != records[-1]["seq"]):
+            kept.append(records[-1])
+        if len(kept) == len(records):
+            return
+        tmp = self.path + ".compact"
+        with open(tmp, "wb") as f:
+            f.writelines((json.dumps(r, separators=(",", ":")) + "\n").encode() for r in kept)
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()   # Windows can't replace an open file
+        try:
+            os.replace(tmp, self.path)
+        finally:
+            self._file = open(self.path, "ab", buffering=0)
+        self.stats["compacted"] += len(records) - len(kept)
+
+    def _resolve(self, upto: int, error: Exception = None):
+        waiting = []
+        for seq, future in self._waiters:
+            if seq > upto:
+                waiting.append((seq, future))
+            elif not future.done():
+                future.set_exception(error) if error else future.set_result(None)
+        self._waiters = waiting
+
+    async def flushed(self):
+        """Wait for everything appended so far to be written (or to fail)."""
+        if self._flusher and not self._flusher.done():
+            await asyncio.shield(self._flusher)
+
+    async def aclose(self, timeout: float = 5.0):
+        try:
+            await asyncio.wait_for(self.flushed(), timeout)
+        except asyncio.TimeoutError:
+            log.error("action log %s still writing after %.0fs; left open", self.path, timeout)
+            return
+        for fh in (self._file, self._lock):
+            if fh is not None:
+                fh.close()
+        self._file = self._lock = None
+
+
+class JournaledCustomerRepository(CustomerRepository):
+    """Reads from `inner`; mutations are logged first and applied to `inner` behind the caller."""
+
+    def __init__(self, inner: CustomerRepository, journal: ActionJournal):
+        self.inner = inner
+        self.journal = journal
+        self._pending = {}                 # phone -> [records committed or buffered, not yet applied]
+        self._apply_queue = asyncio.Queue()
+        self._applier = None
+        self._opened = False
+        self.shared_store = isinstance(inner, SQLiteCustomerRepository)   # keeps what was applied across restarts
+        journal.on_commit = self._apply_queue.put_nowait
+        journal.on_failure = self._roll_back
+        self.stats = {"replayed": 0, "applied": 0, "rolled_back": 0}
+        self._compacted_at = 0
+
+    def open(self) -> "JournaledCustomerRepository":
+        """Claim a log slot and replay the logs into the store (startup; otherwise on first use)."""
+        if not self._opened:
+            self._opened = True
+            self.journal.open()
+            self._replay()
+        return self
+
+    def _replay(self):
+        if self.shared_store:
+            # Our slot past its watermark, and any slot no live worker holds (fewer workers than last run)
+            for path in slot_paths(self.journal.base):
+                if path == self.journal.path:
+                    self._replay_slot(path)
+                    continue
+                with open(path + ".lock", "a") as lock:
+                    if try_lock(lock):
+                        self._replay_slot(path)
+        else:
+            # A private in-memory store starts from sample data: every slot's actions, in time order
+            logs = [self.journal.replay(path=p) for p in slot_paths(self.journal.base)]
+            for record in heapq.merge(*logs, key=lambda r: r["ts"]):
+                self.inner.apply(record["phone"], record["action"], **record["args"])
+                self.stats["replayed"] += 1
+        if self.stats["replayed"]:
+            log.info("replayed %d actions from %s*", self.stats["replayed"], self.journal.base)
+
+    def _replay_slot(self, path: str):
+        after = last = _read_watermark(path)
+        for record in self.journal.replay(after, path):
+            self.inner.apply(record["phone"], record["action"], **record["args"])
+            self.stats["replayed"] += 1
+            last = record["seq"]
+        if last > after:
+            _write_watermark(path, last)
+
+    # ---------------- reads ----------------
+    def get(self, phone):
+        if not self._opened:
+            self.open()
+        c = self.inner.get(phone)
+        pending = self._pending.get(normalise_phone(phone)) if c else None
+        if pending:
+            # On a copy: the stored record only changes once the action is committed and applied
+            c = copy.deepcopy(c)
+            for record in pending:
+                MUTATIONS[record["action"]](c, **record["args"])
+        return c
+
+    def find_by_card_last4(self, last4):
+        return self.inner.find_by_card_last4(last4)
+
+    def find_by_policy_no(self, policy_no):
+        return self.inner.find_by_policy_no(policy_no)
+
+    def find_by_loan_type(self, loan_type, limit=100):
+        return self.inner.find_by_loan_type(loan_type, limit)
+
+    def find_with_loans(self, limit=None):
+        return self.inner.find_with_loans(limit)
+
+    def find_with_policies(self, limit=None):
+        return self.inner.find_with_policies(limit)
+
+    def save(self, phone, customer):
+        self.inner.save(phone, customer)
+
+    def __len__(self):
+        return len(self.inner)
+
+    # ---------------- writes ----------------
+    def apply(self, phone, action, /, **args):
+        """Validate against the current record, log the action and overlay it; durable after committed()."""
+        key = normalise_phone(phone)
+        c = copy.deepcopy(self.get(key))   # get() opens the log on first use
+        if not c or not MUTATIONS[action](c, **args):
+            return False
+        seq = self.journal.append(action, key, args)
+        _last_appended.set(seq)
+        self._pending.setdefault(key, []).append({"seq": seq, "action": action, "args": args})
+        if self._applier is None or self._applier.done():
+            self._applier = asyncio.create_task(self._apply_loop())
+        return True
+
+    async def committed(self):
+        """Wait until this turn's actions are durable; raises if their log write failed."""
+        seq = _last_appended.get()
+        _last_appended.set(0)
+        if seq:
+            await self.journal.wait(seq)
+
+    def _drop_pending(self, records):
+        seqs = {r["seq"] for r in records}
+        for phone in {r["phone"] for r in records}:
+            left = [p for p in self._pending.get(phone, ()) if p["seq"] not in seqs]
+            if left:
+                self._pending[phone] = left
+            else:
+                self._pending.pop(phone, None)
+
+    def _roll_back(self, records):
+        # The log write failed: these actions never happened
+        self._drop_pending(records)
+        self.stats["rolled_back"] += len(records)
+
+    async def _apply_loop(self):
+        while True:
+            records = [await self._apply_queue.get()]
+            while not self._apply_queue.empty():
+                records.append(self._apply_queue.get_nowait())
+            batch = [r for rs in records for r in rs]
+            delay = 0.5
+            while True:
+                try:
+                    await asyncio.to_thread(self._apply_batch, batch)
+                    break
+                except Exception:
+                    # Later batches wait behind this one, so the watermark never passes an unapplied record
+                    log.exception("applying %d actions failed; retrying in %.1fs", len(batch), delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30)
+            self._drop_pending(batch)
+            self.stats["applied"] += len(batch)
+            if self.stats["applied"] - self._compacted_at >= COMPACT_EVERY:
+                self._compacted_at = self.stats["applied"]
+                upto = batch[-1]["seq"]
+                self.journal.compact(
+                    (lambda records: [r for r in records if r["seq"] > upto]) if self.shared_store else _latest)
+
+    def _apply_batch(self, batch: list):
+        for record in batch:
+            self.inner.apply(record["phone"], record["action"], **record["args"])
+        if self.shared_store:
+            _write_watermark(self.journal.path, batch[-1]["seq"])
+
+    async def aclose(self, timeout: float = 5.0):
+        """Commit and apply what is outstanding, for at most `timeout` seconds (shutdown)."""
+        async def drain():
+            await self.journal.flushed()
+            while self._pending and self._applier and not self._applier.done():
+                await asyncio.sleep(0.01)
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("%d actions not applied to the store at shutdown; they are replayed from %s on restart",
+                        sum(len(p) for p in self._pending.values()), self.journal.path)
+        if self._applier:
+            self._applier.cancel()
+        await self.journal.aclose(timeout=0.1)
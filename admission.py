@@ -0,0 +1,141 @@
+# admission.py — admission control and stepped load shedding for the webhooks
+#
+# Under a spike every /process used to queue behind the others until Twilio
+# gave up and the caller heard silence. AdmissionMiddleware counts in-flight
+# webhook turns and keeps the latencies of recently admitted /process turns
+# (ADMISSION_WINDOW seconds), and each request is admitted at a level:
+#   0 normal
+#   1 no_rephrase    speak the template text, no LLM call or prefetch
+#   2 no_dashboard   ... and don't forward events to the dashboard
+#   3 shed           answer at once with "please hold" TwiML (/voice: call back later)
+# The level is the highest one whose threshold is reached, by in-flight turns
+# (ADMISSION_INFLIGHT) or by the recent p95 turn latency (ADMISSION_TURN_MS);
+# both take three comma-separated thresholds, "" turns a signal off. Code on
+# the hot path asks `skip_rephrase()` / `skip_dashboard()`, which read the
+# current request's level from a context variable (level 0 outside a request).
+# Shed replies are marked no-store so a Twilio retry is not answered from the
+# idempotency cache with "please hold".
+
+import contextvars
+import os
+import time
+from collections import deque
+
+import twiml_templates as twiml
+from metrics import REGISTRY, current_turn, stage
+
+LEVELS = ("normal", "no_rephrase", "no_dashboard", "shed")
+NO_REPHRASE, NO_DASHBOARD, SHED = 1, 2, 3
+SHED_HEADERS = [(b"content-type", b"application/xml"), (b"cache-control", b"no-store"), (b"x-load-shed", b"1")]
+
+REGISTRY.describe("bfsi_admission_total", "Webhook turns by endpoint and the degradation level they were admitted at")
+REGISTRY.describe("bfsi_inflight_turns", "Webhook turns currently being served")
+REGISTRY.describe("bfsi_admission_level", "Level a webhook turn would be admitted at now (0 normal .. 3 shed)")
+
+_level = contextvars.ContextVar("admission_level", default=0)
+
+
+def skip_rephrase() -> bool:
+    return _level.get() >= NO_REPHRASE
+
+
+def skip_dashboard() -> bool:
+    return _level.get() >= NO_DASHBOARD
+
+
+def _thresholds(value: str) -> tuple:
+    return tuple(float(v) for v in value.split(",")) if value.strip() else ()
+
+
+def _level_for(value: float, thresholds: tuple) -> int:
+    return sum(value >= t for t in thresholds)
+
+
+def _p95(values) -> float:
+    values = sorted(values)
+    return values[int(0.95 * (len(values) - 1))] if values else 0.0
+
+
+class AdmissionController:
+    def __init__(self, inflight: str = None, turn_ms: str = None, window: float = None, refresh: float = 0.1):
+        self.inflight_limits = _thresholds(inflight if inflight is not None else os.getenv("ADMISSION_INFLIGHT", "64,128,256"))
+        self.latency_limits = _thresholds(turn_ms if turn_ms is not None else os.getenv("ADMISSION_TURN_MS", "2500,5000,8000"))
+        self.window = window if window is not None else float(os.getenv("ADMISSION_WINDOW", 10))
+        self.refresh = refresh
+        self.inflight = 0
+        self._recent = deque(maxlen=2048)    # (finished at, turn seconds, stages)
+        self._latency_level = 0
+        self._refreshed = 0.0
+        self.stats = {level: 0 for level in LEVELS}
+
+    def level(self) -> int:
+        now = time.monotonic()
+        if now - self._refreshed >= self.refresh:
+            # p95 of the last `window` seconds, recomputed at most every `refresh` seconds
+            while self._recent and self._recent[0][0] < now - self.window:
+                self._recent.popleft()
+            self._latency_level = _level_for(_p95([s for _, s, _ in self._recent]) * 1000, self.latency_limits)
+            self._refreshed = now
+        return max(_level_for(self.inflight + 1, self.inflight_limits), self._latency_level)
+
+    def admit(self, endpoint: str, can_shed: bool = True) -> int:
+        level = self.level()
+        if level >= SHED and not can_shed:
+            level = NO_DASHBOARD
+        self.stats[LEVELS[level]] += 1
+        REGISTRY.inc("bfsi_admission_total", endpoint=endpoint, level=LEVELS[level])
+        if level < SHED:
+            self.inflight += 1
+        return level
+
+    def release(self, endpoint: str, seconds: float, stages=()):
+        self.inflight -= 1
+        if endpoint == "/process":
+            self._recent.append((time.monotonic(), seconds, tuple(stages)))
+
+    def recent_stages_p95_ms(self) -> dict:
+        by_stage = {}
+        for _, _, stages in self._recent:
+            for name, seconds in stages:
+                by_stage.setdefault(name, []).append(seconds)
+        return {name: round(_p95(v) * 1000, 1) for name, v in by_stage.items()}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "inflight": self.inflight, "level": LEVELS[self.level()],
+                "turn_p95_ms": round(_p95([s for _, s, _ in self._recent]) * 1000, 1),
+                "stages_p95_ms": self.recent_stages_p95_ms()}
+
+
+# What a shed request hears instead of its turn
+SHED_RESPONSES = {
+    "/voice": twiml.CALL_BACK,
+    "/process": twiml.PLEASE_HOLD,
+}
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware: admit each webhook turn at a degradation level, or shed it."""
+
+    def __init__(self, app, controller: AdmissionController, paths=("/voice", "/get-phone", "/process")):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if scope["type"] != "http" or path not in self.paths:
+            return await self.app(scope, receive, send)
+        level = self.controller.admit(path, can_shed=path in SHED_RESPONSES)
+        if level >= SHED:
+            with stage("shed"):
+                await send({"type": "http.response.start", "status": 200, "headers": SHED_HEADERS})
+                await send({"type": "http.response.body", "body": SHED_RESPONSES[path]})
+            return
+        token = _level.set(level)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _level.reset(token)
+            turn = current_turn()
+            self.controller.release(path, time.perf_counter() - t0, turn.stages if turn else ())
@@ -1,19 +1,60 @@
 # app_bfsi.py — BFSI AI Voice Agent (Ready to Deploy)
 
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import Response, JSONResponse
-from twilio.twiml.voice_response import VoiceResponse, Gather
+from fastapi import FastAPI, Request, Form, WebSocket
+from fastapi.responses import Response, JSONResponse, PlainTextResponse
 from datetime import datetime
 from business_logic_bfsi import BFSIBusinessLogic
-import requests, os, logging
+from dashboard_bus import DashboardBus
+from session_store import make_session_store, TERMINAL_CALL_STATUSES
+from metrics import REGISTRY, TurnMetricsMiddleware, stage, stage_ms
+from idempotency import IdempotencyCache, IdempotencyMiddleware
+from admission import AdmissionController, AdmissionMiddleware
+from phone_normalizer import parse_spoken_phone, MIN_CONFIDENCE as PHONE_MIN_CONFIDENCE
+from media_stream import StreamSession, stream_twiml, BRIDGE_URL as STREAM_BRIDGE_URL
+import twiml_templates as twiml
+import asyncio, os, logging
 
 app = FastAPI(title="BFSI Voice Agent (Enhanced)")
+# Innermost: each webhook turn is admitted at a degradation level, or shed (ADMISSION_INFLIGHT, ADMISSION_TURN_MS)
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(TurnMetricsMiddleware)
+# Outermost: Twilio retries of a turn get the first execution's TwiML (IDEMPOTENCY_TTL, IDEMPOTENCY_MAX)
+webhook_replays = IdempotencyCache()
+app.add_middleware(IdempotencyMiddleware, cache=webhook_replays)
 logic = BFSIBusinessLogic()
 
-# In-memory store for call context
-conversations = {}
+# Call context store (SESSION_STORE=memory | sqlite:///path for multi-worker)
+conversations = make_session_store()
 
 DASHBOARD_URL = os.getenv("DASHBOARD_URL", "http://localhost:8080")
+event_bus = DashboardBus(DASHBOARD_URL)
+
+# TwiML rendered once (see twiml_templates.py)
+NEED_PHONE = twiml.static(twiml.ask_phone("Please say your mobile number.",
+                                          preamble="I need your verified number first. Transferring you back."))
+IDENTIFIED = twiml.TwimlTemplate(twiml.identified(
+    "How can I help you today? You can ask about balance, blocking a card, EMI, claim status, or contact update."))
+
+REGISTRY.gauge("bfsi_dashboard_queue_depth", event_bus.depth)
+REGISTRY.gauge("bfsi_sessions", lambda: len(conversations))
+REGISTRY.gauge("bfsi_rephrase_cache_entries", lambda: len(logic.rephraser.cache))
+REGISTRY.gauge("bfsi_prefetched_calls", lambda: len(logic.prefetch))
+REGISTRY.gauge("bfsi_idempotency_entries", lambda: len(webhook_replays))
+REGISTRY.gauge("bfsi_inflight_turns", lambda: admission.inflight)
+REGISTRY.gauge("bfsi_admission_level", lambda: admission.level())
+
+@app.on_event("startup")
+async def startup():
+    await event_bus.start()
+    logic.customers.open()   # claim this worker's action log slot and replay it
+    # Warm the rephrase cache for fixed texts without delaying startup
+    app.state.prewarm = asyncio.create_task(logic.prewarm())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await event_bus.stop()
+    await logic.customers.aclose()
 
 # ----------------------------------------------------------
 # 1️⃣ START CALL FLOW
@@ -21,28 +62,16 @@ DASHBOARD_URL = os.getenv("DASHBOARD_URL", "http://localhost:8080")
 
 @app.post("/voice")
 async def voice(request: Request):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid", "SIM-" + datetime.now().isoformat())
-    conversations[call_sid] = {"phone": None, "history": []}
-
-    vr = VoiceResponse()
-    vr.say("Welcome to your bank's AI voice assistant.", voice="Polly.Joanna", language="en-IN")
-
-    g = Gather(
-        input="speech",
-        action="/get-phone",
-        method="POST",
-        timeout=8,
-        speech_timeout="auto",
-        hints="zero one two three four five six seven eight nine",
-        enhanced=True,
-        language="en-IN"
-    )
-    g.say("Please say your 10 digit mobile number.", voice="Polly.Joanna")
-    vr.append(g)
-    vr.say("I didn't catch that. Please call again. Goodbye!")
-
-    return Response(str(vr), media_type="application/xml")
+    with stage("session"):
+        conversations.set(call_sid, {"phone": None, "history": []})
+
+    with stage("twiml"):
+        body = twiml.VOICE_WELCOME
+
+    return Response(body, media_type="application/xml")
 
 # ----------------------------------------------------------
 # 2️⃣ GET PHONE NUMBER
@@ -50,35 +79,40 @@ async def voice(request: Request):
 
 @app.post("/get-phone")
 async def get_phone(request: Request, SpeechResult: str = Form(None)):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid")
-    said = (SpeechResult or "").lower().replace(" ", "")
-    digits = "".join(ch for ch in said if ch.isdigit())
-    phone = "+91" + digits[-10:] if len(digits) >= 10 else None
+    with stage("session"):
+        partial = (conversations.get(call_sid) or {}).get("phone_partial", "")
+    with stage("normalise_phone"):
+        parsed = parse_spoken_phone(SpeechResult, partial)
+    phone = parsed.phone if parsed.confidence >= PHONE_MIN_CONFIDENCE else None
+    REGISTRY.inc("bfsi_phone_capture_total", result="identified" if phone else "reprompt")
 
-    vr = VoiceResponse()
     if not phone:
-        g = Gather(input="speech", action="/get-phone", method="POST",
-                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-        g.say("Sorry, I couldn't understand. Please say your mobile number clearly.")
-        vr.append(g)
-        return Response(str(vr), media_type="application/xml")
-
-    conversations.setdefault(call_sid, {})["phone"] = phone
-    vr.say(f"Thanks. I have your number as {phone}.", voice="Polly.Joanna", language="en-IN")
+        # Keep a short capture so the caller only has to say the rest
+        partial = parsed.digits if parsed.phone is None else ""
+        with stage("session"):
+            conversations.update(call_sid, phone_partial=partial)
+        with stage("dashboard_push"):
+            event_bus.publish({"role": "system", "text": "🔁 Phone number not caught, asked again",
+                               "call_sid": call_sid, "kind": "phone_reprompt"})
+        with stage("twiml"):
+            body = twiml.PHONE_PARTIAL.render(count=len(partial)) if partial else twiml.PHONE_RETRY
+        return Response(body, media_type="application/xml")
+
+    with stage("session"):
+        conversations.update(call_sid, phone=phone, phone_partial="")
+    # Speculatively render read-only answers while the caller hears the prompt
+    logic.prefetch.start(call_sid, phone)
 
     # Notify dashboard
-    try:
-        requests.post(f"{DASHBOARD_URL}/conversation", json={"role": "system", "text": f"User identified: {phone}"})
-    except Exception as e:
-        print("Dashboard update failed:", e)
-
-    g = Gather(input="speech", action="/process", method="POST",
-               timeout=10, speech_timeout="auto", enhanced=True, language="en-IN")
-    g.say("How can I help you today? You can ask about balance, blocking a card, EMI, claim status, or contact update.")
-    vr.append(g)
-    vr.say("I didn't hear anything. Goodbye!")
-    return Response(str(vr), media_type="application/xml")
+    with stage("dashboard_push"):
+        event_bus.publish({"role": "system", "text": f"User identified: {phone}", "call_sid": call_sid})
+
+    with stage("twiml"):
+        body = IDENTIFIED.render(phone=phone)
+    return Response(body, media_type="application/xml")
 
 # ----------------------------------------------------------
 # 3️⃣ PROCESS QUERY (AI + DASHBOARD)
@@ -86,44 +120,64 @@ async def get_phone(request: Request, SpeechResult: str = Form(None)):
 
 @app.post("/process")
 async def process(request: Request, SpeechResult: str = Form(None)):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid")
     user_text = (SpeechResult or "").strip()
-    phone = conversations.get(call_sid, {}).get("phone")
+    with stage("session"):
+        phone = conversations.phone(call_sid)
 
-    vr = VoiceResponse()
     if not phone:
-        vr.say("I need your verified number first. Transferring you back.", voice="Polly.Joanna")
-        g = Gather(input="speech", action="/get-phone", method="POST",
-                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-        g.say("Please say your mobile number.")
-        vr.append(g)
-        return Response(str(vr), media_type="application/xml")
+        with stage("twiml"):
+            body = NEED_PHONE
+        return Response(body, media_type="application/xml")
 
     # Log + push user message
-    conversations.setdefault(call_sid, {}).setdefault("history", []).append({"user": user_text})
-    try:
-        requests.post(f"{DASHBOARD_URL}/conversation", json={"role": "user", "text": user_text})
-    except Exception as e:
-        print("Dashboard update failed (user):", e)
-
-    # Generate AI response
-    answer = logic.generate_response(phone, user_text)
-
-    # Log + push AI message
-    try:
-        requests.post(f"{DASHBOARD_URL}/conversation", json={"role": "agent", "text": answer})
-    except Exception as e:
-        print("Dashboard update failed (agent):", e)
-
-    vr.say(answer, voice="Polly.Joanna", language="en-IN")
-    g = Gather(input="speech", action="/process", method="POST",
-               timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-    g.say("Anything else?")
-    vr.append(g)
-    vr.say("Thank you for calling. Goodbye!")
-
-    return Response(str(vr), media_type="application/xml")
+    with stage("session"):
+        conversations.append_history(call_sid, {"user": user_text})
+    with stage("dashboard_push"):
+        event_bus.publish({"role": "user", "text": user_text, "call_sid": call_sid})
+
+    # Generate AI response (classify_intent / find_customer / rephrase stages)
+    answer = await logic.generate_response(phone, user_text, call_sid)
+
+    # Log + push AI message (llm_ms: time in the rephrase stage, absent when it didn't run)
+    event = {"role": "agent", "text": answer, "call_sid": call_sid}
+    llm_ms = stage_ms("rephrase")
+    if llm_ms is not None:
+        event["llm_ms"] = llm_ms
+    with stage("dashboard_push"):
+        event_bus.publish(event)
+
+    with stage("twiml"):
+        body = twiml.ANSWER.render(answer=answer)
+
+    return Response(body, media_type="application/xml")
+
+# ----------------------------------------------------------
+# 🎙️ STREAMING MODE (Media Streams instead of Gather turns)
+# ----------------------------------------------------------
+
+@app.post("/voice-stream")
+async def voice_stream(request: Request):
+    with stage("parse_form", since_start=True):
+        form = await request.form()
+    with stage("session"):
+        phone = conversations.phone(form.get("CallSid"))  # carried over if /get-phone already ran
+    with stage("twiml"):
+        if STREAM_BRIDGE_URL:
+            body = stream_twiml(phone=phone)
+        else:
+            # No speech bridge configured: carry on with <Gather> turns
+            body = IDENTIFIED.render(phone=phone) if phone else twiml.VOICE_WELCOME
+    return Response(body, media_type="application/xml")
+
+@app.websocket("/media-stream")
+async def media_stream(websocket: WebSocket):
+    if not STREAM_BRIDGE_URL:
+        await websocket.close(code=1008)
+        return
+    await StreamSession(websocket, logic, conversations, lambda role, text, call_sid: event_bus.publish({"role": role, "text": text, "call_sid": call_sid})).run()
 
 # ----------------------------------------------------------
 # 4️⃣ STATUS + HEALTH
@@ -131,19 +185,30 @@ async def process(request: Request, SpeechResult: str = Form(None)):
 
 @app.post("/call-status")
 async def call_status(request: Request):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_status = form.get("CallStatus")
-    try:
-        requests.post(f"{DASHBOARD_URL}/conversation",
-                      json={"role": "system", "text": f"📞 Call status: {call_status}"})
-    except Exception as e:
-        print("Dashboard update failed:", e)
+    with stage("dashboard_push"):
+        event_bus.publish({"role": "system", "text": f"📞 Call status: {call_status}", "call_sid": form.get("CallSid"),
+                           "kind": "call_status", "status": call_status})
+    if call_status in TERMINAL_CALL_STATUSES:
+        with stage("session"):
+            conversations.delete(form.get("CallSid"))
+            logic.prefetch.drop(form.get("CallSid"))
     return JSONResponse({"ok": True, "status": call_status})
 
 @app.get("/")
 async def home():
-    return {"status": "running", "endpoints": ["/voice", "/get-phone", "/process", "/call-status", "/health"]}
+    return {"status": "running", "endpoints": ["/voice", "/get-phone", "/process", "/call-status", "/voice-stream", "/media-stream", "/health", "/metrics"]}
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "dashboard": {**event_bus.stats, "queue_depth": event_bus.depth()},
+            "sessions": conversations.stats(), "idempotency": webhook_replays.stats,
+            "admission": admission.snapshot(),
+            "rephrase": {**logic.rephraser.stats, "cache": logic.rephraser.cache.stats,
+                         "breaker_open": logic.rephraser.breaker_open}}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,112 @@
+# bench_actions.py — state-changing actions: synchronous store writes vs the action log
+#
+#   python bench_actions.py --customers 5000 --concurrency 1 8 64 256
+#
+# Runs contact updates from N concurrent "turns" against a synthetic SQLite
+# customer store, each turn waiting until its change is confirmed:
+#   sqlite-sync   the old path, update_contact() saving the document in the turn
+#   log-per-op    action log with one write+fsync per record
+#   group-commit  action log, one fsync per batch of concurrent appends
+# Reports confirmed mutations/s, confirmation latency percentiles and fsyncs,
+# then how long a restart takes to replay the whole log into a fresh store.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from action_journal import ActionJournal, JournaledCustomerRepository
+from customer_store import InMemoryCustomerRepository, SQLiteCustomerRepository
+from gen_customers import synth_customers
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def run(repo, phones, concurrency: int, per_worker: int) -> list:
+    latencies = []
+
+    async def worker(w):
+        for i in range(per_worker):
+            phone = phones[(w * per_worker + i) % len(phones)]
+            t0 = time.perf_counter()
+            repo.update_contact(phone, email=f"user{w}.{i}@example.com")
+            await repo.committed()
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(0)   # the rest of the turn
+
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return latencies
+
+
+async def variant(name: str, db: str, log: str, phones, concurrency: int, per_worker: int) -> dict:
+    inner = SQLiteCustomerRepository(db)
+    repo = inner if name == "sqlite-sync" else JournaledCustomerRepository(
+        inner, ActionJournal(log, group_commit=name == "group-commit"))
+    t0 = time.perf_counter()
+    latencies = await run(repo, phones, concurrency, per_worker)
+    elapsed = time.perf_counter() - t0
+    await repo.aclose()
+    out = {"mutations_per_s": round(len(latencies) / elapsed), "p50_ms": round(pct(latencies, 0.5), 2),
+           "p99_ms": round(pct(latencies, 0.99), 2)}
+    if name != "sqlite-sync":
+        out["fsyncs"] = repo.journal.stats["commits"]
+        out["max_batch"] = repo.journal.stats["max_batch"]
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--customers", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 256])
+    ap.add_argument("--mutations", type=int, default=2048, help="per concurrency level and variant")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    seed = os.path.join(tmp, "seed.db")
+    customers = dict(synth_customers(args.customers))
+    store = SQLiteCustomerRepository(seed)
+    store.bulk_load(customers.items())
+    store._db().execute("PRAGMA wal_checkpoint(TRUNCATE)")   # the copies below take the main file only
+    phones = list(customers)
+    result = {"customers": args.customers, "levels": {}}
+    try:
+        for c in args.concurrency:
+            per_worker = max(1, args.mutations // c)
+            level = result["levels"][c] = {}
+            for name in ("sqlite-sync", "log-per-op", "group-commit"):
+                db, log = os.path.join(tmp, f"{name}-{c}.db"), os.path.join(tmp, f"{name}-{c}.log")
+                shutil.copy(seed, db)
+                level[name] = asyncio.run(variant(name, db, log, phones, c, per_worker))
+
+        # Restart: the in-memory store starts from scratch and replays every record
+        log = os.path.join(tmp, f"group-commit-{args.concurrency[-1]}.log")
+        records = sum(1 for _ in ActionJournal(log).replay())
+        t0 = time.perf_counter()
+        JournaledCustomerRepository(InMemoryCustomerRepository(customers), ActionJournal(log)).open()
+        elapsed = time.perf_counter() - t0
+        result["replay"] = {"records": records, "seconds": round(elapsed, 3), "records_per_s": round(records / elapsed)}
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{args.mutations} contact updates per level, {args.customers:,} customers (SQLite)")
+    for c, level in result["levels"].items():
+        for name, r in level.items():
+            extra = f"  fsyncs {r['fsyncs']:5d}  max batch {r['max_batch']}" if "fsyncs" in r else ""
+            print(f"  c={c:<4} {name:<13} {r['mutations_per_s']:8,d}/s  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p99 {r['p99_ms']:7.2f} ms{extra}")
+    r = result["replay"]
+    print(f"  replay {r['records']:,} records on startup: {r['seconds'] * 1000:.0f} ms ({r['records_per_s']:,}/s)")
+
+
+if __name__ == "__main__":
+    main()
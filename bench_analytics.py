@@ -0,0 +1,194 @@
+# bench_analytics.py — call_analytics.py over a synthetic journal of tens of millions of turns
+#
+#   python bench_analytics.py --turns 20000000 --days 30
+#
+# Writes a journal in the app's segment layout (calls interleaved within each
+# day/shard, system/user/agent events as main.py journals them, including
+# re-prompts, llm_ms and call-status events), then runs the pipeline on the
+# first day and on all of them, for each worker count. Each run is in a fresh
+# process so peak RSS is its own. For comparison, the first day is also
+# analysed the chat_log way: every event loaded into one list, classify() per turn.
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import call_analytics
+from intent_matcher import MATCHER
+from loadtest import UTTERANCES
+
+OUTCOMES = (("completed", 0.86), ("no-answer", 0.06), ("busy", 0.04), ("failed", 0.02), ("canceled", 0.02))
+
+
+PREFIXES = ("", "", "", "hi ", "hello ", "um ", "okay ", "please ", "can you tell me ", "I want to know ")
+SUFFIXES = ("", "", "", " please", " thanks", " now", " today", " for my savings account", " urgently", " ji")
+
+
+def texts():
+    """JSON-quoted utterances: the load-test and noisy sets with filler words, ~14k distinct."""
+    base = list(UTTERANCES)
+    with open("data/intent_noisy.jsonl", encoding="utf-8") as f:
+        base += [json.loads(line)["text"] for line in f if line.strip()]
+    pool = [p + b + s for p in PREFIXES for b in base for s in SUFFIXES] + ["(no speech)"] * 20
+    return [json.dumps(t, ensure_ascii=False) for t in pool]
+
+
+def generate(root: str, turns: int, days: int, shards: int, seed: int) -> dict:
+    """Write ~`turns` user turns over `days` days; returns what was written."""
+    rng = random.Random(seed)
+    pool = texts()
+    start = int(time.time() // 86400 - days) * 86400
+    files, seq, written = {}, 0, Counter()
+    outcomes, weights = zip(*OUTCOMES)
+
+    def out(day: int, sid: str):
+        key = (day, zlib.crc32(sid.encode()) % shards)
+        fh = files.get(key)
+        if fh is None:
+            d = os.path.join(root, time.strftime("%Y-%m-%d", time.gmtime(start + day * 86400)), f"{key[1]:02d}")
+            os.makedirs(d, exist_ok=True)
+            fh = files[key] = open(os.path.join(d, "0000000000000-1-0.log"), "w", encoding="utf-8", buffering=1 << 20)
+        return fh
+
+    calls_per_day = max(1, round(turns / days / (OUTCOMES[0][1] * 4)))   # 4 turns per answered call
+    for day in range(days):
+        t_day = start + day * 86400
+        n = 0
+        while n < calls_per_day:
+            # 64 calls in flight; their events interleave in the segment files
+            batch = []
+            for _ in range(min(64, calls_per_day - n)):
+                sid = f"CA{rng.getrandbits(128):032x}"
+                outcome = rng.choices(outcomes, weights)[0]
+                events = []
+                if outcome == "completed":
+                    if rng.random() < 0.15:
+                        events += ['"role": "system", "text": "🔁 Phone number not caught, asked again", '
+                                   '"kind": "phone_reprompt"'] * rng.randint(1, 3)
+                    events.append('"role": "system", "text": "User identified: +919876543210"')
+                    for _ in range(rng.randint(1, 7)):
+                        events.append(f'"role": "user", "text": {rng.choice(pool)}')
+                        llm = f', "llm_ms": {rng.lognormvariate(5.8, 0.5):.1f}' if rng.random() < 0.4 else ""
+                        events.append(f'"role": "agent", "text": "Your balance is 45,000 rupees."{llm}')
+                events.append(f'"role": "system", "text": "📞 Call status: {outcome}", "kind": "call_status", '
+                              f'"status": "{outcome}"')
+                batch.append([sid, events, t_day + rng.random() * 86000])
+                written["calls"] += 1
+                written["events"] += len(events)
+                written["user_turns"] += sum(e.startswith('"role": "user"') for e in events)
+                written["outcome:" + outcome] += 1
+            n += len(batch)
+            while batch:
+                i = rng.randrange(len(batch))
+                sid, events, ts = batch[i]
+                seq += 1
+                out(day, sid).write(f'{{{events.pop(0)}, "call_sid": "{sid}", "seq": {seq}, "ts": {ts:.3f}}}\n')
+                batch[i][2] += 2.5
+                if not events:
+                    batch[i] = batch[-1]
+                    batch.pop()
+    for fh in files.values():
+        fh.close()
+    return dict(written)
+
+
+def _measured(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return result, elapsed, rss / 1024
+
+
+def measured(fn, *args):
+    """Run fn(*args) in a fresh process: (result, seconds, peak RSS MB of it and its workers)."""
+    with ProcessPoolExecutor(1) as ex:
+        return ex.submit(_measured, fn, *args).result()
+
+
+def pipeline(root: str, first_day: str, last_day: str, workers: int) -> dict:
+    units = call_analytics.work_units([root], first_day, last_day)
+    report = call_analytics.analyse(units, workers).report()
+    return {k: report[k] for k in ("events", "user_turns", "calls", "intents", "outcomes")}
+
+
+def in_memory(root: str, first_day: str, last_day: str) -> dict:
+    # The chat_log way: the whole history as a list of dicts, one classify() per turn
+    MATCHER.load_model()
+    events = [json.loads(line) for unit in call_analytics.work_units([root], first_day, last_day)
+              for line in call_analytics.read_lines(unit)]
+    intents, outcomes = Counter(), Counter()
+    for e in events:
+        if e["role"] == "user":
+            intents["no_speech" if e["text"] == "(no speech)" else MATCHER.classify(e["text"])] += 1
+        elif e.get("kind") == "call_status":
+            outcomes[e["status"]] += 1
+    return {"events": len(events), "intents": dict(intents), "outcomes": dict(outcomes)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=20_000_000, help="user turns in the whole journal")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--shards", type=int, default=16)
+    ap.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    ap.add_argument("--root", help="journal directory (default: a temp dir, removed afterwards)")
+    ap.add_argument("--no-baseline", action="store_true", help="skip the load-everything comparison")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix="analytics-")
+    try:
+        t0 = time.perf_counter()
+        written = generate(root, args.turns, args.days, args.shards, args.seed)
+        result = {"written": written, "generate_s": round(time.perf_counter() - t0, 1),
+                  "bytes": sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(root) for f in fs),
+                  "runs": []}
+        days = sorted(os.listdir(root))
+        ranges = [(days[0], days[0]), (days[0], days[-1])]
+        for first, last in ranges:
+            for workers in args.workers:
+                r, seconds, rss = measured(pipeline, root, first, last, workers)
+                result["runs"].append({"method": "pipeline", "workers": workers, "days": f"{first}..{last}",
+                                       "events": r["events"], "user_turns": r["user_turns"], "seconds": round(seconds, 1),
+                                       "events_per_s": round(r["events"] / seconds), "peak_rss_mb": round(rss)})
+                if (first, last) == ranges[-1] and workers == args.workers[0]:
+                    expected = {o: written.get("outcome:" + o, 0) for o, _ in OUTCOMES}
+                    result["check"] = {"user_turns": r["user_turns"] == written["user_turns"],
+                                       "outcomes": all(r["outcomes"][o] == n for o, n in expected.items())}
+            if not args.no_baseline and (first, last) == ranges[0]:
+                b, seconds, rss = measured(in_memory, root, first, last)
+                result["runs"].append({"method": "in-memory list", "workers": 1, "days": f"{first}..{last}",
+                                       "events": b["events"], "user_turns": sum(b["intents"].values()),
+                                       "seconds": round(seconds, 1), "events_per_s": round(b["events"] / seconds),
+                                       "peak_rss_mb": round(rss)})
+                result["check_small_vs_in_memory"] = b["intents"] == {k: v for k, v in r["intents"].items() if v}
+    finally:
+        if not args.root:
+            shutil.rmtree(root)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    w = result["written"]
+    print(f"journal: {w['user_turns']:,} user turns, {w['events']:,} events, {w['calls']:,} calls, "
+          f"{result['bytes'] / 1e9:.2f} GB (generated in {result['generate_s']} s)")
+    for r in result["runs"]:
+        print(f"  {r['method']:<15} workers={r['workers']:<3} {r['days']}  {r['user_turns']:>11,} turns "
+              f"{r['events']:>11,} events  {r['seconds']:7.1f} s  {r['events_per_s']:>9,} events/s  "
+              f"peak RSS {r['peak_rss_mb']:,} MB")
+    print(f"  counts match what was written: {result['check']}; "
+          f"pipeline == in-memory intents: {result.get('check_small_vs_in_memory')}")
+
+
+if __name__ == "__main__":
+    main()
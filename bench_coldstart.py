@@ -0,0 +1,149 @@
+# bench_coldstart.py — scale-to-zero cold start and per-request TwiML cost
+#
+#   python bench_coldstart.py --app main --runs 7
+#   python bench_coldstart.py --app app_bfsi --skip-twiml --json
+#
+# Cold start: each run spawns a fresh interpreter that imports the app, runs
+# the startup hooks and serves one /voice webhook in-process; time to first
+# byte is measured from the spawn. The "eager" variant imports what the app
+# used to load at import time or startup (openai + an AsyncOpenAI client,
+# Jinja templates, twilio.rest/requests, the dashboard bus's httpx client)
+# before the app, as the old code did.
+# Per-request: the old VoiceResponse/Gather + str() construction of each
+# reply against the prebuilt bytes/templates in twiml_templates.py.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+CHILD = r"""
+import asyncio, json, resource, sys, time
+t0 = time.perf_counter()
+if sys.argv[2] == "eager":
+    from openai import AsyncOpenAI
+    AsyncOpenAI(api_key="sk-bench")
+    from fastapi.templating import Jinja2Templates
+    Jinja2Templates(directory="templates")
+    import twilio.rest, requests, httpx
+    httpx.AsyncClient()   # the dashboard bus client, built at startup
+import importlib
+module = importlib.import_module(sys.argv[1])
+t_import = time.perf_counter()
+import httpx
+
+async def first_call():
+    app = module.app
+    async with app.router.lifespan_context(app):
+        t_start = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            r = await c.post("/voice", data={"CallSid": "CA-cold", "From": "+919876543210"})
+            r.raise_for_status()
+        return t_start, time.time()
+
+t_start, first_byte = asyncio.run(first_call())
+print(json.dumps({"import_ms": (t_import - t0) * 1000, "startup_ms": (t_start - t_import) * 1000,
+                  "first_byte_at": first_byte,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def cold_start(app: str, mode: str, runs: int) -> dict:
+    env = dict(os.environ, OPENAI_API_KEY="sk-bench", CONVERSATION_JOURNAL="", OPENAI_BASE_URL="http://127.0.0.1:9",
+               DASHBOARD_URL="http://127.0.0.1:9", DIALER_DB=os.path.join(tempfile.mkdtemp(), "campaigns.db"))
+    env.pop("OPENAI_STUB", None)
+    rows = []
+    for _ in range(runs):
+        spawned = time.time()
+        out = subprocess.run([sys.executable, "-c", CHILD, app, mode], env=env, capture_output=True, text=True,
+                             check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        r["ttfb_ms"] = (r.pop("first_byte_at") - spawned) * 1000
+        rows.append(r)
+    return {k: round(statistics.median(r[k] for r in rows), 1) for k in rows[0]}
+
+
+# --- Per-request TwiML: the old builders, kept as the baseline ---
+
+def legacy_docs():
+    from twilio.twiml.voice_response import Gather, VoiceResponse
+
+    def voice():
+        vr = VoiceResponse()
+        vr.say("Welcome to your bank's AI voice assistant.", voice="Polly.Joanna", language="en-IN")
+        g = Gather(input="speech", action="/get-phone", method="POST", timeout=8, speech_timeout="auto",
+                   hints="zero one two three four five six seven eight nine", enhanced=True, language="en-IN")
+        g.say("Please say your 10 digit mobile number.", voice="Polly.Joanna")
+        vr.append(g)
+        vr.say("I didn't catch that. Please call again. Goodbye!")
+        return str(vr)
+
+    def need_phone():
+        vr = VoiceResponse()
+        vr.say("I need your verified number first.", voice="Polly.Joanna")
+        g = Gather(input="speech", action="/get-phone", method="POST",
+                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
+        g.say("Please say your mobile number.")
+        vr.append(g)
+        return str(vr)
+
+    def answer():
+        vr = VoiceResponse()
+        vr.say("Your savings account ending in 4567 has a balance of ₹125430.", voice="Polly.Joanna", language="en-IN")
+        g = Gather(input="speech", action="/process", method="POST",
+                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
+        g.say("Anything else?")
+        vr.append(g)
+        vr.say("Thank you for calling. Goodbye!")
+        return str(vr)
+
+    return {"voice": voice, "need_phone": need_phone, "answer": answer}
+
+
+def prebuilt_docs():
+    import twiml_templates as twiml
+    need_phone = twiml.static(twiml.ask_phone("Please say your mobile number.", preamble="I need your verified number first."))
+    return {"voice": lambda: twiml.VOICE_WELCOME, "need_phone": lambda: need_phone,
+            "answer": lambda: twiml.ANSWER.render(answer="Your savings account ending in 4567 has a balance of ₹125430.")}
+
+
+def twiml_cost(number: int) -> dict:
+    legacy, prebuilt = legacy_docs(), prebuilt_docs()
+    out = {}
+    for name in legacy:
+        old = min(timeit.repeat(legacy[name], number=number, repeat=3)) / number * 1e6
+        new = min(timeit.repeat(prebuilt[name], number=number, repeat=3)) / number * 1e6
+        out[name] = {"legacy_us": round(old, 2), "prebuilt_us": round(new, 3), "speedup": round(old / new)}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--app", default="main", help="module exposing the FastAPI `app` (main or app_bfsi)")
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters per variant (median reported)")
+    ap.add_argument("--number", type=int, default=20000, help="renders per TwiML timing")
+    ap.add_argument("--skip-twiml", action="store_true")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    result = {"app": args.app, "cold_start": {mode: cold_start(args.app, mode, args.runs) for mode in ("eager", "lazy")}}
+    if not args.skip_twiml:
+        result["twiml_per_request"] = twiml_cost(args.number)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{args.app}: cold start, median of {args.runs} fresh processes")
+    for mode, r in result["cold_start"].items():
+        print(f"  {mode:<6} import {r['import_ms']:7.1f} ms  startup {r['startup_ms']:6.1f} ms  "
+              f"first /voice byte {r['ttfb_ms']:7.1f} ms after spawn  rss {r['rss_mb']:.0f} MB")
+    for name, r in result.get("twiml_per_request", {}).items():
+        print(f"  twiml {name:<11} {r['legacy_us']:8.2f} µs -> {r['prebuilt_us']:6.3f} µs  ({r['speedup']}x)")
+
+
+if __name__ == "__main__":
+    main()
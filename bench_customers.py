@@ -0,0 +1,63 @@
+# bench_customers.py — lookup latency of the customer repository
+#
+#   python gen_customers.py --count 1000000 --db customers.db
+#   python bench_customers.py --db customers.db [--lookups 100000] [--json]
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from customer_store import SQLiteCustomerRepository
+from gen_customers import phone_for
+
+
+def timed(fn, args_list):
+    samples = []
+    for a in args_list:
+        t0 = time.perf_counter()
+        fn(a)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return {
+        "n": len(samples),
+        "p50_us": round(samples[len(samples) // 2], 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)], 2),
+        "mean_us": round(statistics.fmean(samples), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default="customers.db")
+    ap.add_argument("--lookups", type=int, default=100_000)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    repo = SQLiteCustomerRepository(args.db)
+    size = len(repo)
+    rng = random.Random(7)
+    phones = [phone_for(rng.randrange(size)) for _ in range(args.lookups)]
+    hot = phones[:100] * (args.lookups // 100)  # same caller asked about repeatedly within a call
+
+    results = {
+        "customers": size,
+        "get_cold": timed(repo.get, phones),
+        "get_cached": timed(repo.get, hot),
+        "by_card_last4": timed(repo.find_by_card_last4, [f"{rng.randrange(10000):04d}" for _ in range(1000)]),
+        "by_policy_no": timed(repo.find_by_policy_no, [f"POL-{rng.randrange(size):08d}" for _ in range(args.lookups)]),
+        "by_loan_type": timed(repo.find_by_loan_type, ["home", "car", "personal"] * 300),
+        "cache": repo.cache.stats,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Customers: {size:,}")
+    for k, v in results.items():
+        if isinstance(v, dict) and "p50_us" in v:
+            print(f"  {k:<14} p50 {v['p50_us']:>8.1f} µs  p99 {v['p99_us']:>8.1f} µs  ({v['n']:,} lookups)")
+
+
+if __name__ == "__main__":
+    main()
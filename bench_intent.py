@@ -0,0 +1,135 @@
+# bench_intent.py — throughput and accuracy of the intent matcher vs the original keyword chain
+#
+#   python bench_intent.py [--corpus data/intent_corpus.jsonl] [--repeat 2000] [--json]
+#
+# Also runs the keyword tier alone and with the n-gram model tier (intent_model.py)
+# on --noisy, held-out misspelt / Hinglish / small-talk utterances: accuracy by
+# kind, share of turns ending in the fallback sentence, and model cost per
+# utterance, one at a time (as on a turn) and batched.
+
+import argparse
+import json
+import time
+import timeit
+
+from intent_matcher import IntentMatcher
+
+
+def legacy_classify(text: str) -> str:
+    """The original BFSIBusinessLogic.classify_intent, kept as the baseline."""
+    t = (text or "").lower()
+    t = t.replace("cards", "card").replace("blocked", "block").replace("blocking", "block")
+    if any(k in t for k in ["balance", "account", "statement", "money", "funds"]):
+        return "balance_inquiry"
+    if any(k in t for k in ["lost card", "stolen card", "block my card", "block card", "block the card", "hotlist", "deactivate card"]):
+        return "card_block"
+    if any(k in t for k in ["emi", "loan", "due", "installment", "repayment"]):
+        return "emi_info"
+    if any(k in t for k in ["claim", "insurance", "policy", "coverage"]):
+        return "claim_status"
+    if any(k in t for k in ["update phone", "change number", "update mobile", "update email", "change email", "update address"]):
+        return "update_contact"
+    if any(k in t for k in ["agent", "human", "representative", "talk to person"]):
+        return "escalation"
+    return "fallback"
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(name, classify_batch, texts, labels, repeat):
+    predicted = classify_batch(texts)
+    correct = sum(p == l for p, l in zip(predicted, labels))
+    data = texts * repeat
+    t0 = time.perf_counter()
+    classify_batch(data)
+    elapsed = time.perf_counter() - t0
+    return {
+        "name": name,
+        "accuracy": round(correct / len(labels), 4),
+        "utterances_per_sec": round(len(data) / elapsed),
+        "us_per_utterance": round(elapsed / len(data) * 1e6, 3),
+        "errors": [{"text": t, "expected": l, "got": p} for t, l, p in zip(texts, labels, predicted) if p != l],
+    }
+
+
+def noisy_eval(path: str, model_path: str, repeat: int) -> dict:
+    rows = load_corpus(path)
+    texts, labels = [r["text"] for r in rows], [r["intent"] for r in rows]
+    keyword_only, tiered = IntentMatcher(), IntentMatcher()
+    if tiered.load_model(model_path) is None:
+        raise SystemExit(f"no intent model at {model_path} (python intent_model.py train data/intent_train.jsonl)")
+    out = {"corpus": path, "size": len(rows), "tiers": {}}
+    for name, matcher in (("keyword", keyword_only), ("keyword+model", tiered)):
+        predicted = matcher.classify_batch(texts)
+        kinds = {}
+        for r, p in zip(rows, predicted):
+            k = kinds.setdefault(r["kind"], [0, 0])
+            k[0] += p == r["intent"]
+            k[1] += 1
+        should_answer = [p for p, l in zip(predicted, labels) if l != "fallback"]
+        out["tiers"][name] = {
+            "accuracy": round(sum(p == l for p, l in zip(predicted, labels)) / len(labels), 4),
+            "by_kind": {k: round(c / n, 4) for k, (c, n) in kinds.items()},
+            "fallback_turns": sum(p == "fallback" for p in should_answer),
+            "wrong_intent": sum(p != l and p != "fallback" for p, l in zip(predicted, labels)),
+            "errors": [{"text": t, "expected": l, "got": p} for t, l, p in zip(texts, labels, predicted) if p != l],
+        }
+    misses = [t for t in texts if keyword_only.classify_keywords(t) == "fallback"]
+    model = tiered.model
+    single = min(timeit.repeat(lambda: [model.predict(t) for t in misses], number=repeat // 10 or 1, repeat=3))
+    batch = min(timeit.repeat(lambda: model.predict_batch(misses * 64), number=max(1, repeat // 200), repeat=3))
+    out["model_us_per_utterance"] = {"single": round(single / (repeat // 10 or 1) / len(misses) * 1e6, 1),
+                                     "batch": round(batch / max(1, repeat // 200) / (len(misses) * 64) * 1e6, 2)}
+    base, new = out["tiers"]["keyword"]["fallback_turns"], out["tiers"]["keyword+model"]["fallback_turns"]
+    out["fallback_turns_reduction"] = round(1 - new / base, 4) if base else 0.0
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default="data/intent_corpus.jsonl")
+    ap.add_argument("--repeat", type=int, default=2000)
+    ap.add_argument("--noisy", default="data/intent_noisy.jsonl", help="held-out misspelt/Hinglish set ('' skips)")
+    ap.add_argument("--model", default="data/intent_model.npz")
+    ap.add_argument("--json", action="store_true", help="machine-readable output")
+    args = ap.parse_args()
+
+    rows = load_corpus(args.corpus)
+    texts, labels = [r["text"] for r in rows], [r["intent"] for r in rows]
+    matcher = IntentMatcher()
+    results = [
+        run("legacy", lambda ts: [legacy_classify(t) for t in ts], texts, labels, args.repeat),
+        run("compiled", matcher.classify_batch, texts, labels, args.repeat),
+    ]
+
+    noisy = noisy_eval(args.noisy, args.model, args.repeat) if args.noisy else None
+
+    if args.json:
+        print(json.dumps({"corpus": args.corpus, "size": len(rows), "results": results, "noisy": noisy}, indent=2))
+        return
+    print(f"Corpus: {args.corpus} ({len(rows)} utterances x {args.repeat})")
+    for r in results:
+        print(f"  {r['name']:<9} accuracy {r['accuracy']:.1%}  {r['utterances_per_sec']:>10,}/s  "
+              f"{r['us_per_utterance']:.2f} µs/utt  ({len(r['errors'])} wrong)")
+    for r in results:
+        for e in r["errors"]:
+            print(f"  [{r['name']}] {e['text']!r}: expected {e['expected']}, got {e['got']}")
+
+    if noisy:
+        print(f"Noisy set: {noisy['corpus']} ({noisy['size']} utterances, held out from training)")
+        for name, r in noisy["tiers"].items():
+            kinds = "  ".join(f"{k} {v:.0%}" for k, v in r["by_kind"].items())
+            print(f"  {name:<14} accuracy {r['accuracy']:.1%}  ({kinds})  fallback turns {r['fallback_turns']}  "
+                  f"wrong intent {r['wrong_intent']}")
+        us = noisy["model_us_per_utterance"]
+        print(f"  fallback turns -{noisy['fallback_turns_reduction']:.0%}; model tier {us['single']} µs/utterance "
+              f"on a turn, {us['batch']} µs batched")
+        for e in noisy["tiers"]["keyword+model"]["errors"]:
+            print(f"  [keyword+model] {e['text']!r}: expected {e['expected']}, got {e['got']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# bench_journal.py — conversation journal vs the old in-memory global list
+#
+#   python bench_journal.py --events 1000000 --days 7
+#
+# Writes synthetic turns (about 20 events per call, spread over --days) through
+# ConversationFeed with a journal attached, then measures per-call replay
+# before and after compaction against a linear scan of one global list (the
+# old chat_log), and a full-history scan in constant memory.
+
+import argparse
+import json
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from conversation_feed import ConversationFeed
+from conversation_journal import ConversationJournal, day_of
+
+TEXTS = ["what's my balance", "Your savings account ending in 4567 has a balance of ₹125430.",
+         "block my card", "I've blocked your card ending in 8912 immediately.", "📞 Call status: completed"]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn, repeat: int = 1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - t0) / repeat, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=500000)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--events-per-call", type=int, default=20)
+    ap.add_argument("--window", type=int, default=5000)
+    ap.add_argument("--lookups", type=int, default=200)
+    ap.add_argument("--root", help="journal directory (default: a temp dir, removed afterwards)")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix="journal-")
+    journal = ConversationJournal(root, compact_grace=0)
+    try:
+        result = measure(args, journal, random.Random(args.seed))
+    finally:
+        journal.close()
+        if not args.root:
+            shutil.rmtree(root)
+    print(json.dumps(result, indent=2))
+
+
+def measure(args, journal, rng) -> dict:
+    feed = ConversationFeed(window=args.window, journal=journal)
+    legacy = []
+    start = time.time() - args.days * 86400
+    step = args.days * 86400 / args.events
+
+    # Calls interleave ~50 at a time, like concurrent callers
+    active, sids, written = [], [], {}
+    t0 = time.perf_counter()
+    for i in range(args.events):
+        if len(active) < 50 or rng.random() < 0.05:
+            sid = f"CA{len(sids):032x}"
+            sids.append(sid)
+            active.append([sid, args.events_per_call])
+        k = rng.randrange(len(active))
+        sid = active[k][0]
+        active[k][1] -= 1
+        if active[k][1] == 0:
+            active.pop(k)
+        feed.append({"role": "user", "text": rng.choice(TEXTS), "call_sid": sid, "ts": start + i * step})
+        written[sid] = written.get(sid, 0) + 1
+    append_s = time.perf_counter() - t0
+    journal.roll()
+
+    # The old chat_log: every event of every call in one list (built only for comparison)
+    for i in range(args.events):
+        legacy.append({"role": "user", "text": TEXTS[0], "call_sid": sids[i * len(sids) // args.events], "seq": i})
+    # Calls that got at least one event (a call can be opened and never picked)
+    sample = rng.sample(list(written), min(args.lookups, len(written)))
+    legacy_s, _ = timed(lambda: [[e for e in legacy if e["call_sid"] == sid] for sid in sample[:20]])
+    legacy_ms = legacy_s / min(20, len(sample)) * 1000
+    del legacy
+
+    raw_s, raw_n = timed(lambda: sum(len(list(journal.replay(sid))) for sid in sample))
+    t0 = time.perf_counter()
+    merged = journal.compact_past(day_of(time.time() + 86400))
+    compact_s = time.perf_counter() - t0
+    journal._indexes.clear()
+    cold_s, cold_n = timed(lambda: sum(len(list(journal.replay(sid))) for sid in sample))
+    warm_s, _ = timed(lambda: sum(len(list(journal.replay(sid))) for sid in sample))
+    page_s, _ = timed(lambda: [journal.page(sid, 0, 10) for sid in sample])
+
+    rss_before_scan = peak_rss_mb()
+    t0 = time.perf_counter()
+    scanned = sum(1 for _ in journal.scan())
+    scan_s = time.perf_counter() - t0
+
+    result = {
+        "events": args.events, "calls": len(sids), "days": len(journal.days()),
+        "append_us_per_event": round(append_s / args.events * 1e6, 2),
+        "feed_window_events": len(feed.events),
+        "replay_ms_per_call": {
+            "legacy_list_scan": round(legacy_ms, 3),
+            "journal_raw_segments": round(raw_s / len(sample) * 1000, 3),
+            "journal_compacted_cold": round(cold_s / len(sample) * 1000, 3),
+            "journal_compacted_warm": round(warm_s / len(sample) * 1000, 3),
+            "journal_page_10": round(page_s / len(sample) * 1000, 3),
+        },
+        "replayed_events_ok": raw_n == cold_n == sum(written[sid] for sid in sample),
+        "compaction": {"segments_merged": merged, "seconds": round(compact_s, 2)},
+        "scan": {"events": scanned, "events_per_s": round(scanned / scan_s), "peak_rss_growth_mb":
+                 round(peak_rss_mb() - rss_before_scan, 1)},
+    }
+    return result
+
+
+if __name__ == "__main__":
+    main()
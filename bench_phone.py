@@ -0,0 +1,96 @@
+# bench_phone.py — /get-phone re-prompts: digit-only capture vs the spoken-number normaliser
+#
+#   python bench_phone.py [--corpus data/asr_phone_corpus.jsonl] [--max-attempts 3] [--json]
+#
+# Each corpus line is one caller: the ASR transcripts of their successive
+# attempts and the number they meant. A caller who is re-prompted after their
+# scripted attempts repeats the whole number the same way, up to --max-attempts.
+
+import argparse
+import json
+import time
+from collections import Counter
+
+from phone_normalizer import MIN_CONFIDENCE, parse_spoken_phone
+
+
+def legacy_parse(text, partial=""):
+    """The original get_phone logic: keep digit characters only."""
+    digits = "".join(ch for ch in (text or "").lower().replace(" ", "") if ch.isdigit())
+    return ("+91" + digits[-10:] if len(digits) >= 10 else None), ""
+
+
+def normaliser_parse(text, partial=""):
+    p = parse_spoken_phone(text, partial)
+    if p.phone and p.confidence >= MIN_CONFIDENCE:
+        return p.phone, ""
+    return None, p.digits if p.phone is None else ""
+
+
+def simulate(parse, calls, max_attempts):
+    identified = correct = reprompts = reprompts_identified = 0
+    by_style = Counter()
+    for call in calls:
+        script = list(call["attempts"])
+        full_repeat = " ".join(script)
+        partial = ""
+        phone = None
+        n = 0
+        for n in range(1, max_attempts + 1):
+            text = script[n - 1] if n <= len(script) else full_repeat
+            phone, partial = parse(text, partial)
+            if phone:
+                break
+        call_reprompts = n - 1 if phone else n
+        reprompts += call_reprompts
+        if phone:
+            identified += 1
+            reprompts_identified += call_reprompts
+            correct += phone == call["expected"]
+            by_style[call.get("style", "")] += phone == call["expected"]
+    return {
+        "identified_rate": round(identified / len(calls), 4),
+        "correct_rate": round(correct / len(calls), 4),
+        "reprompts_per_identified_caller": round(reprompts_identified / identified, 3) if identified else None,
+        "reprompts_total": reprompts,
+        "correct_by_style": dict(by_style),
+    }
+
+
+def throughput(parse, texts, repeat):
+    data = texts * repeat
+    t0 = time.perf_counter()
+    for t in data:
+        parse(t)
+    return round((time.perf_counter() - t0) / len(data) * 1e6, 3)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default="data/asr_phone_corpus.jsonl")
+    ap.add_argument("--max-attempts", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=500)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        calls = [json.loads(line) for line in f if line.strip()]
+    texts = [t for c in calls for t in c["attempts"]]
+
+    results = {}
+    for name, parse in (("legacy", legacy_parse), ("normaliser", normaliser_parse)):
+        results[name] = simulate(parse, calls, args.max_attempts)
+        results[name]["us_per_parse"] = throughput(parse, texts, args.repeat)
+
+    if args.json:
+        print(json.dumps({"corpus": args.corpus, "callers": len(calls), "results": results}, indent=2))
+        return
+    print(f"Corpus: {args.corpus} ({len(calls)} callers, up to {args.max_attempts} attempts)")
+    for name, r in results.items():
+        print(f"  {name:<11} identified {r['identified_rate']:.0%}  correct {r['correct_rate']:.0%}  "
+              f"re-prompts/identified {r['reprompts_per_identified_caller']}  "
+              f"re-prompts total {r['reprompts_total']}  {r['us_per_parse']:.1f} µs/parse")
+
+
+if __name__ == "__main__":
+    main()
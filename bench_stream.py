@@ -0,0 +1,175 @@
+# bench_stream.py — time-to-first-response: <Gather> turns vs the streaming media mode
+#
+#   python bench_stream.py --callers 20 --turns 5
+#   python bench_stream.py --stable-partials 1 --gather-endpoint-ms 1500 --json
+#
+# Replays data/stream_transcripts.jsonl (partial hypotheses with their arrival
+# times, end of utterance, final transcript) against the in-process app:
+#   gather — the caller stops speaking, Twilio waits out speech_timeout="auto"
+#            (--gather-endpoint-ms) and posts /process; first response is the
+#            TwiML coming back.
+#   stream — partials and the final go over /media-stream in real time; first
+#            response is the first "response" event after end of utterance
+#            (0 if the answer was already there).
+# Both add one network round trip (--rtt-ms). Same stub OpenAI/dashboard
+# setup as loadtest.py.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+from loadtest import load_app, summarise
+
+
+class ASGIWebSocket:
+    """Minimal in-process WebSocket client for an ASGI app."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self._to_app = asyncio.Queue()
+        self.events = asyncio.Queue()   # (perf_counter, event dict) from the app
+
+    async def connect(self):
+        scope = {"type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": self.path,
+                 "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+                 "headers": [(b"host", b"test")], "server": ("test", 80), "client": ("sim", 1), "subprotocols": []}
+        self._task = asyncio.create_task(self.app(scope, self._receive, self._send))
+        await self._to_app.put({"type": "websocket.connect"})
+
+    async def _receive(self):
+        return await self._to_app.get()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.send":
+            await self.events.put((time.perf_counter(), json.loads(message["text"])))
+
+    async def send(self, event: dict):
+        await self._to_app.put({"type": "websocket.receive", "text": json.dumps(event)})
+
+    async def close(self):
+        await self.send({"event": "stop"})
+        await self._task
+
+    async def until_mark(self, name: str) -> list:
+        out = []
+        while True:
+            at, event = await self.events.get()
+            out.append((at, event))
+            if event.get("event") == "mark" and event["mark"]["name"] == name:
+                return out
+
+
+async def sleep_until(deadline: float):
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def stream_call(app, utterances, phone: str, results: dict, args):
+    ws = ASGIWebSocket(app, "/media-stream")
+    await ws.connect()
+    sid = f"MZ{random.getrandbits(64):016x}"
+    await ws.send({"event": "connected", "protocol": "Call", "version": "1.0.0"})
+    await ws.send({"event": "start", "start": {"streamSid": sid, "callSid": "CA" + sid[2:],
+                                               "customParameters": {"phone": phone}}})
+    await ws.until_mark("greeting")
+    for turn, utt in enumerate(utterances, 1):
+        t0 = time.perf_counter()
+        for at_ms, text in utt["partials"]:
+            await sleep_until(t0 + at_ms / 1000)
+            await ws.send({"event": "transcript", "transcript": {"text": text, "final": False}})
+        await sleep_until(t0 + utt["final_ms"] / 1000)
+        await ws.send({"event": "transcript", "transcript": {"text": utt["text"], "final": True}})
+        first = None
+        for at, event in await ws.until_mark(f"turn-{turn}"):
+            if event["event"] == "clear":
+                first = None
+                results["corrected"] += 1
+            elif event["event"] == "response" and first is None:
+                first = at
+        eou = t0 + utt["eou_ms"] / 1000
+        results["early"] += first < t0 + utt["final_ms"] / 1000
+        results["ttfr"].append(max(0.0, first - eou) * 1000 + args.rtt_ms)
+    await ws.close()
+
+
+async def gather_call(client, utterances, phone: str, results: dict, args):
+    call_sid = f"CA{random.getrandbits(64):016x}"
+    await client.post("/voice", data={"CallSid": call_sid, "From": phone})
+    await client.post("/get-phone", data={"CallSid": call_sid, "SpeechResult": " ".join(phone[-10:])})
+    for utt in utterances:
+        # Twilio's endpointing runs before the webhook is even sent
+        await asyncio.sleep(args.gather_endpoint_ms / 1000)
+        t0 = time.perf_counter()
+        r = await client.post("/process", data={"CallSid": call_sid, "SpeechResult": utt["text"]})
+        r.raise_for_status()
+        results["ttfr"].append(args.gather_endpoint_ms + args.rtt_ms + (time.perf_counter() - t0) * 1000)
+    await client.post("/call-status", data={"CallSid": call_sid, "CallStatus": "completed"})
+
+
+async def run(args) -> dict:
+    module = load_app(args.app, args)
+    with open(args.transcripts, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(args.seed)
+    scripts = [[rng.choice(corpus) for _ in range(args.turns)] for _ in range(args.callers)]
+
+    app = module.app
+    results = {m: {"ttfr": [], "early": 0, "corrected": 0} for m in ("gather", "stream")}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await gather_call(client, scripts[0][:1], args.phone, {"ttfr": []}, args)  # warm-up
+            await asyncio.gather(*(gather_call(client, s, args.phone, results["gather"], args) for s in scripts))
+            await asyncio.gather(*(stream_call(app, s, args.phone, results["stream"], args) for s in scripts))
+
+    turns = args.callers * args.turns
+    out = {"config": {k: v for k, v in vars(args).items()}, "turns": turns}
+    for mode, r in results.items():
+        out[mode] = {"ttfr": summarise(r["ttfr"])}
+    out["stream"]["early_answer_share"] = round(results["stream"]["early"] / turns, 3)
+    out["stream"]["corrected"] = results["stream"]["corrected"]
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--app", default="app_bfsi", help="module exposing the FastAPI `app` (app_bfsi or main)")
+    ap.add_argument("--transcripts", default="data/stream_transcripts.jsonl")
+    ap.add_argument("--callers", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=5)
+    ap.add_argument("--phone", default="+919876543210")
+    ap.add_argument("--gather-endpoint-ms", type=float, default=1000, help="silence Twilio waits before posting /process")
+    ap.add_argument("--rtt-ms", type=float, default=80, help="network round trip added to both modes")
+    ap.add_argument("--stable-partials", type=int, help="override STREAM_STABLE_PARTIALS")
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--dashboard-latency-ms", type=float, default=50)
+    ap.add_argument("--dashboard-down", action="store_true")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+    # Transcripts go straight to /media-stream here, standing in for the speech bridge
+    os.environ.setdefault("STREAM_BRIDGE_URL", "wss://bridge.invalid/stream")
+    if args.stable_partials:
+        os.environ["STREAM_STABLE_PARTIALS"] = str(args.stable_partials)  # read when the app imports media_stream
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['turns']} turns, {args.callers} concurrent callers")
+    for mode in ("gather", "stream"):
+        t = result[mode]["ttfr"]
+        print(f"  {mode:<7} time-to-first-response p50 {t['p50_ms']:.0f} ms  p95 {t['p95_ms']:.0f} ms  "
+              f"p99 {t['p99_ms']:.0f} ms")
+    print(f"  stream answers ready before the final transcript: {result['stream']['early_answer_share']:.0%}, "
+          f"corrected: {result['stream']['corrected']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,292 @@
 # business_logic_bfsi.py
+import asyncio
+import logging
 import os
-from openai import OpenAI
-from sample_data import find_customer
+import re
+import threading
+from typing import Callable, NamedTuple
+
+from customer_store import make_customer_repository
+from rephraser import Rephraser
+from intent_matcher import MATCHER
+from metrics import REGISTRY, stage, label_turn
+from admission import skip_rephrase
+from phone_normalizer import parse_spoken_phone, MIN_CONFIDENCE as PHONE_MIN_CONFIDENCE
+from prefetch import Prefetcher, READ_ONLY_INTENTS
+from ttl_cache import TTLCache
+
+log = logging.getLogger("business_logic")
+
+# Spoken answers: a template name plus slot values fully determine the text,
+# which is what the rephrase cache is keyed on.
+TEMPLATES = {
+    "card_not_found": "I couldn't find a card linked to this number.",
+    "card_already_blocked": "Your card ending {last4} is already blocked.",
+    "card_blocked": "I've blocked your card ending in {last4} immediately. Would you like a replacement card?",
+    "account_not_found": "No account found.",
+    "balance": "Your savings account ending in {last4} has a balance of ₹{balance:.0f}. Would you like a mini statement sent via SMS?",
+    "loan_not_found": "No loans found.",
+    "emi": "Your next EMI of ₹{emi:.0f} is due on {due}.",
+    "policy_not_found": "No policies found.",
+    "no_claim": "Your {type} policy {policy_no} has no active claims.",
+    "claim": "Your claim {id} submitted on {submitted_on} for ₹{amount:.0f} is currently {status}.",
+    "customer_not_found": "I couldn't find a customer profile for this number.",
+    "contact_prompt": "Sure. Say update email to, followed by your new email address, or change number to, followed by your new 10 digit mobile number.",
+    "contact_unchanged": "Your {field} is already {value}.",
+    "contact_confirm": "I heard {value} as your new {field}. Shall I update it? Please say yes or no.",
+    "contact_kept": "Okay, I've left your {field} unchanged.",
+    "contact_updated": "Done. I've updated your {field} to {value}.",
+    "action_failed": "Sorry, I couldn't complete that right now. Nothing has been changed; please try again in a moment.",
+    "fallback": "You can check your balance, block a card, get EMI details, check claim status, or update contact info.",
+}
+
+MAX_INTENTS_PER_TURN = int(os.getenv("MAX_INTENTS_PER_TURN", 3))
+CONFIRM_TTL = float(os.getenv("CONTACT_CONFIRM_TTL", 120))
+PREWARM_DELAY = float(os.getenv("LLM_PREWARM_DELAY", 1.0))
+
+REGISTRY.describe("bfsi_multi_intent_turns_total", "Turns that served more than one intent in a single answer")
+
+
+def reply(success: bool, template: str, **slots):
+    return {"success": success, "message": TEMPLATES[template].format(**slots), "template": template, "slots": slots}
+
+
+class IntentHandler(NamedTuple):
+    fn: Callable            # fn(logic, customer, phone, query) -> reply
+    needs: tuple            # customer fields the handler reads
+    missing: str            # template spoken when the customer or a needed field is absent
+    changes_state: bool     # invalidates the call's prefetched answers
+
+
+# intent -> IntentHandler. Unregistered intents (escalation, fallback) get the fallback reply.
+HANDLERS = {}
+_UNFETCHED = object()
+
+
+def intent_handler(intent: str, needs=(), missing: str = "customer_not_found", changes_state: bool = False):
+    """Register a handler; the dispatcher fetches the customer and checks `needs` before calling it."""
+    def register(fn):
+        HANDLERS[intent] = IntentHandler(fn, tuple(needs), missing, changes_state)
+        return fn
+    return register
+
+
+_SPOKEN_EMAIL = [(re.compile(r"\s+at(?: the rate)?\s+", re.I), "@"), (re.compile(r"\s+dot\s+", re.I), ".")]
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_VALUE_INTRO = re.compile(r"\b(?:to|as|is)\b", re.I)
+_YES = re.compile(r"\b(?:yes|yeah|yep|sure|correct|right|ok(?:ay)?|go ahead|haan|ha|ji)\b", re.I)
+_NO = re.compile(r"\b(?:no|nope|nahi|nahin|wrong|cancel|don't|do not)\b", re.I)
+_CONTACT_LABELS = {"email": "email address", "phone": "contact number"}
+
+
+def spoken_email(text: str):
+    """'john at gmail dot com' -> 'john@gmail.com', or None.
+
+    >>> spoken_email("update email to john at gmail dot com")
+    'john@gmail.com'
+    >>> spoken_email("update email to john at the rate gmail dot com")
+    'john@gmail.com'
+    """
+    for pattern, repl in _SPOKEN_EMAIL:
+        text = pattern.sub(repl, text)
+    m = _EMAIL.search(text)
+    return m.group().lower() if m else None
+
+
+class LazyAsyncOpenAI:
+    """AsyncOpenAI built on first use: importing the SDK is most of the app's cold-start time."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import AsyncOpenAI
+                    self._client = AsyncOpenAI(**self._kwargs)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
 
 class BFSIBusinessLogic:
-    def __init__(self):
+    def __init__(self, client=None, customers=None):
         key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=key) if key else None
+        if client is None and os.getenv("OPENAI_STUB"):
+            from llm_stub import AsyncStubOpenAI
+            client = AsyncStubOpenAI()
+        self.client = client or (LazyAsyncOpenAI(api_key=key) if key else None)
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        self.rephraser = Rephraser(self.client, self.model)
+        self.customers = customers or make_customer_repository()
+        self.prefetch = Prefetcher(self)
+        # phone -> (field, value) heard but not yet confirmed. Per process: a "yes" that lands
+        # on another worker is not a confirmation, so nothing is written from it.
+        self._confirming = TTLCache(10000, ttl=CONFIRM_TTL)
+
+    def find_customer(self, phone):
+        with stage("find_customer"):
+            return self.customers.get(phone)
 
     def classify_intent(self, text: str) -> str:
-        t = (text or "").lower()
-        t = t.replace("cards", "card").replace("blocked", "block").replace("blocking", "block")
-        if any(k in t for k in ["balance", "account", "statement", "money", "funds"]):
-            return "balance_inquiry"
-        if any(k in t for k in ["lost card", "stolen card", "block my card", "block card", "block the card", "hotlist", "deactivate card"]):
-            return "card_block"
-        if any(k in t for k in ["emi", "loan", "due", "installment", "repayment"]):
-            return "emi_info"
-        if any(k in t for k in ["claim", "insurance", "policy", "coverage"]):
-            return "claim_status"
-        if any(k in t for k in ["update phone", "change number", "update mobile", "update email", "change email", "update address"]):
-            return "update_contact"
-        if any(k in t for k in ["agent", "human", "representative", "talk to person"]):
-            return "escalation"
-        return "fallback"
-
-    def handle_card_block(self, phone: str):
-        c = find_customer(phone)
-        if not c or not c.get("cards"):
-            return {"success": False, "message": "I couldn't find a card linked to this number."}
+        return MATCHER.classify(text)
+
+    def classify_batch(self, texts: list) -> list:
+        return MATCHER.classify_batch(texts)
+
+    @intent_handler("card_block", needs=("cards",), missing="card_not_found", changes_state=True)
+    def handle_card_block(self, c, phone, query=""):
         card = c["cards"][0]
         if card.get("blocked"):
-            return {"success": True, "message": f"Your card ending {card['last4']} is already blocked."}
-        card["blocked"] = True
-        card["status"] = "blocked"
-        return {"success": True, "message": f"I've blocked your card ending in {card['last4']} immediately. Would you like a replacement card?"}
-
-    def handle_balance_inquiry(self, phone):
-        c = find_customer(phone)
-        if not c or not c.get("accounts"):
-            return {"success": False, "message": "No account found."}
+            return reply(True, "card_already_blocked", last4=card["last4"])
+        self.customers.block_card(phone, card["last4"])
+        return reply(True, "card_blocked", last4=card["last4"])
+
+    @intent_handler("balance_inquiry", needs=("accounts",), missing="account_not_found")
+    def handle_balance_inquiry(self, c, phone, query=""):
         a = c["accounts"][0]
-        return {"success": True, "message": f"Your savings account ending in {a['last4']} has a balance of ₹{a['balance']:.0f}. Would you like a mini statement sent via SMS?"}
+        return reply(True, "balance", last4=a["last4"], balance=a["balance"])
 
-    def handle_emi_info(self, phone):
-        c = find_customer(phone)
-        if not c or not c.get("loans"):
-            return {"success": False, "message": "No loans found."}
+    @intent_handler("emi_info", needs=("loans",), missing="loan_not_found")
+    def handle_emi_info(self, c, phone, query=""):
         l = c["loans"][0]
-        return {"success": True, "message": f"Your next EMI of ₹{l['emi']:.0f} is due on {l['due_date'].strftime('%b %d, %Y')}."}
+        return reply(True, "emi", emi=l["emi"], due=l["due_date"].strftime("%b %d, %Y"))
 
-    def handle_claim_status(self, phone):
-        c = find_customer(phone)
-        if not c or not c.get("policies"):
-            return {"success": False, "message": "No policies found."}
+    @intent_handler("claim_status", needs=("policies",), missing="policy_not_found")
+    def handle_claim_status(self, c, phone, query=""):
         p = c["policies"][0]
         claim = p.get("claim")
         if not claim:
-            return {"success": True, "message": f"Your {p['type']} policy {p['policy_no']} has no active claims."}
-        return {"success": True, "message": f"Your claim {claim['id']} submitted on {claim['submitted_on']} for ₹{claim['amount']:.0f} is currently {claim['status']}."}
-
-    def generate_response(self, phone, query):
-        intent = self.classify_intent(query)
-        if intent == "balance_inquiry":
-            msg = self.handle_balance_inquiry(phone)["message"]
-        elif intent == "card_block":
-            msg = self.handle_card_block(phone)["message"]
-        elif intent == "emi_info":
-            msg = self.handle_emi_info(phone)["message"]
-        elif intent == "claim_status":
-            msg = self.handle_claim_status(phone)["message"]
+            return reply(True, "no_claim", type=p["type"], policy_no=p["policy_no"])
+        return reply(True, "claim", id=claim["id"], submitted_on=claim["submitted_on"],
+                     amount=claim["amount"], status=claim["status"])
+
+    @intent_handler("update_contact", needs=("contact",))
+    def handle_update_contact(self, c, phone, query=""):
+        # The new value has to be in the same utterance: "update email to john at gmail dot com"
+        email = spoken_email(query)
+        if email:
+            field, value = "email", email
         else:
-            msg = "You can check your balance, block a card, get EMI details, check claim status, or update contact info."
-        if self.client:
-            try:
-                resp = self.client.responses.create(model=self.model, input=f"Rephrase for friendly voice tone: {msg}", temperature=0.7)
-                return resp.output_text or msg
-            except Exception:
-                return msg
-        return msg
+            parsed = parse_spoken_phone(_VALUE_INTRO.split(query)[-1])
+            if not parsed.phone or parsed.confidence < PHONE_MIN_CONFIDENCE:
+                return reply(True, "contact_prompt")
+            field, value = "phone", parsed.phone
+        label = _CONTACT_LABELS[field]
+        if c["contact"].get(field) == value:
+            return reply(True, "contact_unchanged", field=label, value=value)
+        # One ASR hypothesis is not enough to overwrite contact details: read it back first
+        self._confirming.set(phone, (field, value))
+        return reply(True, "contact_confirm", field=label, value=value)
+
+    @intent_handler("confirm_contact", changes_state=True)
+    def handle_confirm_contact(self, c, phone, query=""):
+        pending = self._confirming.pop(phone)
+        if pending is None:
+            return reply(True, "contact_prompt")
+        field, value = pending
+        self.customers.update_contact(phone, **{field: value})
+        return reply(True, "contact_updated", field=_CONTACT_LABELS[field], value=value)
+
+    @intent_handler("decline_contact")
+    def handle_decline_contact(self, c, phone, query=""):
+        pending = self._confirming.pop(phone)
+        if pending is None:
+            return reply(True, "contact_prompt")
+        return reply(True, "contact_kept", field=_CONTACT_LABELS[pending[0]])
+
+    def awaiting_confirmation(self, phone) -> bool:
+        return phone in self._confirming
+
+    def confirmation(self, phone, query: str):
+        """confirm_contact / decline_contact if this turn answers a pending "shall I update it?".
+
+        Anything that is not a clear yes or no drops the pending update.
+        """
+        if not self.awaiting_confirmation(phone):
+            return None
+        yes, no = _YES.search(query or ""), _NO.search(query or "")
+        if bool(yes) == bool(no):
+            self._confirming.pop(phone)
+            return None
+        return "confirm_contact" if yes else "decline_contact"
+
+    def handle(self, intent, phone, query="", customer=_UNFETCHED):
+        """Run the handler for `intent` and return its un-rephrased reply.
+
+        Pass `customer` (even None) when the record has already been fetched this turn.
+        """
+        spec = HANDLERS.get(intent)
+        if spec is None:
+            return reply(True, "fallback")
+        if spec.needs:
+            c = self.find_customer(phone) if customer is _UNFETCHED else customer
+            if not c or not all(c.get(f) for f in spec.needs):
+                return reply(False, spec.missing)
+        else:
+            c = None if customer is _UNFETCHED else customer
+        return spec.fn(self, c, phone, query)
+
+    async def generate_response(self, phone, query, call_sid=None):
+        with stage("classify_intent"):
+            answer = self.confirmation(phone, query)
+            intents = [answer] if answer else MATCHER.split_intents(query)[:MAX_INTENTS_PER_TURN]
+        label_turn(intent=intents[0])
+        if len(intents) > 1:
+            REGISTRY.inc("bfsi_multi_intent_turns_total")
+        changes_state = any(i in HANDLERS and HANDLERS[i].changes_state for i in intents)
+
+        answers = [None] * len(intents)
+        if not changes_state:
+            with stage("prefetch"):
+                got = await asyncio.gather(*(self.prefetch.get(call_sid, i) for i in intents if i in READ_ONLY_INTENTS))
+            cached = iter(got)
+            answers = [next(cached) if i in READ_ONLY_INTENTS else None for i in intents]
+            if all(a is not None for a in answers):
+                return " ".join(answers)
+
+        # Whatever wasn't prefetched runs in order of mention on one customer fetch
+        customer = _UNFETCHED
+        if any(a is None and i in HANDLERS and HANDLERS[i].needs for i, a in zip(intents, answers)):
+            customer = self.find_customer(phone)
+        replies = {k: self.handle(i, phone, query, customer) for k, (i, a) in enumerate(zip(intents, answers))
+                   if a is None}
+        if changes_state and call_sid:
+            # Prefetched answers may now be stale: rebuild them from the new state
+            self.prefetch.invalidate(call_sid)
+            self.prefetch.start(call_sid, phone)
+        if skip_rephrase():
+            # Overloaded (admission.py): speak the template text, no LLM call
+            rephrased = [r["message"] for r in replies.values()]
+        else:
+            with stage("rephrase"):
+                rephrased = await asyncio.gather(*(self.rephraser.rephrase(r["message"], r["template"], r["slots"])
+                                                   for r in replies.values()))
+        if changes_state:
+            # Only confirm a block/update once it is in the action log
+            with stage("action_commit"):
+                try:
+                    await self.customers.committed()
+                except Exception:
+                    # Not durable, so not done: the store has rolled the change back
+                    log.exception("state change for %s not committed", call_sid)
+                    if call_sid:
+                        self.prefetch.invalidate(call_sid)
+                        self.prefetch.start(call_sid, phone)
+                    return TEMPLATES["action_failed"]
+        for k, text in zip(replies, rephrased):
+            answers[k] = text
+        return " ".join(answers)
+
+    async def prewarm(self, delay: float = PREWARM_DELAY):
+        # Answer the webhook that woke the process first, then load the SDK off
+        # the event loop while the caller is still saying their number
+        await asyncio.sleep(delay)
+        await asyncio.to_thread(MATCHER.load_model)
+        if isinstance(self.client, LazyAsyncOpenAI):
+            await asyncio.to_thread(self.client.load)
+        await self.rephraser.prewarm([TEMPLATES["fallback"]])
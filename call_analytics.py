@@ -0,0 +1,383 @@
+# call_analytics.py — offline call analytics over journaled conversation events
+#
+# The live app only has counters since its last restart, and the in-memory
+# chat_log holds a window of recent events. This job reads the full history:
+# journal segment directories (conversation_journal.py) or JSONL exports (one
+# {role, text, call_sid, ts, ...} event per line, e.g. `conversation_journal.py
+# scan` output) and reports, overall and per UTC hour:
+#   - intent distribution and fallback rate   user turns, classify_batch()
+#   - turns per call, outcomes                 /call-status events (kind/status)
+#   - /get-phone re-prompts                    system events with kind=phone_reprompt
+#   - LLM latency                              llm_ms on agent events (rephrase stage)
+# Events stream through generator stages
+#     lines -> events -> batches -> classified batches -> Tables
+# so memory is one batch, the fixed-size NumPy tables and the calls still open
+# in the unit being read, whatever the input size. Work units are journal shard
+# directories (a call's events for a day are all in one shard) or single JSONL
+# files, spread over a process pool; workers return their tables and the parent
+# sums them. Journals written before the kind/status/llm_ms fields existed give
+# outcomes from the status text and no re-prompt or latency numbers.
+#
+#   python call_analytics.py journal --from 2025-11-01 --to 2025-11-07
+#   python call_analytics.py exports/ --workers 8 --json > report.json
+
+import argparse
+import calendar
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from conversation_journal import shard_segments
+from intent_matcher import FALLBACK, INTENT_KEYWORDS, MATCHER
+from session_store import TERMINAL_CALL_STATUSES
+
+NO_SPEECH = "no_speech"
+INTENTS = (*INTENT_KEYWORDS, FALLBACK, NO_SPEECH)
+OUTCOMES = (*sorted(TERMINAL_CALL_STATUSES), "unfinished")   # unfinished: no terminal status in the unit
+HOUR_COLUMNS = (*INTENTS, *OUTCOMES, "reprompts", "llm_turns", "llm_ms")
+_COL = {name: i for i, name in enumerate(HOUR_COLUMNS)}
+_INTENT_COL = {name: _COL[name] for name in INTENTS}
+
+STATUS_PREFIX = "📞 Call status: "
+_AGENT = '"role": "agent"'   # as json.dumps() writes it; other spellings are simply decoded
+LLM_EDGES_MS = (50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+MAX_TURNS = 50            # last bin of the turns-per-call histogram is "50 or more"
+MAX_REPROMPTS = 10
+MAX_OPEN_CALLS = 200_000  # beyond this the oldest open call is closed as unfinished
+
+
+class Tables:
+    """Everything the report needs, as fixed-size arrays plus one row per hour seen."""
+
+    def __init__(self):
+        self.hours = {}   # epoch hour -> int64 row over HOUR_COLUMNS
+        self.llm_hist = np.zeros(len(LLM_EDGES_MS) + 1, np.int64)
+        self.turns_hist = np.zeros(MAX_TURNS + 1, np.int64)
+        self.reprompt_hist = np.zeros(MAX_REPROMPTS + 1, np.int64)
+        self.events = 0
+        self.bad_lines = 0
+
+    def add(self, hours, columns, weights=None):
+        """Add `weights` (default 1 each) at every (hour, column) pair."""
+        if not len(hours):
+            return
+        uniq, inv = np.unique(np.asarray(hours, np.int64), return_inverse=True)
+        width = len(HOUR_COLUMNS)
+        block = np.bincount(inv * width + np.asarray(columns), weights=weights, minlength=len(uniq) * width)
+        for hour, row in zip(uniq.tolist(), np.rint(block).astype(np.int64).reshape(len(uniq), width)):
+            acc = self.hours.get(hour)
+            if acc is None:
+                self.hours[hour] = row
+            else:
+                acc += row
+
+    def add_calls(self, turns, reprompts):
+        self.turns_hist += np.bincount(np.minimum(turns, MAX_TURNS), minlength=MAX_TURNS + 1)
+        self.reprompt_hist += np.bincount(np.minimum(reprompts, MAX_REPROMPTS), minlength=MAX_REPROMPTS + 1)
+
+    def merge(self, other: "Tables") -> "Tables":
+        for hour, row in other.hours.items():
+            acc = self.hours.get(hour)
+            if acc is None:
+                self.hours[hour] = row.copy()
+            else:
+                acc += row
+        self.llm_hist += other.llm_hist
+        self.turns_hist += other.turns_hist
+        self.reprompt_hist += other.reprompt_hist
+        self.events += other.events
+        self.bad_lines += other.bad_lines
+        return self
+
+    def report(self) -> dict:
+        hours = sorted(self.hours)
+        rows = np.array([self.hours[h] for h in hours], np.int64).reshape(len(hours), len(HOUR_COLUMNS))
+        total = dict(zip(HOUR_COLUMNS, rows.sum(axis=0).tolist()))
+        turns = sum(total[i] for i in INTENTS)
+        spoken = turns - total[NO_SPEECH]
+        calls = int(self.turns_hist.sum())
+        conversations = self.turns_hist[1:]
+        return {
+            "events": self.events,
+            "bad_lines": self.bad_lines,
+            "first_hour": _hour_label(hours[0]) if hours else None,
+            "last_hour": _hour_label(hours[-1]) if hours else None,
+            "user_turns": turns,
+            "intents": {i: total[i] for i in INTENTS},
+            "fallback_rate": round(total[FALLBACK] / spoken, 4) if spoken else None,
+            "calls": calls,
+            "turns_per_call": {   # calls with at least one turn; turns_hist[0] are unanswered/hung-up calls
+                "mean": round(float(np.arange(1, MAX_TURNS + 1) @ conversations / conversations.sum()), 2)
+                if conversations.sum() else None,
+                "p50": _hist_quantile(self.turns_hist[1:], range(1, MAX_TURNS + 1), 0.5),
+                "p95": _hist_quantile(self.turns_hist[1:], range(1, MAX_TURNS + 1), 0.95),
+                "histogram": self.turns_hist.tolist(),
+            },
+            "phone_reprompts": {
+                "total": total["reprompts"],
+                "per_call": round(total["reprompts"] / calls, 3) if calls else None,
+                "calls_reprompted": int(self.reprompt_hist[1:].sum()),
+                "histogram": self.reprompt_hist.tolist(),
+            },
+            "llm_ms": {
+                "turns": total["llm_turns"],
+                "mean": round(total["llm_ms"] / total["llm_turns"], 1) if total["llm_turns"] else None,
+                # upper bucket edges: "p95 <= 1000 ms"
+                "p50_le": _hist_quantile(self.llm_hist, LLM_EDGES_MS, 0.5),
+                "p95_le": _hist_quantile(self.llm_hist, LLM_EDGES_MS, 0.95),
+                "p99_le": _hist_quantile(self.llm_hist, LLM_EDGES_MS, 0.99),
+                "buckets_le": list(LLM_EDGES_MS) + ["+Inf"],
+                "histogram": self.llm_hist.tolist(),
+            },
+            "outcomes": {o: total[o] for o in OUTCOMES},
+            "hourly": [{"hour": _hour_label(h), **dict(zip(HOUR_COLUMNS, row.tolist()))} for h, row in zip(hours, rows)],
+        }
+
+
+def _hour_label(hour: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:00Z", time.gmtime(hour * 3600))
+
+
+def _hist_quantile(counts, edges, q: float):
+    """Upper edge of the bin holding the q-quantile (None past the last edge or without data)."""
+    counts = np.asarray(counts)
+    if not counts.sum():
+        return None
+    i = int(np.searchsorted(np.cumsum(counts), q * counts.sum()))
+    edges = list(edges)
+    return edges[i] if i < len(edges) else None
+
+
+# ---------------- pipeline stages ----------------
+def read_lines(paths):
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as fh:
+                yield from fh
+        except FileNotFoundError:
+            continue   # compacted away since the unit was listed
+
+
+def parse(lines, tables: Tables, since: float = None, until: float = None):
+    decode = json.JSONDecoder().raw_decode
+    quick = since is None and until is None
+    for line in lines:
+        if quick and _AGENT in line and "llm_ms" not in line:
+            # An agent reply without a latency only adds to the event count: don't decode it
+            tables.events += 1
+            continue
+        try:
+            event = decode(line)[0]
+        except ValueError:
+            if line.strip():
+                tables.bad_lines += 1   # e.g. the torn last line of a segment still being written
+            continue
+        if since is not None or until is not None:
+            ts = event.get("ts") or 0
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+        tables.events += 1
+        yield event
+
+
+def batched(events, size: int):
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def classified(batches, matcher=MATCHER):
+    """(batch, intent of each user turn in order), one classify_batch() call per batch."""
+    for batch in batches:
+        texts = [(e.get("text") or "").strip() for e in batch if e.get("role") == "user"]
+        # Callers say the same few things: each distinct utterance is classified once per batch
+        spoken = list(dict.fromkeys(t for t in texts if t and t != "(no speech)"))
+        intent_of = dict(zip(spoken, matcher.classify_batch(spoken)))
+        yield batch, [intent_of.get(t, NO_SPEECH) for t in texts]
+
+
+def fold(batches, tables: Tables):
+    """Fold classified batches into `tables`; per-call counters live only until the call ends."""
+    calls = {}   # CallSid -> [user turns, re-prompts, last hour]
+    ended_turns, ended_reprompts = [], []
+
+    def end(state, outcome_col, hour):
+        ended_turns.append(state[0])
+        ended_reprompts.append(state[1])
+        hours.append(hour)
+        cols.append(outcome_col)
+
+    for batch, intents in batches:
+        hours, cols = [], []
+        llm_hours, llm_ms = [], []
+        intents = iter(intents)
+        for e in batch:
+            hour = int(e.get("ts") or 0) // 3600
+            sid = e.get("call_sid")
+            state = calls.get(sid)
+            if state is None:
+                state = [0, 0, hour]
+                if sid:
+                    if len(calls) >= MAX_OPEN_CALLS:
+                        old = calls.pop(next(iter(calls)))
+                        end(old, _COL["unfinished"], old[2])
+                    calls[sid] = state
+            state[2] = hour
+            role = e.get("role")
+            if role == "user":
+                state[0] += 1
+                hours.append(hour)
+                cols.append(_INTENT_COL.get(next(intents), _COL[FALLBACK]))
+            elif role == "agent":
+                ms = e.get("llm_ms")
+                if ms is not None:
+                    llm_hours.append(hour)
+                    llm_ms.append(ms)
+            elif role == "system":
+                if e.get("kind") == "phone_reprompt":
+                    state[1] += 1
+                    hours.append(hour)
+                    cols.append(_COL["reprompts"])
+                    continue
+                status = e.get("status")
+                if status is None and (e.get("text") or "").startswith(STATUS_PREFIX):
+                    status = e["text"][len(STATUS_PREFIX):]
+                if status in TERMINAL_CALL_STATUSES and sid in calls:
+                    end(calls.pop(sid), _COL[status], hour)
+        tables.add(hours, cols)
+        if llm_ms:
+            ms = np.asarray(llm_ms, np.float64)
+            tables.llm_hist += np.bincount(np.searchsorted(LLM_EDGES_MS, ms), minlength=len(LLM_EDGES_MS) + 1)
+            tables.add(llm_hours * 2, [_COL["llm_turns"]] * len(llm_ms) + [_COL["llm_ms"]] * len(llm_ms),
+                       np.concatenate([np.ones(len(ms)), ms]))
+        if ended_turns:
+            tables.add_calls(np.asarray(ended_turns), np.asarray(ended_reprompts))
+            ended_turns.clear()
+            ended_reprompts.clear()
+
+    # Calls without a terminal status in this unit (still live, or the status was lost)
+    hours, cols = [], []
+    for state in calls.values():
+        end(state, _COL["unfinished"], state[2])
+    tables.add(hours, cols)
+    if ended_turns:
+        tables.add_calls(np.asarray(ended_turns), np.asarray(ended_reprompts))
+    return tables
+
+
+def analyse_unit(paths, batch_size: int = 4096, since: float = None, until: float = None) -> Tables:
+    tables = Tables()
+    events = parse(read_lines(paths), tables, since, until)
+    return fold(classified(batched(events, batch_size)), tables)
+
+
+def _init_worker(model: str):
+    MATCHER.load_model(model)
+
+
+def work_units(paths, first_day: str = None, last_day: str = None):
+    """Lists of files read in order by one worker: a journal shard directory, or one JSONL file."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield [path]
+            continue
+        shards = [segments for _, _, segments in shard_segments(path, first_day, last_day)]
+        if shards:
+            yield from shards
+            continue
+        for base, _, names in sorted(os.walk(path)):
+            for name in sorted(names):
+                if name.endswith((".jsonl", ".log")):
+                    yield [os.path.join(base, name)]
+
+
+def analyse(units, workers: int = None, batch_size: int = 4096, model: str = None,
+            since: float = None, until: float = None) -> Tables:
+    units = list(units)
+    workers = min(workers or os.cpu_count() or 1, max(1, len(units)))
+    total = Tables()
+    if workers == 1:
+        _init_worker(model)
+        for unit in units:
+            total.merge(analyse_unit(unit, batch_size, since, until))
+        return total
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model,)) as pool:
+        for tables in pool.map(partial(analyse_unit, batch_size=batch_size, since=since, until=until), units):
+            total.merge(tables)
+    return total
+
+
+def _day_start(day: str) -> float:
+    return calendar.timegm(time.strptime(day, "%Y-%m-%d"))
+
+
+def print_report(r: dict, hourly: bool = False):
+    print(f"{r['events']:,} events, {r['calls']:,} calls, {r['first_hour']} .. {r['last_hour']}"
+          + (f"  ({r['bad_lines']} unreadable lines)" if r["bad_lines"] else ""))
+    turns = r["user_turns"]
+    fallback = f"{r['fallback_rate']:.1%}" if r["fallback_rate"] is not None else "-"
+    print(f"intents: {turns:,} user turns, fallback rate {fallback}")
+    for intent, n in sorted(r["intents"].items(), key=lambda kv: -kv[1]):
+        print(f"  {intent:<16} {n:>12,}  {n / turns if turns else 0:6.1%}")
+    t = r["turns_per_call"]
+    print(f"turns per call: mean {t['mean']}  p50 {t['p50']}  p95 {t['p95']}  "
+          f"({t['histogram'][0]:,} calls without a turn)")
+    p = r["phone_reprompts"]
+    print(f"/get-phone re-prompts: {p['total']:,} ({p['per_call']} per call, {p['calls_reprompted']:,} calls re-prompted)")
+    m = r["llm_ms"]
+    if m["turns"]:
+        le = lambda v: f"<= {v} ms" if v is not None else f"> {LLM_EDGES_MS[-1]} ms"
+        print(f"LLM latency: {m['turns']:,} turns, mean {m['mean']} ms, p50 {le(m['p50_le'])}, "
+              f"p95 {le(m['p95_le'])}, p99 {le(m['p99_le'])}")
+    else:
+        print("LLM latency: no agent events with llm_ms")
+    calls = r["calls"]
+    print("outcomes: " + "  ".join(f"{o} {n:,} ({n / calls if calls else 0:.1%})" for o, n in r["outcomes"].items()))
+    if hourly:
+        cols = ("turns", FALLBACK, "reprompts", "llm_mean_ms", *OUTCOMES)
+        print("\n" + "hour".ljust(18) + "".join(c.rjust(12) for c in cols))
+        for row in r["hourly"]:
+            n = sum(row[i] for i in INTENTS)
+            values = (n, row[FALLBACK], row["reprompts"],
+                      round(row["llm_ms"] / row["llm_turns"]) if row["llm_turns"] else "-", *(row[o] for o in OUTCOMES))
+            print(row["hour"].ljust(18) + "".join(str(v).rjust(12) for v in values))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="*", help="journal roots, directories of JSONL files or files "
+                                             "(default: CONVERSATION_JOURNAL or ./journal)")
+    ap.add_argument("--from", dest="first_day", help="first UTC day, YYYY-MM-DD")
+    ap.add_argument("--to", dest="last_day", help="last UTC day, inclusive")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (default: one per CPU)")
+    ap.add_argument("--batch", type=int, default=4096, help="events per classify_batch() call")
+    ap.add_argument("--model", default=None, help="intent model (default: INTENT_MODEL, \"\" for keywords only)")
+    ap.add_argument("--hourly", action="store_true", help="also print the per-hour table")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    paths = args.paths or [os.getenv("CONVERSATION_JOURNAL") or "journal"]
+    since = _day_start(args.first_day) if args.first_day else None
+    until = _day_start(args.last_day) + 86400 if args.last_day else None
+    tables = analyse(work_units(paths, args.first_day, args.last_day), args.workers, args.batch, args.model,
+                     since, until)
+    report = tables.report()
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print_report(report, args.hourly)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-from twilio.rest import Client
 import os
 from dotenv import load_dotenv
+from dialer import get_twilio_client
 
 load_dotenv()
 
@@ -10,12 +10,10 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 YOUR_PHONE_NUMBER = os.getenv("YOUR_PHONE_NUMBER")
 BACKEND_URL = os.getenv("BACKEND_URL")
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-
 def call_me_bfsi():
     print(f"📞 Calling {YOUR_PHONE_NUMBER} via Twilio...")
     try:
-        call = client.calls.create(
+        call = get_twilio_client().calls.create(
             to=YOUR_PHONE_NUMBER,
             from_=TWILIO_PHONE_NUMBER,
             url=f"{BACKEND_URL}/voice",
@@ -24,6 +22,7 @@ def call_me_bfsi():
             method="POST"
         )
         print(f"✅ Call initiated: {call.sid}")
+        return call.sid
     except Exception as e:
         print(f"❌ Error: {e}")
 
@@ -0,0 +1,167 @@
+# conversation_feed.py — sequenced conversation events with cursor reads and SSE fan-out
+#
+# Every event gets a monotonically increasing `seq`. Dashboards either poll
+# `GET /conversation?since=<seq>&call_sid=<sid>` or keep an SSE connection
+# open and receive only the new events for the call they are watching.
+# Each event is serialised once; fan-out to subscribers is a queue put.
+# Only the most recent `window` events stay in memory. With a
+# ConversationJournal attached every event is also appended there, and a
+# per-call read older than the window pages through the journal instead.
+#
+# `seq`, the window and the SSE subscribers all live in this process, so a
+# feed that serves cursors must run in exactly one: `claim()` takes an
+# exclusive lock (FEED_LOCK) at startup and refuses to start a second one.
+# Agent workers forward to that process (DASHBOARD_URL), which re-sequences.
+
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_right
+
+from fastapi.responses import StreamingResponse
+
+from action_journal import try_lock
+
+ALL_CALLS = "*"
+FEED_LOCK = os.getenv("FEED_LOCK", "conversation_feed.lock")
+
+
+class ConversationFeed:
+    def __init__(self, subscriber_queue: int = 1000, keepalive: float = 15.0, window: int = 5000, journal=None):
+        self.journal = journal
+        self._seq = journal.last_seq if journal else 0
+        self.events = []        # recent window in global order, seq increasing
+        self._by_call = {}      # call_sid -> [event, ...] within the window
+        self._subscribers = {}  # call_sid or ALL_CALLS -> set(asyncio.Queue)
+        self.subscriber_queue = subscriber_queue
+        self.keepalive = keepalive
+        self.window = window
+        self._lock = None
+
+    def claim(self, lock_path: str = FEED_LOCK):
+        """Make this process the only one serving the feed; raises if another already does."""
+        if self._lock is not None:
+            return
+        fh = open(lock_path, "a")
+        if not try_lock(fh):
+            fh.close()
+            raise RuntimeError(f"conversation feed lock {lock_path} is held by another process: "
+                               "seq and Last-Event-ID are per process, run the feed with a single worker")
+        self._lock = fh
+
+    def release(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    @property
+    def cursor(self) -> int:
+        return self._seq
+
+    def append(self, event: dict) -> dict:
+        self._seq += 1
+        event = {**event, "seq": self._seq, "ts": event.get("ts") or time.time()}
+        call_sid = event.get("call_sid")
+        self.events.append(event)
+        if call_sid:
+            self._by_call.setdefault(call_sid, []).append(event)
+        line = json.dumps(event, ensure_ascii=False)
+        if self.journal is not None:
+            self.journal.append(event, line)
+        self._fan_out(call_sid, event, line)
+        if self.window and len(self.events) > self.window + self.window // 4:
+            self._trim()
+        return event
+
+    def _trim(self):
+        # Amortised: drop the oldest quarter at once and rebuild the per-call view
+        self.events = self.events[-self.window:]
+        self._by_call = {}
+        for e in self.events:
+            if e.get("call_sid"):
+                self._by_call.setdefault(e["call_sid"], []).append(e)
+
+    def extend(self, events) -> int:
+        n = 0
+        for e in events:
+            self.append(e)
+            n += 1
+        return n
+
+    def since(self, seq: int = 0, call_sid: str = None, limit: int = 500) -> list:
+        first = self.events[0]["seq"] if self.events else self._seq + 1
+        if not call_sid:
+            i = max(0, seq - first + 1)
+            return self.events[i:i + limit]
+        if seq < first - 1 and self.journal is not None:
+            return self.journal.page(call_sid, seq, limit)   # older than the window
+        rows = self._by_call.get(call_sid, [])
+        i = bisect_right(rows, seq, key=lambda e: e["seq"])
+        return rows[i:i + limit]
+
+    # ---------------- push side ----------------
+    def subscribe(self, call_sid: str = None) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=self.subscriber_queue)
+        self._subscribers.setdefault(call_sid or ALL_CALLS, set()).add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue, call_sid: str = None):
+        subs = self._subscribers.get(call_sid or ALL_CALLS)
+        if subs:
+            subs.discard(q)
+            if not subs:
+                del self._subscribers[call_sid or ALL_CALLS]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def _fan_out(self, call_sid, event, line):
+        targets = list(self._subscribers.get(ALL_CALLS, ()))
+        if call_sid:
+            targets += self._subscribers.get(call_sid, ())
+        if not targets:
+            return
+        frame = f"id: {event['seq']}\ndata: {line}\n\n"
+        for q in targets:
+            try:
+                q.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Slow consumer: cut it loose, the browser reconnects with Last-Event-ID.
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+                for subs in self._subscribers.values():
+                    subs.discard(q)
+
+    def sse_response(self, request, call_sid: str = None, since: int = None) -> StreamingResponse:
+        """Stream backlog after `since` (or Last-Event-ID) then live events as SSE."""
+        if since is None:
+            since = int(request.headers.get("last-event-id") or 0)
+
+        async def stream():
+            q = self.subscribe(call_sid)
+            try:
+                last = since
+                for e in self.since(since, call_sid, limit=max(len(self.events), 1000)):
+                    last = e["seq"]
+                    yield f"id: {last}\ndata: {json.dumps(e, ensure_ascii=False)}\n\n"
+                while True:
+                    try:
+                        frame = await asyncio.wait_for(q.get(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+                        continue
+                    if frame is None:
+                        return
+                    seq = int(frame[4:frame.index("\n")])
+                    if seq > last:
+                        last = seq
+                        yield frame
+            finally:
+                self.unsubscribe(q, call_sid)
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
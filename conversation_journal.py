@@ -0,0 +1,456 @@
+# conversation_journal.py — append-only, call-partitioned conversation history
+#
+# Events are JSON lines in segment files laid out as
+#
+#     <root>/<YYYY-MM-DD>/<shard>/<segment>.log     shard = crc32(CallSid) % shards
+#     <root>/<YYYY-MM-DD>/<shard>/<segment>.idx     CallSid -> byte ranges, sorted
+#
+# so every call lives in one shard directory per (UTC) day. The writer keeps one
+# open segment per day/shard, named <first-write-ms>-<pid>-<n> so several worker
+# processes never share a file, and an in-memory CallSid -> ranges map for it.
+# A segment is rolled at JOURNAL_SEGMENT_MB or when its day is over; rolling
+# writes the .idx. Compaction (past days, background thread) rewrites a shard's
+# segments into one file grouped by call, whose index holds a single range per
+# call. Days older than JOURNAL_RETENTION_DAYS are deleted by the same
+# maintenance pass. Reads go through mmap: replay/page one call by its ranges,
+# or scan whole days in file order with constant memory for audit and QA jobs.
+# The journal holds caller phone numbers and transcripts, so it is opt-in:
+# CONVERSATION_JOURNAL=<dir>.
+#
+#   python conversation_journal.py replay CA0123...        # one call's transcript
+#   python conversation_journal.py scan --from 2025-11-01   # stream events as JSON lines
+#   python conversation_journal.py compact                  # compact all past days now
+
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import time
+import zlib
+from collections import OrderedDict
+
+from ttl_cache import TTLCache
+
+log = logging.getLogger("journal")
+
+NO_CALL = "-"
+COMPACTED_PREFIX = "c-"
+
+
+def day_of(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _segment_order(name: str):
+    # A compacted segment holds everything older than the raw segments beside it
+    return (not name.startswith(COMPACTED_PREFIX), name)
+
+
+def _merge_ranges(ranges):
+    """Coalesce adjacent (offset, length) ranges."""
+    out = []
+    for off, length in ranges:
+        if out and out[-1][0] + out[-1][1] == off:
+            out[-1] = (out[-1][0], out[-1][1] + length)
+        else:
+            out.append((off, length))
+    return out
+
+
+def shard_segments(root: str, first_day: str = None, last_day: str = None):
+    """(day, shard, segment paths in read order) per shard directory, without opening a journal.
+
+    Every event of a call on one day is in one shard, so shards can be read independently.
+    """
+    days = sorted(d for d in os.listdir(root) if len(d) == 10 and d[4] == "-") if os.path.isdir(root) else []
+    for day in days:
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        for shard in sorted(os.listdir(os.path.join(root, day))):
+            d = os.path.join(root, day, shard)
+            if os.path.isdir(d):
+                names = sorted((n for n in os.listdir(d) if n.endswith(".log")), key=_segment_order)
+                if names:
+                    yield day, shard, [os.path.join(d, n) for n in names]
+
+
+def write_index(path: str, index: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for sid in sorted(index):
+            f.write(sid + "\t" + ",".join(f"{o}:{n}" for o, n in _merge_ranges(index[sid])) + "\n")
+    os.replace(tmp, path)
+
+
+def read_index(path: str) -> dict:
+    index = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            sid, ranges = line.rstrip("\n").split("\t")
+            index[sid] = [tuple(map(int, r.split(":"))) for r in ranges.split(",")]
+    return index
+
+
+def scan_segment(path: str) -> dict:
+    """Rebuild a segment's index from its lines (segments whose writer never rolled them)."""
+    index = {}
+    with open(path, "rb") as f:
+        off = 0
+        for line in f:
+            if line.endswith(b"\n"):   # a torn last line from a crash is ignored
+                sid = json.loads(line).get("call_sid") or NO_CALL
+                index.setdefault(sid, []).append((off, len(line)))
+            off += len(line)
+    return index
+
+
+class _Active:
+    __slots__ = ("path", "fh", "size", "index")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fh = open(path, "ab")
+        self.size = self.fh.tell()
+        self.index = {}
+
+
+class ConversationJournal:
+    def __init__(self, root: str, shards: int = 16, segment_bytes: int = 64 << 20,
+                 compact_grace: float = 600, open_maps: int = 64, retention_days: float = None):
+        self.root = root
+        self.retention_days = retention_days  # None: keep every day
+        self.shards = shards
+        self.segment_bytes = segment_bytes
+        self.compact_grace = compact_grace  # never compact a segment written to this recently
+        self._active = {}                   # (day, shard) -> _Active
+        self._indexes = TTLCache(1024, ttl=600)
+        self._maps = OrderedDict()          # path -> (file, mmap), LRU
+        self._open_maps = open_maps
+        self._opened = 0
+        self.stats = {"appended": 0, "rolled": 0, "compacted_segments": 0, "expired_days": 0}
+        os.makedirs(root, exist_ok=True)
+        self.last_seq = self._recover_seq()
+
+    # ---------------- write side ----------------
+    def shard_of(self, call_sid: str) -> str:
+        return f"{zlib.crc32((call_sid or NO_CALL).encode()) % self.shards:02d}"
+
+    def append(self, event: dict, line: str = None):
+        """Append one event (already carrying seq/ts); `line` is its JSON if the caller has it."""
+        sid = event.get("call_sid") or NO_CALL
+        key = (day_of(event.get("ts") or time.time()), self.shard_of(sid))
+        seg = self._active.get(key)
+        if seg is None:
+            seg = self._open(*key)
+        data = ((line or json.dumps(event, ensure_ascii=False)) + "\n").encode()
+        seg.fh.write(data)
+        seg.fh.flush()  # visible to readers in other processes; fsync is left to the OS
+        seg.index.setdefault(sid, []).append((seg.size, len(data)))
+        seg.size += len(data)
+        self.last_seq = max(self.last_seq, event.get("seq") or 0)
+        self.stats["appended"] += 1
+        if seg.size >= self.segment_bytes:
+            self._roll(key)
+
+    def _open(self, day: str, shard: str) -> _Active:
+        d = os.path.join(self.root, day, shard)
+        os.makedirs(d, exist_ok=True)
+        self._opened += 1
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-{self._opened:06d}.log"
+        seg = self._active[(day, shard)] = _Active(os.path.join(d, name))
+        return seg
+
+    def _roll(self, key):
+        seg = self._active.pop(key)
+        seg.fh.close()
+        write_index(seg.path[:-4] + ".idx", seg.index)
+        self.stats["rolled"] += 1
+
+    def roll(self, before_day: str = None):
+        """Close active segments (only those for days before `before_day`, if given)."""
+        for key in [k for k in self._active if before_day is None or k[0] < before_day]:
+            self._roll(key)
+
+    def close(self):
+        self.roll()
+        for fh, mm in self._maps.values():
+            mm.close()
+            fh.close()
+        self._maps.clear()
+
+    def _recover_seq(self) -> int:
+        """Highest seq in the newest day's segments, so a restarted feed keeps counting."""
+        best = 0
+        for day in reversed(self.days()):
+            for shard, name in self._segments(day):
+                path = os.path.join(self.root, day, shard, name)
+                # Raw segments are in seq order, so their tail is enough; compacted ones are grouped by call
+                start = 0 if name.startswith(COMPACTED_PREFIX) else max(0, os.path.getsize(path) - 65536)
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    lines = f.read().splitlines()
+                for line in lines[1:] if start else lines:   # the first line of a tail may be cut
+                    try:
+                        best = max(best, json.loads(line).get("seq") or 0)
+                    except ValueError:
+                        pass
+            if best:
+                break
+        return best
+
+    # ---------------- read side ----------------
+    def days(self) -> list:
+        return sorted(d for d in os.listdir(self.root) if len(d) == 10 and d[4] == "-")
+
+    def _segments(self, day: str, shard: str = None):
+        base = os.path.join(self.root, day)
+        for s in ([shard] if shard else sorted(os.listdir(base)) if os.path.isdir(base) else []):
+            d = os.path.join(base, s)
+            if os.path.isdir(d):
+                for name in sorted((n for n in os.listdir(d) if n.endswith(".log")), key=_segment_order):
+                    yield s, name
+
+    def _index(self, path: str) -> dict:
+        for seg in self._active.values():
+            if seg.path == path:
+                return seg.index
+        idx_path = path[:-4] + ".idx"
+        key = (path, os.path.getsize(path))
+        index = self._indexes.get(key)
+        if index is None:
+            index = read_index(idx_path) if os.path.exists(idx_path) else scan_segment(path)
+            self._indexes.set(key, index)
+        return index
+
+    def _map(self, path: str):
+        entry = self._maps.pop(path, None)
+        size = os.path.getsize(path)
+        if entry is not None and len(entry[1]) < size:   # a segment still being written has grown
+            entry[1].close()
+            entry[0].close()
+            entry = None
+        if entry is None:
+            fh = open(path, "rb")
+            entry = (fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+            if len(self._maps) >= self._open_maps:
+                _, (old_fh, old_mm) = self._maps.popitem(last=False)
+                old_mm.close()
+                old_fh.close()
+        self._maps[path] = entry
+        return entry[1]
+
+    def _read_ranges(self, path: str, ranges):
+        for seg in self._active.values():
+            if seg.path == path:
+                seg.fh.flush()
+        mm = self._map(path)
+        for off, length in ranges:
+            for line in mm[off:off + length].splitlines():
+                yield json.loads(line)
+
+    def call_days(self, call_sid: str) -> list:
+        """Days holding events for this call, newest first (calls may cross midnight)."""
+        shard = self.shard_of(call_sid)
+        found = []
+        for day in reversed(self.days()):
+            if any(call_sid in self._index(os.path.join(self.root, day, s, n)) for s, n in self._segments(day, shard)):
+                found.append(day)
+            elif found:
+                break
+        return found
+
+    def replay(self, call_sid: str, day: str = None):
+        """Every event of one call, in write order."""
+        shard = self.shard_of(call_sid)
+        for d in [day] if day else reversed(self.call_days(call_sid)):
+            for s, name in self._segments(d, shard):
+                path = os.path.join(self.root, d, s, name)
+                try:
+                    ranges = self._index(path).get(call_sid)
+                    if ranges:
+                        yield from self._read_ranges(path, ranges)
+                except FileNotFoundError:
+                    continue   # compacted away under us; the compacted file comes later in the listing
+
+    def page(self, call_sid: str, since_seq: int = 0, limit: int = 100, day: str = None) -> list:
+        out = []
+        for e in self.replay(call_sid, day):
+            if (e.get("seq") or 0) > since_seq:
+                out.append(e)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def calls(self, day: str):
+        seen = set()
+        for s, name in self._segments(day):
+            for sid in self._index(os.path.join(self.root, day, s, name)):
+                if sid not in seen:
+                    seen.add(sid)
+                    yield sid
+
+    def scan(self, first_day: str = None, last_day: str = None):
+        """Stream every event of a day range, segment by segment, in constant memory."""
+        for day in self.days():
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            for s, name in self._segments(day):
+                path = os.path.join(self.root, day, s, name)
+                try:
+                    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        start = 0
+                        while True:
+                            end = mm.find(b"\n", start)
+                            if end < 0:
+                                break
+                            yield json.loads(mm[start:end])
+                            start = end + 1
+                except (FileNotFoundError, ValueError):
+                    continue   # compacted away, or an empty segment (mmap of 0 bytes)
+
+    # ---------------- maintenance ----------------
+    def active_paths(self) -> set:
+        """Segments being written; taken on the event loop, which is what mutates _active."""
+        return {seg.path for seg in list(self._active.values())}
+
+    def compact(self, day: str, active: set = None) -> int:
+        """Rewrite each shard of a past day into one call-grouped segment. Returns segments merged."""
+        merged = 0
+        active = self.active_paths() if active is None else active
+        cutoff = time.time() - self.compact_grace
+        for shard in sorted(os.listdir(os.path.join(self.root, day))):
+            d = os.path.join(self.root, day, shard)
+            names = [n for _, n in self._segments(day, shard)]
+            paths = [os.path.join(d, n) for n in names]
+            if len(names) < 2 and all(n.startswith(COMPACTED_PREFIX) for n in names):
+                continue
+            if any(p in active or os.path.getmtime(p) > cutoff for p in paths):
+                continue   # still being written (by us or another worker)
+            indexes = [read_index(p[:-4] + ".idx") if os.path.exists(p[:-4] + ".idx") else scan_segment(p)
+                       for p in paths]
+            out_path = os.path.join(d, COMPACTED_PREFIX + names[-1].removeprefix(COMPACTED_PREFIX))
+            tmp = out_path + ".tmp"
+            index = {}
+            with open(tmp, "wb") as out:
+                maps = []
+                try:
+                    for p in paths:
+                        fh = open(p, "rb")
+                        maps.append((fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(p) else b""))
+                    for sid in sorted(set().union(*indexes)):
+                        start = out.tell()
+                        for (_, mm), idx in zip(maps, indexes):
+                            for off, length in idx.get(sid, ()):
+                                out.write(mm[off:off + length])
+                        index[sid] = [(start, out.tell() - start)]
+                finally:
+                    for fh, mm in maps:
+                        if mm:
+                            mm.close()
+                        fh.close()
+                out.flush()
+                os.fsync(out.fileno())
+            write_index(out_path[:-4] + ".idx", index)
+            os.replace(tmp, out_path)
+            for p in paths:
+                if p != out_path:
+                    os.remove(p)
+                    if os.path.exists(p[:-4] + ".idx"):
+                        os.remove(p[:-4] + ".idx")
+            merged += len(paths)
+        self.stats["compacted_segments"] += merged
+        return merged
+
+    def compact_past(self, today: str = None, active: set = None) -> int:
+        today = today or day_of(time.time())
+        active = self.active_paths() if active is None else active
+        return sum(self.compact(day, active) for day in self.days() if day < today)
+
+    def expired_days(self, now: float = None) -> list:
+        if not self.retention_days:
+            return []
+        cutoff = day_of((now or time.time()) - self.retention_days * 86400)
+        return [day for day in self.days() if day < cutoff]
+
+    def forget(self, days: list):
+        """Close the mmaps of days about to be deleted (on the event loop, which owns them)."""
+        prefixes = tuple(os.path.join(self.root, day) + os.sep for day in days)
+        for path in [p for p in self._maps if p.startswith(prefixes)]:
+            fh, mm = self._maps.pop(path)
+            mm.close()
+            fh.close()
+
+    def expire(self, days: list, active: set) -> int:
+        """Delete whole past days (retention); a day still being written is left for the next pass."""
+        removed = 0
+        for day in days:
+            d = os.path.join(self.root, day)
+            if any(p.startswith(d + os.sep) for p in active):
+                continue
+            shutil.rmtree(d)
+            removed += 1
+        self.stats["expired_days"] += removed
+        return removed
+
+    async def run_maintenance(self, interval: float = 300):
+        """Background loop: roll finished days' segments, compact past days off the event loop."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                today = day_of(time.time())
+                self.roll(before_day=today)
+                active = self.active_paths()
+                expired = self.expired_days()
+                self.forget(expired)
+                removed = await asyncio.to_thread(self.expire, expired, active)
+                merged = await asyncio.to_thread(self.compact_past, today, active)
+                if merged or removed:
+                    log.info("journal: compacted %d segments, deleted %d days past retention", merged, removed)
+            except Exception:
+                log.exception("journal maintenance failed")
+
+
+def make_journal():
+    """CONVERSATION_JOURNAL=<dir> enables the journal; unset or empty disables it."""
+    root = os.getenv("CONVERSATION_JOURNAL", "")
+    if not root:
+        return None
+    return ConversationJournal(root, shards=int(os.getenv("JOURNAL_SHARDS", 16)),
+                               segment_bytes=int(float(os.getenv("JOURNAL_SEGMENT_MB", 64)) * (1 << 20)),
+                               retention_days=float(os.getenv("JOURNAL_RETENTION_DAYS", 30)) or None)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=os.getenv("CONVERSATION_JOURNAL", "journal"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("replay")
+    p.add_argument("call_sid")
+    p.add_argument("--day")
+    p = sub.add_parser("scan")
+    p.add_argument("--from", dest="first_day")
+    p.add_argument("--to", dest="last_day")
+    sub.add_parser("calls").add_argument("day")
+    sub.add_parser("compact")
+    args = ap.parse_args()
+
+    journal = ConversationJournal(args.root)
+    if args.cmd == "replay":
+        events = journal.replay(args.call_sid, args.day)
+    elif args.cmd == "scan":
+        events = journal.scan(args.first_day, args.last_day)
+    elif args.cmd == "calls":
+        events = ({"call_sid": sid} for sid in journal.calls(args.day))
+    else:
+        print(json.dumps({"compacted_segments": journal.compact_past()}))
+        return
+    for e in events:
+        sys.stdout.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
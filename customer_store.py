@@ -0,0 +1,314 @@
+# customer_store.py — customer repository behind find_customer
+#
+#   InMemoryCustomerRepository — wraps the sample CUSTOMERS dict (default)
+#   SQLiteCustomerRepository   — on-disk store for millions of customers:
+#       customers(phone PK -> compact JSON document) plus secondary index
+#       tables on card last4, policy_no and loan type. Hydrated records are
+#       kept in a small LRU and invalidated on writes; a write from another
+#       connection (another uvicorn worker) clears it, via PRAGMA data_version.
+# Pick one with CUSTOMER_DB=memory | sqlite:///path/to/customers.db
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+
+from ttl_cache import TTLCache
+
+DATE_FIELDS = {"due_date", "on"}
+
+
+def normalise_phone(phone: str):
+    """Canonical +91XXXXXXXXXX key from any digit string; None if too short."""
+    digits = "".join(ch for ch in (phone or "") if ch.isdigit())
+    return "+91" + digits[-10:] if len(digits) >= 10 else None
+
+
+def _encode(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _hydrate(obj):
+    if isinstance(obj, dict):
+        return {k: (date.fromisoformat(v) if k in DATE_FIELDS and isinstance(v, str) else _hydrate(v))
+                for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_hydrate(v) for v in obj]
+    return obj
+
+
+# State-changing actions as pure functions on a customer document, shared by
+# the repositories, the action journal's read overlay and its replay.
+def block_card(c: dict, last4: str) -> bool:
+    card = next((x for x in c.get("cards", []) if x["last4"] == last4), None)
+    if not card:
+        return False
+    card["blocked"] = True
+    card["status"] = "blocked"
+    return True
+
+
+def update_contact(c: dict, **fields) -> bool:
+    c.setdefault("contact", {}).update(fields)
+    return True
+
+
+MUTATIONS = {"block_card": block_card, "update_contact": update_contact}
+# What each mutation sets: a later action with the same targets makes an earlier one redundant
+MUTATION_TARGETS = {"block_card": lambda args: [("card", args["last4"])],
+                    "update_contact": lambda args: [("contact", field) for field in args]}
+
+
+class CustomerRepository(ABC):
+    @abstractmethod
+    def get(self, phone: str):
+        ...
+
+    @abstractmethod
+    def find_by_card_last4(self, last4: str) -> list:
+        ...
+
+    @abstractmethod
+    def find_by_policy_no(self, policy_no: str):
+        ...
+
+    @abstractmethod
+    def find_by_loan_type(self, loan_type: str, limit: int = 100) -> list:
+        ...
+
+    @abstractmethod
+    def find_with_loans(self, limit: int = None) -> list:
+        """Phones of customers with any loan (EMI-reminder campaigns)."""
+
+    @abstractmethod
+    def find_with_policies(self, limit: int = None) -> list:
+        """Phones of customers with any policy (claim-update campaigns)."""
+
+    @abstractmethod
+    def save(self, phone: str, customer: dict):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    def apply(self, phone: str, action: str, /, **args) -> bool:
+        """Run one of MUTATIONS on the stored record and write it back."""
+        c = self.get(phone)
+        if not c or not MUTATIONS[action](c, **args):
+            return False
+        self.save(phone, c)
+        return True
+
+    def block_card(self, phone: str, last4: str) -> bool:
+        return self.apply(phone, "block_card", last4=last4)
+
+    def update_contact(self, phone: str, /, **fields) -> bool:
+        return self.apply(phone, "update_contact", **fields)
+
+    def open(self) -> "CustomerRepository":
+        """Startup work deferred from construction (the action log's slot and replay)."""
+        return self
+
+    async def committed(self):
+        """Wait until every mutation made so far is durable (writes here are synchronous)."""
+
+    async def aclose(self):
+        pass
+
+
+class InMemoryCustomerRepository(CustomerRepository):
+    def __init__(self, customers: dict = None):
+        if customers is None:
+            from sample_data import CUSTOMERS as customers
+        self._data = customers
+
+    def get(self, phone):
+        return self._data.get(normalise_phone(phone))
+
+    def find_by_card_last4(self, last4):
+        return [p for p, c in self._data.items() if any(x["last4"] == last4 for x in c.get("cards", []))]
+
+    def find_by_policy_no(self, policy_no):
+        return next((p for p, c in self._data.items()
+                     if any(x["policy_no"] == policy_no for x in c.get("policies", []))), None)
+
+    def find_by_loan_type(self, loan_type, limit=100):
+        return [p for p, c in self._data.items() if any(x["type"] == loan_type for x in c.get("loans", []))][:limit]
+
+    def find_with_loans(self, limit=None):
+        return [p for p, c in self._data.items() if c.get("loans")][:limit]
+
+    def find_with_policies(self, limit=None):
+        return [p for p, c in self._data.items() if c.get("policies")][:limit]
+
+    def save(self, phone, customer):
+        self._data[normalise_phone(phone)] = customer
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCustomerRepository(CustomerRepository):
+    def __init__(self, path: str = "customers.db", cache_size: int = 256):
+        self.path = path
+        self._local = threading.local()
+        self.cache = TTLCache(cache_size, ttl=300)
+        db = self._db()
+        db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS customers (phone TEXT PRIMARY KEY, doc TEXT NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS card_index (last4 TEXT NOT NULL, phone TEXT NOT NULL, PRIMARY KEY (last4, phone)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS policy_index (policy_no TEXT PRIMARY KEY, phone TEXT NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS loan_index (type TEXT NOT NULL, phone TEXT NOT NULL, PRIMARY KEY (type, phone)) WITHOUT ROWID;
+        """)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA mmap_size=268435456")
+            self._local.db = db
+            self._local.version = None
+        return db
+
+    def _check_version(self, db):
+        # data_version moves when any other connection commits; the cached documents may be stale then
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._local.version:
+            if self._local.version is not None:
+                self.cache.clear()
+            self._local.version = version
+
+    def get(self, phone):
+        key = normalise_phone(phone)
+        self._check_version(self._db())
+        c = self.cache.get(key)
+        if c is None:
+            row = self._db().execute("SELECT doc FROM customers WHERE phone = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            c = _hydrate(json.loads(row[0]))
+            self.cache.set(key, c)
+        return c
+
+    def find_by_card_last4(self, last4):
+        return [r[0] for r in self._db().execute("SELECT phone FROM card_index WHERE last4 = ?", (last4,))]
+
+    def find_by_policy_no(self, policy_no):
+        row = self._db().execute("SELECT phone FROM policy_index WHERE policy_no = ?", (policy_no,)).fetchone()
+        return row[0] if row else None
+
+    def find_by_loan_type(self, loan_type, limit=100):
+        return [r[0] for r in self._db().execute(
+            "SELECT phone FROM loan_index WHERE type = ? LIMIT ?", (loan_type, limit))]
+
+    def find_with_loans(self, limit=None):
+        return [r[0] for r in self._db().execute(
+            "SELECT DISTINCT phone FROM loan_index ORDER BY phone LIMIT ?", (-1 if limit is None else limit,))]
+
+    def find_with_policies(self, limit=None):
+        return [r[0] for r in self._db().execute(
+            "SELECT DISTINCT phone FROM policy_index ORDER BY phone LIMIT ?", (-1 if limit is None else limit,))]
+
+    def save(self, phone, customer):
+        key = normalise_phone(phone)
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.execute("DELETE FROM card_index WHERE phone = ?", (key,))
+            db.execute("DELETE FROM policy_index WHERE phone = ?", (key,))
+            db.execute("DELETE FROM loan_index WHERE phone = ?", (key,))
+            self._insert(db, [(key, customer)])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self.cache.pop(key)
+
+    def bulk_load(self, records, batch_size: int = 10000) -> int:
+        """Insert (phone, customer) pairs in large transactions. Returns rows written."""
+        db = self._db()
+        total, batch = 0, []
+        for phone, customer in records:
+            batch.append((normalise_phone(phone), customer))
+            if len(batch) >= batch_size:
+                total += self._write_batch(db, batch)
+                batch = []
+        total += self._write_batch(db, batch)
+        self.cache.clear()
+        return total
+
+    def _write_batch(self, db, batch) -> int:
+        if not batch:
+            return 0
+        db.execute("BEGIN")
+        self._insert(db, batch)
+        db.execute("COMMIT")
+        return len(batch)
+
+    @staticmethod
+    def _insert(db, batch):
+        db.executemany("INSERT OR REPLACE INTO customers (phone, doc) VALUES (?, ?)",
+                       [(p, json.dumps(c, default=_encode, separators=(",", ":"))) for p, c in batch])
+        db.executemany("INSERT OR IGNORE INTO card_index (last4, phone) VALUES (?, ?)",
+                       [(x["last4"], p) for p, c in batch for x in c.get("cards", [])])
+        db.executemany("INSERT OR REPLACE INTO policy_index (policy_no, phone) VALUES (?, ?)",
+                       [(x["policy_no"], p) for p, c in batch for x in c.get("policies", [])])
+        db.executemany("INSERT OR IGNORE INTO loan_index (type, phone) VALUES (?, ?)",
+                       [(x["type"], p) for p, c in batch for x in c.get("loans", [])])
+
+    def __len__(self):
+        return self._db().execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+
+
+# ---------------- bulk loaders ----------------
+def read_jsonl(path):
+    """One customer document per line, with a "phone" key."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                c = json.loads(line)
+                yield c.pop("phone"), c
+
+
+def read_csv(path):
+    """Flat rows: one account/card/loan/policy per customer (see gen_customers.py)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            c = {"name": r["name"], "segment": r.get("segment", "Retail"), "language": r.get("language", "en-IN"),
+                 "contact": {"email": r.get("email"), "phone": r["phone"]}}
+            if r.get("account_last4"):
+                c["accounts"] = [{"type": "savings", "last4": r["account_last4"],
+                                  "balance": float(r["balance"]), "currency": "INR"}]
+            if r.get("card_last4"):
+                c["cards"] = [{"last4": r["card_last4"], "status": r.get("card_status") or "active",
+                               "network": r.get("card_network"), "limit": int(r.get("card_limit") or 0)}]
+            if r.get("loan_type"):
+                c["loans"] = [{"type": r["loan_type"], "emi": float(r["emi"]), "due_date": r["due_date"]}]
+            if r.get("policy_no"):
+                c["policies"] = [{"type": r.get("policy_type"), "policy_no": r["policy_no"],
+                                  "status": r.get("policy_status") or "active"}]
+            yield r["phone"], c
+
+
+def make_customer_repository(url: str = None) -> CustomerRepository:
+    url = url or os.getenv("CUSTOMER_DB", "memory")
+    if url == "memory":
+        repo = InMemoryCustomerRepository()
+    elif url.startswith("sqlite:///"):
+        repo = SQLiteCustomerRepository(url[len("sqlite:///"):], cache_size=int(os.getenv("CUSTOMER_CACHE", 256)))
+    else:
+        raise ValueError(f"Unknown CUSTOMER_DB: {url}")
+    # Card blocks / contact updates go through a write-ahead action log ("" writes straight to the store)
+    log = os.getenv("ACTION_LOG", "actions.log")
+    if not log:
+        return repo
+    from action_journal import ActionJournal, JournaledCustomerRepository
+    return JournaledCustomerRepository(repo, ActionJournal(log))
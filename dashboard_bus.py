@@ -0,0 +1,133 @@
+# dashboard_bus.py — non-blocking, batched event bus for dashboard pushes
+#
+# Webhook handlers call `publish()` which only enqueues the event and returns.
+# A background task drains the queue in batches and POSTs them over a single
+# pooled keep-alive HTTP client, so a slow or dead dashboard never stalls the
+# event loop serving Twilio.
+
+import asyncio
+import logging
+import os
+
+import httpx
+
+from admission import skip_dashboard
+
+log = logging.getLogger("dashboard_bus")
+
+
+class DashboardBus:
+    def __init__(self, url: str, max_queue: int = None, batch_size: int = None,
+                 flush_interval: float = None, timeout: float = None, transport=None):
+        self.url = url.rstrip("/") + "/conversation"
+        self.max_queue = max_queue or int(os.getenv("DASHBOARD_QUEUE_MAX", 10000))
+        self.batch_size = batch_size or int(os.getenv("DASHBOARD_BATCH_SIZE", 100))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("DASHBOARD_FLUSH_INTERVAL", 0.05))
+        self.timeout = timeout if timeout is not None else float(os.getenv("DASHBOARD_TIMEOUT", 2))
+        self._transport = transport
+        self._queue = None
+        self._client = None
+        self._task = None
+        self._batch = []        # taken off the queue, not yet posted (or being posted)
+        self._inflight = None   # the POST of _batch in progress
+        self.stats = {"published": 0, "sent": 0, "dropped": 0, "overflow": 0, "failed": 0, "batches": 0, "shed": 0}
+
+    # ---------------- lifecycle ----------------
+    async def start(self):
+        if self._task:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush whatever is queued (for at most DASHBOARD_TIMEOUT in all), then close the pooled client."""
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        async def drain():
+            # The sender was cancelled around a batch: let its POST finish, or post what it was holding
+            if self._inflight is not None:
+                await self._inflight
+                self._batch = []
+            while self._batch or not self._queue.empty():
+                self._batch = self._batch or self._drain(self.batch_size)
+                await self._send(self._batch)
+                self._batch = []
+
+        try:
+            await asyncio.wait_for(drain(), self.timeout)
+        except asyncio.TimeoutError:
+            left = len(self._batch) + self._queue.qsize()
+            self.stats["dropped"] += left
+            log.warning("Dashboard unreachable at shutdown: %d events dropped", left)
+        if self._client:
+            await self._client.aclose()
+        self._task = self._client = None
+
+    # ---------------- producer side ----------------
+    def publish(self, event: dict):
+        """Enqueue an event; never blocks. Oldest event is dropped on overflow."""
+        if skip_dashboard():
+            self.stats["shed"] += 1
+            return
+        if self._queue is None:
+            self.stats["dropped"] += 1
+            return
+        self.stats["published"] += 1
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["overflow"] += 1
+            self.stats["dropped"] += 1
+            self._queue.get_nowait()
+            self._queue.put_nowait(event)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ---------------- consumer side ----------------
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            self._batch = [await self._queue.get()]
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            self._batch += self._drain(self.batch_size - 1)
+            # Shielded: stop() cancels this task, not a POST half way through
+            self._inflight = asyncio.ensure_future(self._send(self._batch))
+            await asyncio.shield(self._inflight)
+            self._batch, self._inflight = [], None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Built on the first batch: the transport (httpcore, TLS context) costs
+        # ~0.2 s to set up, which a cold start shouldn't pay before it knows
+        # the dashboard is remote
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=self._transport,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            )
+        return self._client
+
+    async def _send(self, batch: list):
+        if not batch:
+            return
+        try:
+            r = await self._http().post(self.url, json={"events": batch})
+            r.raise_for_status()
+            self.stats["sent"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            log.warning("Dashboard update failed (%d events): %s", len(batch), e)
@@ -0,0 +1,368 @@
+# dialer.py — outbound campaign dialer (EMI reminders, claim updates)
+#
+# A campaign is a set of customer phones from the repository
+# (`campaign_targets`), kept as one row per phone in a SQLite job table so a
+# restarted process carries on where it stopped. Answered calls fetch their
+# TwiML from /campaign-voice, which speaks the campaign's reminder (the
+# CAMPAIGN_INTENTS answer) for the customer dialled. `Dialer.run(campaign)` places
+# calls through one pooled Twilio client, limited by
+#   DIALER_CONCURRENCY — calls in progress at once; a slot is held until
+#                        /call-status reports the call's final status
+#   DIALER_CPS         — calls created per second (Twilio's account CPS)
+# /call-status feeds `record_outcome()`: busy / no-answer (and API errors) are
+# retried with exponential backoff up to DIALER_MAX_ATTEMPTS; a call with no
+# final status after DIALER_CALL_TIMEOUT is treated as no-answer.
+# With several uvicorn workers, `Dialer.supervise()` runs campaigns only in the
+# worker holding the lock on <DIALER_DB>.lock; the others just record outcomes
+# in the job table, and the owner's sweep frees slots for calls they finished.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from action_journal import try_lock
+
+log = logging.getLogger("dialer")
+
+RETRY_STATUSES = {"busy", "no-answer", "error"}
+FINAL_STATUSES = {"completed", "failed", "busy", "no-answer", "canceled"}
+CAMPAIGN_KINDS = {"emi": "find_with_loans", "claim": "find_with_policies"}
+CAMPAIGN_INTENTS = {"emi": "emi_info", "claim": "claim_status"}   # what an answered call is told
+TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", 32))
+EARLY_TTL = 60   # seconds a final status waits for its create() to return
+
+
+@lru_cache(maxsize=1)
+def get_twilio_client():
+    """One process-wide Twilio client over a pooled keep-alive HTTP session."""
+    if os.getenv("TWILIO_STUB"):
+        from twilio_stub import StubTwilioClient
+        return StubTwilioClient()
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    http = TwilioHttpClient(timeout=float(os.getenv("TWILIO_TIMEOUT", 10)))
+    http.session.mount("https://", HTTPAdapter(pool_maxsize=TWILIO_POOL_SIZE))
+    return Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"), http_client=http)
+
+
+def campaign_targets(customers, kind: str, limit: int = None) -> list:
+    if kind not in CAMPAIGN_KINDS:
+        raise ValueError(f"Unknown campaign kind: {kind} (expected one of {sorted(CAMPAIGN_KINDS)})")
+    return getattr(customers, CAMPAIGN_KINDS[kind])(limit)
+
+
+class RateLimiter:
+    """Spaces acquisitions 1/rate apart, allowing a burst after idle time."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.burst = burst
+        self._next = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(self._next, now - (self.burst - 1) * self.interval)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class CampaignStore:
+    """Job rows: pending -> dialing -> ringing -> done | failed (or back to pending for a retry)."""
+
+    def __init__(self, path: str = "campaigns.db"):
+        self.path = path
+        self._local = threading.local()
+        self._db().executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS dial_jobs (
+                campaign TEXT NOT NULL, phone TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL DEFAULT 0, call_sid TEXT,
+                outcome TEXT, updated_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (campaign, phone)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS dial_jobs_due ON dial_jobs (campaign, status, next_at);
+            CREATE INDEX IF NOT EXISTS dial_jobs_sid ON dial_jobs (call_sid);
+            CREATE INDEX IF NOT EXISTS dial_jobs_status ON dial_jobs (status, campaign);
+            CREATE TABLE IF NOT EXISTS campaigns (name TEXT PRIMARY KEY, kind TEXT NOT NULL);
+        """)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def add(self, campaign: str, phones, kind: str) -> int:
+        db = self._db()
+        db.execute("BEGIN")
+        db.execute("INSERT OR IGNORE INTO campaigns (name, kind) VALUES (?, ?)", (campaign, kind))
+        before = db.total_changes
+        db.executemany("INSERT OR IGNORE INTO dial_jobs (campaign, phone, updated_at) VALUES (?, ?, ?)",
+                       [(campaign, p, time.time()) for p in phones])
+        db.execute("COMMIT")
+        return db.total_changes - before
+
+    def claim(self, campaign: str, now: float):
+        """Next due phone, marked as dialing (attempt counted), or None."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT phone FROM dial_jobs WHERE campaign = ? AND status = 'pending' AND next_at <= ? "
+                             "ORDER BY next_at LIMIT 1", (campaign, now)).fetchone()
+            if row:
+                db.execute("UPDATE dial_jobs SET status = 'dialing', attempts = attempts + 1, updated_at = ? "
+                           "WHERE campaign = ? AND phone = ?", (now, campaign, row[0]))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def placed(self, campaign: str, phone: str, call_sid: str):
+        self._db().execute("UPDATE dial_jobs SET status = 'ringing', call_sid = ?, updated_at = ? "
+                           "WHERE campaign = ? AND phone = ?", (call_sid, time.time(), campaign, phone))
+
+    def finish(self, campaign: str, phone: str, status: str, max_attempts: int, backoff: float, call_sid: str = None):
+        """Apply the final status of call `call_sid` (None: its create() failed); returns the job's new status,
+        or None if the job has moved on (finished by another callback, or already redialled)."""
+        db = self._db()
+        current, params = ("status = 'ringing' AND call_sid = ?", (call_sid,)) if call_sid else ("status = 'dialing'", ())
+        row = db.execute(f"SELECT attempts FROM dial_jobs WHERE campaign = ? AND phone = ? AND {current}",
+                         (campaign, phone, *params)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        attempts = row[0]
+        if status == "completed":
+            new, next_at = "done", 0
+        elif status in RETRY_STATUSES and attempts < max_attempts:
+            new, next_at = "pending", now + backoff * 2 ** (attempts - 1)
+        else:
+            new, next_at = "failed", 0
+        # Same condition again: a late timeout must not overwrite the outcome a callback has just written
+        changed = db.execute(f"UPDATE dial_jobs SET status = ?, outcome = ?, next_at = ?, updated_at = ? "
+                             f"WHERE campaign = ? AND phone = ? AND {current}",
+                             (new, status, next_at, now, campaign, phone, *params)).rowcount
+        return new if changed else None
+
+    def by_call_sid(self, call_sid: str):
+        return self._db().execute("SELECT campaign, phone FROM dial_jobs WHERE call_sid = ? AND status = 'ringing'",
+                                  (call_sid,)).fetchone()
+
+    def call_target(self, call_sid: str):
+        """(campaign kind, phone) of a ringing campaign call, or None."""
+        return self._db().execute("SELECT c.kind, j.phone FROM dial_jobs j JOIN campaigns c ON c.name = j.campaign "
+                                  "WHERE j.call_sid = ? AND j.status = 'ringing'", (call_sid,)).fetchone()
+
+    def requeue_dialing(self, campaign: str) -> int:
+        """Jobs interrupted mid-create by a restart go back to the queue (the attempt is not counted)."""
+        return self._db().execute("UPDATE dial_jobs SET status = 'pending', attempts = attempts - 1 "
+                                  "WHERE campaign = ? AND status = 'dialing'", (campaign,)).rowcount
+
+    def ringing_sids(self, campaign: str) -> set:
+        return {r[0] for r in self._db().execute("SELECT call_sid FROM dial_jobs WHERE campaign = ? AND status = 'ringing'",
+                                                 (campaign,))}
+
+    def stale_ringing(self, campaign: str, older_than: float) -> list:
+        return self._db().execute("SELECT phone, call_sid FROM dial_jobs WHERE campaign = ? AND status = 'ringing' "
+                                  "AND updated_at < ?", (campaign, older_than)).fetchall()
+
+    def outstanding(self, campaign: str) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM dial_jobs WHERE campaign = ? AND status IN "
+                                  "('pending', 'dialing', 'ringing')", (campaign,)).fetchone()[0]
+
+    def counts(self, campaign: str) -> dict:
+        return dict(self._db().execute("SELECT status, COUNT(*) FROM dial_jobs WHERE campaign = ? GROUP BY status",
+                                       (campaign,)).fetchall())
+
+    def outcomes(self, campaign: str) -> dict:
+        return dict(self._db().execute("SELECT outcome, COUNT(*) FROM dial_jobs WHERE campaign = ? "
+                                       "AND outcome IS NOT NULL GROUP BY outcome", (campaign,)).fetchall())
+
+    def unfinished(self) -> list:
+        return [r[0] for r in self._db().execute(
+            "SELECT DISTINCT campaign FROM dial_jobs WHERE status IN ('pending', 'dialing', 'ringing')")]
+
+
+class Dialer:
+    def __init__(self, store: CampaignStore, client=None, from_number: str = None, backend_url: str = None,
+                 concurrency: int = None, cps: float = None, max_attempts: int = None, backoff: float = None,
+                 call_timeout: float = None, poll_interval: float = 0.5, lock_path: str = None):
+        self.store = store
+        self.lock_path = lock_path             # None: this process always runs the campaigns
+        self._client = client
+        self.from_number = from_number or os.getenv("TWILIO_PHONE_NUMBER")
+        self.backend_url = (backend_url or os.getenv("BACKEND_URL", "http://localhost:8000")).rstrip("/")
+        self.concurrency = concurrency or int(os.getenv("DIALER_CONCURRENCY", 50))
+        self.cps = cps or float(os.getenv("DIALER_CPS", 1))
+        self.max_attempts = max_attempts or int(os.getenv("DIALER_MAX_ATTEMPTS", 3))
+        self.backoff = backoff if backoff is not None else float(os.getenv("DIALER_BACKOFF", 600))
+        self.call_timeout = call_timeout or float(os.getenv("DIALER_CALL_TIMEOUT", 900))
+        self.poll_interval = poll_interval
+        self._rate = RateLimiter(self.cps)
+        self._slots = None                     # created on the running loop
+        self._active = {}                      # call_sid -> (campaign, phone, placed at)
+        self._early = {}                       # call_sid -> (status, received at): final statuses that beat create() back
+        self._creating = 0                     # create() calls in flight
+        self._lock = None
+        self.running = {}                      # campaign -> run() task, in the owning process
+        self._executor = ThreadPoolExecutor(TWILIO_POOL_SIZE, thread_name_prefix="twilio")
+        self.stats = {"placed": 0, "api_errors": 0, "completed": 0, "retried": 0, "failed": 0, "timed_out": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_twilio_client()
+        return self._client
+
+    def in_progress(self) -> int:
+        return len(self._active)
+
+    @property
+    def owner(self) -> bool:
+        return self.lock_path is None or self._lock is not None
+
+    def _claim_lock(self):
+        fh = open(self.lock_path, "a")
+        if try_lock(fh):
+            self._lock = fh
+        else:
+            fh.close()
+
+    async def supervise(self, interval: float = 2.0):
+        """Run every unfinished campaign, in the one worker holding the lock (taken over if its holder exits)."""
+        while True:
+            if not self.owner:
+                await asyncio.to_thread(self._claim_lock)
+            if self.owner:
+                for name in await asyncio.to_thread(self.store.unfinished):
+                    self.start(name)
+            await asyncio.sleep(interval)
+
+    def start(self, campaign: str):
+        if campaign not in self.running or self.running[campaign].done():
+            self.running[campaign] = asyncio.create_task(self.run(campaign))
+
+    def stop(self):
+        for task in self.running.values():
+            task.cancel()
+
+    async def run(self, campaign: str) -> dict:
+        """Dial until every job in the campaign is done or failed."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if await asyncio.to_thread(self.store.requeue_dialing, campaign):
+            log.warning("campaign %s: re-queued calls interrupted by a restart", campaign)
+        last_sweep = 0.0
+        tasks = set()
+        while True:
+            if time.monotonic() - last_sweep > self.poll_interval:
+                await self._expire(campaign)
+                last_sweep = time.monotonic()
+            try:
+                # Bounded wait so timed-out calls still get swept when every slot is taken
+                await asyncio.wait_for(self._slots.acquire(), self.poll_interval)
+            except asyncio.TimeoutError:
+                continue
+            phone = await asyncio.to_thread(self.store.claim, campaign, time.time())
+            if phone is None:
+                self._slots.release()
+                if not await asyncio.to_thread(self.store.outstanding, campaign):
+                    break
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._rate.acquire()
+            task = asyncio.create_task(self._dial(campaign, phone))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        return await asyncio.to_thread(self.store.counts, campaign)
+
+    async def _dial(self, campaign: str, phone: str):
+        loop = asyncio.get_running_loop()
+        self._creating += 1
+        try:
+            call = await loop.run_in_executor(self._executor, lambda: self.client.calls.create(
+                to=phone,
+                from_=self.from_number,
+                url=f"{self.backend_url}/campaign-voice",
+                status_callback=f"{self.backend_url}/call-status",
+                status_callback_event=["initiated", "ringing", "answered", "completed"],
+                method="POST",
+            ))
+        except Exception as e:
+            self._creating -= 1
+            self.stats["api_errors"] += 1
+            log.warning("campaign %s: create call to %s failed: %s", campaign, phone, e)
+            await self._apply(campaign, phone, "error")
+            self._slots.release()
+            return
+        self.stats["placed"] += 1
+        await asyncio.to_thread(self.store.placed, campaign, phone, call.sid)
+        # Still counted as creating until registered, so a status arriving meanwhile is kept in _early
+        self._active[call.sid] = (campaign, phone, time.monotonic())
+        self._creating -= 1
+        early = self._early.pop(call.sid, None)
+        if early:
+            await self.record_outcome(call.sid, early[0])
+
+    async def record_outcome(self, call_sid: str, status: str) -> bool:
+        """Feed a /call-status callback; returns True if it belonged to a campaign call."""
+        if status not in FINAL_STATUSES or not call_sid:
+            return False
+        entry, row, creating = self._active.pop(call_sid, None), None, self._creating
+        if entry is None:
+            row = await asyncio.to_thread(self.store.by_call_sid, call_sid)
+            entry = self._active.pop(call_sid, None)   # create() may have returned during the lookup
+        if entry is not None:
+            campaign, phone, _ = entry
+            self._slots.release()
+        elif row is None:
+            # Not a campaign call, or one whose create() has not returned yet: only then keep it for _dial
+            if creating or self._creating:
+                now = time.monotonic()
+                while self._early and next(iter(self._early.values()))[1] < now - EARLY_TTL:
+                    del self._early[next(iter(self._early))]
+                self._early[call_sid] = (status, now)
+            return False
+        else:
+            campaign, phone = row   # placed by another worker or before a restart: no slot held here
+        await self._apply(campaign, phone, status, call_sid)
+        return True
+
+    async def _apply(self, campaign: str, phone: str, status: str, call_sid: str = None):
+        new = await asyncio.to_thread(self.store.finish, campaign, phone, status, self.max_attempts, self.backoff,
+                                      call_sid)
+        if new is not None:
+            self.stats[{"done": "completed", "pending": "retried"}.get(new, "failed")] += 1
+
+    async def _expire(self, campaign: str):
+        now = time.monotonic()
+        cutoff = now - self.call_timeout
+        for sid, (c, _, placed_at) in list(self._active.items()):
+            if c == campaign and placed_at < cutoff:
+                self.stats["timed_out"] += 1
+                await self.record_outcome(sid, "no-answer")
+        # Calls whose final status reached another worker: the job row has moved on, free the slot
+        ringing = await asyncio.to_thread(self.store.ringing_sids, campaign)
+        for sid, (c, _, placed_at) in list(self._active.items()):
+            if c == campaign and placed_at < now and sid not in ringing:
+                del self._active[sid]
+                self._slots.release()
+        # Calls placed by a previous process that never reported back
+        for phone, sid in await asyncio.to_thread(self.store.stale_ringing, campaign, time.time() - self.call_timeout):
+            if sid not in self._active:
+                self.stats["timed_out"] += 1
+                await self._apply(campaign, phone, "no-answer", sid)
+
+
+def make_dialer(**kwargs) -> Dialer:
+    path = os.getenv("DIALER_DB", "campaigns.db")
+    return Dialer(CampaignStore(path), lock_path=path + ".lock", **kwargs)
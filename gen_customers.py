@@ -0,0 +1,83 @@
+# gen_customers.py — synthetic customers for load and latency testing
+#
+#   python gen_customers.py --count 1000000 --db customers.db       # straight into SQLite
+#   python gen_customers.py --count 100000 --jsonl customers.jsonl  # or to a file
+#   python gen_customers.py --load customers.csv --db customers.db  # bulk-load CSV/JSONL
+
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from customer_store import SQLiteCustomerRepository, read_csv, read_jsonl
+
+FIRST = ["Aarav", "Vivaan", "Aditya", "Diya", "Ananya", "Ishaan", "Kavya", "Riya", "Arjun", "Meera", "Rohan", "Saanvi"]
+LAST = ["Sharma", "Verma", "Iyer", "Reddy", "Nair", "Gupta", "Singh", "Patel", "Khan", "Das", "Mehta", "Rao"]
+LOANS = ["home", "car", "personal", "education", "gold"]
+POLICIES = ["health", "life", "motor", "travel"]
+CLAIM_STATUSES = ["under review", "approved", "settled", "rejected"]
+
+
+def phone_for(i: int) -> str:
+    return f"+91{9000000000 + i}"
+
+
+def synth_customer(i: int, rng: random.Random) -> dict:
+    name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+    c = {
+        "name": name,
+        "segment": rng.choice(["Retail", "Retail", "Premium"]),
+        "language": rng.choice(["en-IN", "hi-IN"]),
+        "accounts": [{"type": "savings", "last4": f"{rng.randrange(10000):04d}",
+                      "balance": round(rng.uniform(500, 500000), 2), "currency": "INR"}],
+        "cards": [{"last4": f"{rng.randrange(10000):04d}", "status": "active",
+                   "network": rng.choice(["VISA", "MASTERCARD", "RUPAY"]), "limit": rng.choice([50000, 100000, 200000])}],
+        "contact": {"email": f"{name.split()[0].lower()}{i}@example.com", "phone": phone_for(i)},
+    }
+    if rng.random() < 0.4:
+        c["loans"] = [{"type": rng.choice(LOANS), "emi": round(rng.uniform(2000, 60000), 2),
+                       "due_date": date(2025, 11, 1) + timedelta(days=rng.randrange(30))}]
+    if rng.random() < 0.5:
+        p = {"type": rng.choice(POLICIES), "policy_no": f"POL-{i:08d}", "status": "active"}
+        if rng.random() < 0.2:
+            p["claim"] = {"id": f"CLM-{i:08d}", "submitted_on": "2025-10-01",
+                          "amount": round(rng.uniform(5000, 300000), 2), "status": rng.choice(CLAIM_STATUSES)}
+        c["policies"] = [p]
+    return c
+
+
+def synth_customers(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield phone_for(i), synth_customer(i, rng)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=1_000_000)
+    ap.add_argument("--db", help="SQLite file to load into")
+    ap.add_argument("--jsonl", help="write JSONL instead of loading")
+    ap.add_argument("--load", help="bulk-load an existing .csv or .jsonl file into --db")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.jsonl:
+        with open(args.jsonl, "w", encoding="utf-8") as f:
+            for phone, c in synth_customers(args.count):
+                f.write(json.dumps({"phone": phone, **c}, default=str) + "\n")
+        n = args.count
+    elif args.db:
+        if args.load:
+            records = read_csv(args.load) if args.load.endswith(".csv") else read_jsonl(args.load)
+        else:
+            records = synth_customers(args.count)
+        n = SQLiteCustomerRepository(args.db).bulk_load(records)
+    else:
+        ap.error("one of --db or --jsonl is required")
+    elapsed = time.perf_counter() - t0
+    print(f"Wrote {n:,} customers in {elapsed:.1f}s ({n / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
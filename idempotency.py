@@ -0,0 +1,139 @@
+# idempotency.py — replay cache for Twilio webhook retries and duplicate deliveries
+#
+# Twilio re-sends a webhook when our answer is slow (or the connection
+# drops), and every retry used to run the whole turn again: another
+# generate_response, another LLM call, duplicate dashboard lines, a second
+# card block. IdempotencyMiddleware keys each webhook POST on
+#   (path, CallSid, I-Twilio-Idempotency-Token or a digest of the form body)
+# and keeps the first execution's outcome in a bounded TTL cache:
+#   - a retry arriving while the first execution runs waits for its result
+#   - a retry arriving afterwards gets the stored status/headers/TwiML bytes
+# Only 2xx responses are stored (and not those marked Cache-Control: no-store,
+# like load-shedding replies); if the first execution fails, waiting retries
+# run the turn themselves. The cache is per process, so with several
+# workers a retry that lands on another worker still runs (IDEMPOTENCY_TTL=0
+# turns the layer off).
+
+import asyncio
+import hashlib
+import os
+import re
+from typing import NamedTuple
+
+from metrics import REGISTRY
+from ttl_cache import TTLCache
+
+TOKEN_HEADER = b"i-twilio-idempotency-token"
+WEBHOOK_PATHS = ("/voice", "/get-phone", "/process", "/call-status", "/voice-stream")
+_CALL_SID = re.compile(rb"(?:^|&)CallSid=([^&]*)")
+
+REGISTRY.describe("bfsi_webhook_duplicates_total", "Webhook retries answered without re-running the turn, by state")
+
+
+class StoredResponse(NamedTuple):
+    status: int
+    headers: list
+    body: bytes
+
+
+class IdempotencyCache:
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("IDEMPOTENCY_TTL", 120))
+        self._entries = TTLCache(max_entries or int(os.getenv("IDEMPOTENCY_MAX", 10000)), self.ttl or 1)
+        self.stats = {"executed": 0, "waited": 0, "replayed": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def key(path: str, headers: list, body: bytes) -> tuple:
+        token = next((v for k, v in headers if k == TOKEN_HEADER), None)
+        m = _CALL_SID.search(body)
+        return path, m.group(1) if m else b"", token or hashlib.blake2b(body, digest_size=16).digest()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def begin(self, key) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._entries.set(key, future)
+        self.stats["executed"] += 1
+        return future
+
+    def finish(self, key, future: asyncio.Future, response: StoredResponse = None):
+        if response is None:
+            self.stats["failed"] += 1
+            self._entries.pop(key)
+        else:
+            self._entries.set(key, future)   # TTL counts from completion
+        future.set_result(response)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware: one execution per distinct webhook delivery on the listed paths."""
+
+    def __init__(self, app, cache: IdempotencyCache, paths=WEBHOOK_PATHS):
+        self.app = app
+        self.cache = cache
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths
+                or not self.cache.enabled):
+            return await self.app(scope, receive, send)
+        body = await _read_body(receive)
+        key = self.cache.key(scope["path"], scope["headers"], body)
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            state = "replayed" if entry.done() else "waited"
+            stored = await asyncio.shield(entry)
+            if stored is not None:
+                self.cache.stats[state] += 1
+                REGISTRY.inc("bfsi_webhook_duplicates_total", state=state)
+                await send({"type": "http.response.start", "status": stored.status, "headers": stored.headers})
+                await send({"type": "http.response.body", "body": stored.body})
+                return
+
+        future = self.cache.begin(key)
+        replayed = False
+
+        async def receive_body():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            self.cache.finish(key, future)
+            raise
+        ok = (start is not None and 200 <= start["status"] < 300
+              and (b"cache-control", b"no-store") not in start.get("headers", []))
+        self.cache.finish(key, future, StoredResponse(start["status"], list(start.get("headers", [])),
+                                                      b"".join(chunks)) if ok else None)
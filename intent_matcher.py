@@ -0,0 +1,163 @@
+# intent_matcher.py — compiled single-pass keyword intent matcher
+#
+# All intent keywords, expanded with their plural/tense word forms, are
+# compiled once into a single prefix-trie regex, so one scan over the
+# utterance yields every keyword hit with its position at a cost that does
+# not grow with keywords x intents. The winning intent is the
+# highest-priority hit, so a specific request ("block the card on my
+# account") is no longer swallowed by a generic word like "account".
+# Utterances with no keyword go to a second, statistical tier (intent_model.py,
+# INTENT_MODEL) once `load_model()` has run, before settling on fallback.
+
+import itertools
+import logging
+import os
+import re
+from typing import NamedTuple
+
+from metrics import REGISTRY
+
+log = logging.getLogger("intent_matcher")
+
+REGISTRY.describe("bfsi_intent_model_total", "Keyword misses scored by the n-gram model, by result (rescued or fallback)")
+
+# intent -> (priority, keywords). Higher priority wins when several intents match.
+INTENT_KEYWORDS = {
+    "card_block": (60, ["lost card", "stolen card", "block my card", "block card", "block the card",
+                        "hotlist", "deactivate card"]),
+    "update_contact": (50, ["update phone", "change number", "update mobile", "update email", "update contact",
+                            "change email", "change contact", "update address"]),
+    "escalation": (40, ["agent", "human", "representative", "talk to person"]),
+    "claim_status": (30, ["claim", "insurance", "policy", "coverage"]),
+    "emi_info": (20, ["emi", "loan", "due", "installment", "repayment"]),
+    "balance_inquiry": (10, ["balance", "account", "statement", "money", "funds"]),
+}
+
+# Word forms folded onto the keyword stem (was: text.replace("cards", "card") ...)
+NORMALISATIONS = {
+    "card": ["card", "cards"],
+    "block": ["block", "blocked", "blocking"],
+}
+
+FALLBACK = "fallback"
+
+# Clause boundaries for multi-intent turns ("what's my balance and when is my EMI due")
+_CLAUSE = re.compile(r"[,;?!]|\.\s|\b(?:and|also|then|plus)\b", re.IGNORECASE)
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    keyword: str
+    start: int
+    end: int
+    priority: int
+
+
+def _trie_regex(words) -> str:
+    """Prefix-factored alternation: the regex engine picks a branch per character."""
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        end = "" in node
+        alts = [(r"\s+" if ch == " " else re.escape(ch)) + emit(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if end else body
+
+    return emit(trie)
+
+
+class IntentMatcher:
+    def __init__(self, intent_keywords: dict = None, normalisations: dict = None):
+        intent_keywords = intent_keywords or INTENT_KEYWORDS
+        normalisations = normalisations or NORMALISATIONS
+        self._variants = {}  # surface form -> (intent, keyword, priority)
+        for intent, (priority, keywords) in intent_keywords.items():
+            for kw in keywords:
+                forms = [normalisations.get(w, [w]) for w in kw.split()]
+                for words in itertools.product(*forms):
+                    self._variants.setdefault(" ".join(words), (intent, kw, priority))
+        # Whole words plus plain inflections: "loans"/"claims"/"accounts" hit their stem,
+        # "emily"/"accountant"/"humane" do not
+        self._regex = re.compile(r"\b(" + _trie_regex(self._variants) + r")(?:s|es|ed|ing)?\b", re.IGNORECASE)
+        self.model = None
+
+    def load_model(self, path: str = None):
+        """Load the n-gram tier (INTENT_MODEL, "" disables); without it keyword misses stay fallback."""
+        path = path if path is not None else os.getenv("INTENT_MODEL", "data/intent_model.npz")
+        if not path or self.model is not None:
+            return self.model
+        try:
+            from intent_model import IntentModel
+            self.model = IntentModel.load(path)
+        except (ImportError, OSError) as e:
+            log.warning("intent model not loaded (%s); keyword tier only", e)
+        return self.model
+
+    def _lookup(self, surface: str):
+        return self._variants[" ".join(surface.lower().split())]
+
+    def match_all(self, text: str) -> list:
+        """Every keyword hit in the utterance, in order of position."""
+        out = []
+        for m in self._regex.finditer(text or ""):
+            intent, kw, priority = self._lookup(m.group(1))
+            out.append(IntentMatch(intent, kw, m.start(), m.end(), priority))
+        return out
+
+    def intents(self, text: str) -> list:
+        """Distinct matched intents, best first (priority, then earliest mention)."""
+        seen = {}
+        for m in self.match_all(text):
+            seen.setdefault(m.intent, m)
+        return [m.intent for m in sorted(seen.values(), key=lambda m: (-m.priority, m.start))]
+
+    def classify_keywords(self, text: str) -> str:
+        best = None
+        for surface in self._regex.findall(text or ""):
+            hit = self._lookup(surface)
+            if best is None or hit[2] > best[2]:
+                best = hit
+        return best[0] if best else FALLBACK
+
+    def classify(self, text: str) -> str:
+        intent = self.classify_keywords(text)
+        if intent != FALLBACK or self.model is None or not (text or "").strip():
+            return intent
+        intent = self.model.predict(text, FALLBACK)
+        REGISTRY.inc("bfsi_intent_model_total", result="fallback" if intent == FALLBACK else "rescued")
+        return intent
+
+    def split_intents(self, text: str) -> list:
+        """One intent per clause, in order of mention, without repeats or fallback.
+
+        Clauses are classified on their own so a generic word in one request
+        ("account") doesn't turn into a second intent, while two requests
+        joined by "and"/"also"/"," are both served. Falls back to the
+        whole-utterance intent (model tier included) when no clause has a keyword.
+        """
+        out = []
+        for clause in _CLAUSE.split(text or ""):
+            intent = self.classify_keywords(clause)
+            if intent != FALLBACK and intent not in out:
+                out.append(intent)
+        return out or [self.classify(text)]
+
+    def classify_batch(self, texts) -> list:
+        classify = self.classify_keywords
+        out = [classify(t) for t in texts]
+        if self.model is not None:
+            # Keyword misses are scored together in one model call
+            misses = [i for i, intent in enumerate(out) if intent == FALLBACK and (texts[i] or "").strip()]
+            for i, intent in zip(misses, self.model.predict_batch([texts[i] for i in misses], FALLBACK)):
+                out[i] = intent
+        return out
+
+
+MATCHER = IntentMatcher()
@@ -0,0 +1,200 @@
+# intent_model.py — second intent tier: hashed character n-grams, linear scoring
+#
+# The keyword tier only knows exact (stemmed) keywords, so ASR misspellings
+# ("blok my kard") and Hinglish ("card band kar do") land on the fallback
+# sentence and the caller has to try again. This tier scores those utterances
+# on character 2-4-grams:
+#   - text is lower-cased and reduced to letters/digits, padded with spaces
+#   - n-grams are hashed with a vectorised polynomial hash into 2**bits buckets
+#     (no vocabulary, so unseen words still share n-grams with known ones)
+#   - sublinear tf (1 + log count), L2-normalised
+#   - a softmax-regression weight matrix (trained offline, stored as .npz):
+#     scoring is one gather of weight rows and a weighted sum per utterance
+# An utterance is assigned only when its best probability reaches that
+# intent's floor (higher for card_block, whose false positives cost most) and
+# the best intent isn't "fallback" (small talk is trained as its own class).
+# Batches are hashed as one concatenated byte array and scored together, so
+# offline evaluation costs a few NumPy calls per batch.
+#
+#   python intent_model.py train data/intent_train.jsonl --out data/intent_model.npz
+#   python intent_model.py eval data/intent_noisy.jsonl
+
+import argparse
+import json
+import re
+import sys
+
+import numpy as np
+
+NGRAMS = (2, 3, 4)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_MULT = np.uint64(0x100000001B3)         # FNV-1a 64-bit prime, as a polynomial base
+_MIX = np.uint64(0x9E3779B97F4A7C15)     # Fibonacci hashing: high bits pick the bucket
+_SEP = 0                                 # byte separating utterances in a batch
+
+
+def normalise(text: str) -> bytes:
+    return (" " + _NON_ALNUM.sub(" ", (text or "").lower()).strip() + " ").encode()
+
+
+def hashed_ngrams(texts, bits: int):
+    """(doc index, bucket) for every character n-gram of every text, as two int arrays."""
+    encoded = [normalise(t) for t in texts]
+    data = np.frombuffer(bytes([_SEP]).join(encoded), dtype=np.uint8)
+    starts = np.cumsum([0] + [len(e) + 1 for e in encoded[:-1]])
+    codes = data.astype(np.uint64)
+    seps = np.concatenate(([0], np.cumsum(data == _SEP)))
+    docs, buckets = [], []
+    with np.errstate(over="ignore"):
+        for n in NGRAMS:
+            m = len(data) - n + 1
+            if m <= 0:
+                continue
+            h = np.full(m, n, dtype=np.uint64)
+            for k in range(n):
+                h = h * _MULT + codes[k:k + m]
+            valid = seps[n:n + m] - seps[:m] == 0   # n-grams that don't span two utterances
+            pos = np.flatnonzero(valid)
+            docs.append(np.searchsorted(starts, pos, side="right") - 1)
+            buckets.append(((h[pos] * _MIX) >> np.uint64(64 - bits)).astype(np.int64))
+    if not docs:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(docs), np.concatenate(buckets)
+
+
+# h = n * MULT**n + sum(code[k] * MULT**(n-1-k)): the hash above as one matmul over 4-byte windows
+_POWERS = np.array([[pow(int(_MULT), n - 1 - k, 1 << 64) if k < n else 0 for n in NGRAMS]
+                    for k in range(max(NGRAMS))], dtype=np.uint64)
+_SEEDS = np.array([n * pow(int(_MULT), n, 1 << 64) % (1 << 64) for n in NGRAMS], dtype=np.uint64)
+_PAD = bytes(max(NGRAMS) - 1)
+
+
+def _one_hashed(text: str, bits: int) -> np.ndarray:
+    """Buckets of one utterance's n-grams, same values as hashed_ngrams() without its batch bookkeeping."""
+    data = normalise(text)
+    codes = np.frombuffer(data + _PAD, dtype=np.uint8).astype(np.uint64)
+    windows = np.lib.stride_tricks.as_strided(codes, shape=(len(data), max(NGRAMS)), strides=(8, 8), writeable=False)
+    h = windows @ _POWERS + _SEEDS                   # (positions, len(NGRAMS))
+    # n-grams that run into the pad are dropped
+    h = np.concatenate([h[:max(0, len(data) - n + 1), i] for i, n in enumerate(NGRAMS)])
+    return (h * _MIX) >> np.uint64(64 - bits)
+
+
+def vectorise(texts, bits: int):
+    """Sparse L2-normalised sublinear-tf vectors as (doc, bucket, weight) triplets."""
+    docs, buckets = hashed_ngrams(texts, bits)
+    keys, counts = np.unique(docs * (1 << bits) + buckets, return_counts=True)
+    docs, buckets = keys >> bits, keys & ((1 << bits) - 1)
+    weights = 1.0 + np.log(counts)
+    norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=len(texts)))
+    return docs, buckets, weights / np.maximum(norms[docs], 1e-12)
+
+
+class IntentModel:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: list, bits: int, min_prob: np.ndarray):
+        self.weights = weights.astype(np.float32)      # (2**bits, intents)
+        self.bias = bias.astype(np.float32)
+        self.labels = list(labels)
+        self.bits = bits
+        self.min_prob = np.asarray(min_prob, dtype=np.float32)   # per intent
+
+    @classmethod
+    def train(cls, texts, labels, bits: int = 16, min_prob: float = 0.4, strict: dict = None,
+              epochs: int = 500, lr: float = 5.0, l2: float = 1e-4) -> "IntentModel":
+        """Softmax regression by full-batch gradient descent on the hashed features."""
+        names = sorted(set(labels))
+        index = {name: i for i, name in enumerate(names)}
+        docs, buckets, x = vectorise(texts, bits)
+        target = np.eye(len(names))[[index[l] for l in labels]]
+        weights, bias = np.zeros((1 << bits, len(names))), np.zeros(len(names))
+        for _ in range(epochs):
+            grad = (_softmax(_logits(docs, buckets, x, weights, bias, len(texts))) - target) / len(texts)
+            for c in range(len(names)):
+                weights[:, c] -= lr * (np.bincount(buckets, grad[docs, c] * x, minlength=1 << bits) + l2 * weights[:, c])
+            bias -= lr * grad.sum(axis=0)
+        floors = [(strict or {}).get(name, min_prob) for name in names]
+        return cls(weights, bias, names, bits, floors)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path) as f:
+            return cls(f["weights"], f["bias"], [str(l) for l in f["labels"]], int(f["bits"]), f["min_prob"])
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels),
+                            bits=self.bits, min_prob=self.min_prob)
+
+    def probabilities(self, texts) -> np.ndarray:
+        """(len(texts), intents) softmax probabilities."""
+        docs, buckets, x = vectorise(texts, self.bits)
+        return _softmax(_logits(docs, buckets, x, self.weights, self.bias, len(texts)))
+
+    def predict_batch(self, texts, fallback: str = "fallback") -> list:
+        if not texts:
+            return []
+        p = self.probabilities(texts)
+        best = p.argmax(axis=1)
+        sure = p[np.arange(len(texts)), best] >= self.min_prob[best]
+        return [self.labels[b] if ok else fallback for b, ok in zip(best, sure)]
+
+    def predict(self, text: str, fallback: str = "fallback") -> str:
+        # Per-turn path: one utterance, no batching overhead
+        buckets, counts = np.unique(_one_hashed(text, self.bits), return_counts=True)
+        x = 1.0 + np.log(counts.astype(np.float32))
+        z = (x / np.sqrt(x @ x)) @ self.weights[buckets] + self.bias
+        best = int(z.argmax())
+        p = 1.0 / np.exp(z - z[best]).sum()
+        return self.labels[best] if p >= self.min_prob[best] else fallback
+
+
+def _logits(docs, buckets, x, weights, bias, n: int) -> np.ndarray:
+    # docs is sorted and every utterance has at least one n-gram (the padding)
+    starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    return np.add.reduceat(weights[buckets] * x[:, None].astype(weights.dtype), starts, axis=0) + bias
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    e = np.exp(z - z.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r["text"] for r in rows], [r["intent"] for r in rows]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("train", help="fit the weights on a labelled JSONL file ({text, intent} per line)")
+    t.add_argument("corpus")
+    t.add_argument("--out", default="data/intent_model.npz")
+    t.add_argument("--bits", type=int, default=16)
+    t.add_argument("--min-prob", type=float, default=0.4, help="below this the utterance stays fallback")
+    t.add_argument("--strict", nargs="*", default=["card_block=0.6"], metavar="INTENT=P",
+                   help="higher floors for intents whose false positives are costly")
+    e = sub.add_parser("eval", help="accuracy of the model alone on a labelled JSONL file")
+    e.add_argument("corpus")
+    e.add_argument("--model", default="data/intent_model.npz")
+    args = ap.parse_args()
+
+    if args.cmd == "train":
+        texts, labels = _read(args.corpus)
+        strict = {k: float(v) for k, v in (item.split("=") for item in args.strict)}
+        model = IntentModel.train(texts, labels, args.bits, args.min_prob, strict)
+        model.save(args.out)
+        train_acc = np.mean([p == l for p, l in zip(model.predict_batch(texts), labels)])
+        print(f"{len(texts)} utterances, {len(model.labels)} intents, 2**{args.bits} buckets -> {args.out} "
+              f"(training accuracy {train_acc:.1%})")
+    else:
+        texts, labels = _read(args.corpus)
+        predicted = IntentModel.load(args.model).predict_batch(texts)
+        wrong = [(t, l, p) for t, l, p in zip(texts, labels, predicted) if p != l]
+        print(f"accuracy {1 - len(wrong) / len(texts):.1%} on {len(texts)} utterances")
+        for t, l, p in wrong:
+            print(f"  {t!r}: expected {l}, got {p}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# llm_stub.py — offline stand-ins for the OpenAI client
+#
+# Same surface as `client.responses.create(...).output_text`, with a
+# configurable latency and failure rate so the rephrase layer, load tests
+# and benchmarks can run without network access. Enable in the apps with
+# OPENAI_STUB=1 (optionally OPENAI_STUB_LATENCY_MS=800).
+
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+
+
+def _rephrase(prompt: str) -> str:
+    msg = prompt.split(": ", 1)[-1]
+    return f"Sure! {msg}"
+
+
+class _Responses:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def _result(self, input):
+        self._owner.calls += 1
+        if self._owner.failure_rate and random.random() < self._owner.failure_rate:
+            raise RuntimeError("stub LLM failure")
+        return SimpleNamespace(output_text=_rephrase(input))
+
+
+class _SyncResponses(_Responses):
+    def create(self, model=None, input="", **kwargs):
+        time.sleep(self._owner.latency)
+        return self._result(input)
+
+
+class _AsyncResponses(_Responses):
+    async def create(self, model=None, input="", **kwargs):
+        await asyncio.sleep(self._owner.latency)
+        return self._result(input)
+
+
+class StubOpenAI:
+    """Blocking client, like `openai.OpenAI`."""
+    _responses_cls = _SyncResponses
+
+    def __init__(self, latency: float = None, failure_rate: float = 0.0):
+        self.latency = latency if latency is not None else float(os.getenv("OPENAI_STUB_LATENCY_MS", 300)) / 1000
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.responses = self._responses_cls(self)
+
+
+class AsyncStubOpenAI(StubOpenAI):
+    """Async client, like `openai.AsyncOpenAI`."""
+    _responses_cls = _AsyncResponses
@@ -0,0 +1,231 @@
+# loadtest.py — simulated Twilio callers against an in-process app
+#
+# Each caller walks the real webhook sequence
+#   /voice -> /get-phone -> /process x k -> /call-status
+# with Twilio-style form payloads, against the ASGI app in this process. The
+# OpenAI client and the dashboard are replaced by local stand-ins with
+# configurable latency, so results only reflect our own code.
+#
+#   python loadtest.py --app app_bfsi --callers 200 --turns 3 --out results.json
+#
+# Reports p50/p95/p99 per endpoint, throughput and event-loop blocked time as
+# JSON, so runs can be compared between commits. Every delivery carries its
+# own I-Twilio-Idempotency-Token, as Twilio's do; --retry-rate re-sends that
+# fraction of /process deliveries (same token) --retry-after-ms later, the way
+# Twilio retries a slow webhook, and times them as "/process (retry)".
+# Replies shed by admission control are timed separately ("/process (shed)").
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import uuid
+
+import httpx
+
+UTTERANCES = [
+    "what's my balance", "block my card", "when is my next EMI due", "what's my claim status",
+    "how much money do I have", "I lost my card", "loan repayment date", "is my policy active",
+    "update email", "talk to an agent", "hello",
+]
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+def summarise(samples):
+    s = sorted(samples)
+    return {
+        "count": len(s),
+        "p50_ms": round(percentile(s, 0.50), 3),
+        "p95_ms": round(percentile(s, 0.95), 3),
+        "p99_ms": round(percentile(s, 0.99), 3),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+class LoopMonitor:
+    """Measures how long the event loop was unable to run a periodic tick."""
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - t0 - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def stub_dashboard(latency: float, failure: bool):
+    async def handler(request):
+        await asyncio.sleep(latency)
+        if failure:
+            raise httpx.ConnectError("dashboard down")
+        return httpx.Response(200, json={"ok": True})
+    return httpx.MockTransport(handler)
+
+
+def load_app(name: str, args):
+    # Stand-ins must be configured before the app module builds its clients
+    os.environ["OPENAI_STUB"] = "1"
+    os.environ["OPENAI_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ.setdefault("DASHBOARD_URL", "http://dashboard.stub")
+    os.environ.setdefault("BACKEND_URL", "http://backend.stub")
+    # Nothing the run writes lands in the working tree: no journal, scratch action log / dialer DB / feed lock
+    scratch = tempfile.mkdtemp()
+    os.environ.setdefault("CONVERSATION_JOURNAL", "")
+    os.environ.setdefault("ACTION_LOG", os.path.join(scratch, "actions.log"))
+    os.environ.setdefault("DIALER_DB", os.path.join(scratch, "campaigns.db"))
+    os.environ.setdefault("FEED_LOCK", os.path.join(scratch, "conversation_feed.lock"))
+    module = importlib.import_module(name)
+    module.event_bus._transport = stub_dashboard(args.dashboard_latency_ms / 1000, args.dashboard_down)
+    return module
+
+
+async def caller(client, timings, errors, phone: str, turns: int, rng: random.Random,
+                 retry_rate: float = 0.0, retry_after: float = 0.0):
+    call_sid = "CA" + uuid.uuid4().hex
+    spoken = " ".join(phone[-10:])
+
+    async def post(path, token=None, label=None, **form):
+        t0 = time.perf_counter()
+        headers = {"I-Twilio-Idempotency-Token": token or uuid.uuid4().hex}
+        try:
+            r = await client.post(path, data={"CallSid": call_sid, **form}, headers=headers)
+            r.raise_for_status()
+            if r.headers.get("x-load-shed"):
+                label = (label or path) + " (shed)"
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+        finally:
+            timings.setdefault(label or path, []).append((time.perf_counter() - t0) * 1000)
+
+    async def retry(token, **form):
+        await asyncio.sleep(retry_after)
+        await post("/process", token=token, label="/process (retry)", **form)
+
+    await post("/voice", From=phone, CallStatus="ringing")
+    await post("/get-phone", SpeechResult=spoken)
+    for _ in range(turns):
+        form, token = {"SpeechResult": rng.choice(UTTERANCES)}, uuid.uuid4().hex
+        if rng.random() < retry_rate:
+            await asyncio.gather(post("/process", token=token, **form), retry(token, **form))
+        else:
+            await post("/process", token=token, **form)
+    await post("/call-status", CallStatus="completed")
+
+
+async def run(args) -> dict:
+    module = load_app(args.app, args)
+    app = module.app
+    rng = random.Random(args.seed)
+    timings, errors = {}, []
+    monitor = LoopMonitor()
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            sem = asyncio.Semaphore(args.callers)
+
+            async def one(i):
+                if args.arrival_rate:
+                    # Open loop: calls keep arriving on schedule however slow the app gets
+                    await asyncio.sleep(i / args.arrival_rate)
+                async with sem:
+                    await caller(client, timings, errors, args.phone, args.turns, rng,
+                                 args.retry_rate, args.retry_after_ms / 1000)
+
+            # Warm-up calls pay for lazy imports and cache fills; cold start is not what we measure here
+            t0 = time.perf_counter()
+            for _ in range(args.warmup):
+                await caller(client, {}, errors, args.phone, args.turns, rng)
+            warmup_ms = (time.perf_counter() - t0) * 1000
+
+            monitor.start()
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.calls or args.callers)))
+            elapsed = time.perf_counter() - t0
+            await monitor.stop()
+
+    requests = sum(len(v) for v in timings.values())
+    return {
+        "commit": _git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "warmup_ms": round(warmup_ms, 1),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "calls_per_s": round((args.calls or args.callers) / elapsed, 1),
+        "endpoints": {path: summarise(v) for path, v in timings.items()},
+        "side_effects": {"dashboard_events": module.event_bus.stats["published"],
+                         "llm_provider_calls": module.logic.rephraser.stats["provider_calls"],
+                         "idempotency": module.webhook_replays.stats if hasattr(module, "webhook_replays") else None,
+                         "admission": module.admission.snapshot() if hasattr(module, "admission") else None},
+        "event_loop": {"blocked_ms": round(monitor.blocked * 1000, 1), "max_lag_ms": round(monitor.max_lag * 1000, 1)},
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--app", default="app_bfsi", help="module exposing the FastAPI `app` (app_bfsi or main)")
+    ap.add_argument("--callers", type=int, default=100, help="concurrent callers")
+    ap.add_argument("--calls", type=int, default=0, help="total calls (default: one per caller)")
+    ap.add_argument("--arrival-rate", type=float, default=0, help="start calls at this rate per second (default: all at once)")
+    ap.add_argument("--turns", type=int, default=3, help="/process turns per call")
+    ap.add_argument("--warmup", type=int, default=1, help="unmeasured calls before the run")
+    ap.add_argument("--phone", default="+919876543210")
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--dashboard-latency-ms", type=float, default=50)
+    ap.add_argument("--dashboard-down", action="store_true", help="make every dashboard push fail")
+    ap.add_argument("--retry-rate", type=float, default=0.0, help="share of /process deliveries Twilio retries")
+    ap.add_argument("--retry-after-ms", type=float, default=200, help="delay before the retried delivery")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write JSON results to this file")
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,48 @@
 # main.py — Unified BFSI Voice Agent with Twilio + OpenAI + Dashboard
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import Response, JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, Form, WebSocket
+from fastapi.responses import Response, JSONResponse, HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from twilio.rest import Client
 from datetime import datetime
 from pathlib import Path
+from functools import lru_cache
 from business_logic_bfsi import BFSIBusinessLogic
-import os, requests, logging
+from dashboard_bus import DashboardBus
+from session_store import make_session_store, TERMINAL_CALL_STATUSES
+from metrics import REGISTRY, TurnMetricsMiddleware, stage, stage_ms
+from idempotency import IdempotencyCache, IdempotencyMiddleware
+from admission import AdmissionController, AdmissionMiddleware
+from phone_normalizer import parse_spoken_phone, MIN_CONFIDENCE as PHONE_MIN_CONFIDENCE
+from media_stream import StreamSession, stream_twiml, BRIDGE_URL as STREAM_BRIDGE_URL
+import twiml_templates as twiml
+from conversation_feed import ConversationFeed
+from conversation_journal import make_journal
+from dialer import make_dialer, get_twilio_client, campaign_targets, CAMPAIGN_INTENTS
+import asyncio, hmac, os, logging
 
 BASE_DIR = Path(__file__).resolve().parent
 app = FastAPI(title="BFSI Voice Agent Unified")
+# Innermost: each webhook turn is admitted at a degradation level, or shed (ADMISSION_INFLIGHT, ADMISSION_TURN_MS)
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(TurnMetricsMiddleware)
+# Outermost: Twilio retries of a turn get the first execution's TwiML (IDEMPOTENCY_TTL, IDEMPOTENCY_MAX)
+webhook_replays = IdempotencyCache()
+app.add_middleware(IdempotencyMiddleware, cache=webhook_replays)
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+
+@lru_cache(maxsize=1)
+def get_templates():
+    """Jinja is only needed for the dashboard page, not for Twilio webhooks."""
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory=BASE_DIR / "templates")
 
 logic = BFSIBusinessLogic()
 
 # --- In-memory store ---
-chat_log = []
-conversations = {}
+# Recent window in memory; full history in the on-disk journal if CONVERSATION_JOURNAL is set
+journal = make_journal()
+chat_log = ConversationFeed(window=int(os.getenv("CONVERSATION_WINDOW", 5000)), journal=journal)
+conversations = make_session_store()  # SESSION_STORE=memory | sqlite:///path for multi-worker
 demo_data = {
     "name": "Aarav Sharma",
     "phone": "+91XXXXXXXXXX",
@@ -36,39 +59,99 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 YOUR_PHONE_NUMBER = os.getenv("YOUR_PHONE_NUMBER")
 BACKEND_URL = os.getenv("BACKEND_URL", os.getenv("RENDER_EXTERNAL_URL", "http://localhost:8000"))
 DASHBOARD_URL = os.getenv("DASHBOARD_URL", BACKEND_URL)
+event_bus = DashboardBus(DASHBOARD_URL)
+# Only forward when the dashboard is a separate service, not this app
+FORWARD_EVENTS = DASHBOARD_URL.rstrip("/") != BACKEND_URL.rstrip("/")
+CAMPAIGN_TOKEN = os.getenv("CAMPAIGN_TOKEN", "")  # unset: no dialer, the campaign routes are disabled
+# Outbound campaigns (DIALER_DB, DIALER_CPS, DIALER_CONCURRENCY)
+dialer = make_dialer(backend_url=BACKEND_URL) if CAMPAIGN_TOKEN else None
+
+# Per-app TwiML, rendered once (see twiml_templates.py)
+NEED_PHONE = twiml.static(twiml.ask_phone("Please say your mobile number.", preamble="I need your verified number first."))
+IDENTIFIED = twiml.TwimlTemplate(twiml.identified(
+    "How can I help you today? Ask about balance, blocking a card, EMI, claim status, or contact update."))
+
+REGISTRY.gauge("bfsi_dashboard_queue_depth", event_bus.depth)
+REGISTRY.gauge("bfsi_sessions", lambda: len(conversations))
+REGISTRY.gauge("bfsi_rephrase_cache_entries", lambda: len(logic.rephraser.cache))
+REGISTRY.gauge("bfsi_prefetched_calls", lambda: len(logic.prefetch))
+REGISTRY.gauge("bfsi_idempotency_entries", lambda: len(webhook_replays))
+REGISTRY.gauge("bfsi_inflight_turns", lambda: admission.inflight)
+REGISTRY.gauge("bfsi_admission_level", lambda: admission.level())
+REGISTRY.gauge("bfsi_sse_subscribers", chat_log.subscriber_count)
+if dialer:
+    REGISTRY.gauge("bfsi_dialer_calls_in_progress", dialer.in_progress)
+
+@app.on_event("startup")
+async def startup():
+    await event_bus.start()
+    logic.customers.open()   # claim this worker's action log slot and replay it
+    # Warm the rephrase cache for fixed texts without delaying startup
+    app.state.prewarm = asyncio.create_task(logic.prewarm())
+    if not FORWARD_EVENTS or journal:
+        # This process numbers the events dashboards read or the journal keeps: one worker only
+        chat_log.claim()
+    if journal:
+        app.state.journal_maintenance = asyncio.create_task(journal.run_maintenance())
+    if dialer:
+        # Runs (and resumes) campaigns in whichever worker holds the dialer lock
+        app.state.dialer = asyncio.create_task(dialer.supervise())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if dialer:
+        app.state.dialer.cancel()
+        dialer.stop()
+    await event_bus.stop()
+    await logic.customers.aclose()
+    chat_log.release()
+    if journal:
+        journal.close()
 
 # === Helper ===
-def push_to_dashboard(role: str, text: str):
-    chat_log.append({"role": role, "text": text})
-    try:
-        requests.post(f"{DASHBOARD_URL}/conversation", json={"role": role, "text": text}, timeout=2)
-    except Exception:
-        pass
+def push_to_dashboard(role: str, text: str, call_sid: str = None, **fields):
+    # Extra fields (kind, status, llm_ms) are for call_analytics.py; None values are left out
+    with stage("dashboard_push"):
+        event = chat_log.append({"role": role, "text": text, "call_sid": call_sid,
+                                 **{k: v for k, v in fields.items() if v is not None}})
+        if FORWARD_EVENTS:
+            event_bus.publish(event)
+
+def campaigns_forbidden(request: Request):
+    """403 unless the request carries "Authorization: Bearer $CAMPAIGN_TOKEN"."""
+    token = request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not dialer or not hmac.compare_digest(token.encode(), CAMPAIGN_TOKEN.encode()):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
 
 # ===============================================================
 # 🖥️ DASHBOARD ROUTES
 # ===============================================================
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "chat_log": chat_log, "demo_data": demo_data})
+    return get_templates().TemplateResponse("index.html", {"request": request, "chat_log": chat_log.events, "demo_data": demo_data})
 
 @app.get("/conversation")
-async def get_conversation():
-    return JSONResponse({"chat": chat_log})
+async def get_conversation(since: int = 0, call_sid: str = None, limit: int = 500):
+    return JSONResponse({"chat": chat_log.since(since, call_sid, limit), "cursor": chat_log.cursor})
+
+@app.get("/conversation/stream")
+async def stream_conversation(request: Request, call_sid: str = None, since: int = None):
+    return chat_log.sse_response(request, call_sid, since)
 
 @app.post("/conversation")
 async def add_conversation(request: Request):
     payload = await request.json()
-    chat_log.append(payload)
-    return JSONResponse({"ok": True})
+    # The dashboard bus posts batches as {"events": [...]}
+    events = payload.get("events", [payload]) if isinstance(payload, dict) else payload
+    return JSONResponse({"ok": True, "count": chat_log.extend(events)})
 
 @app.get("/start-call")
 async def start_call():
-    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, YOUR_PHONE_NUMBER]):
+    if not os.getenv("TWILIO_STUB") and not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, YOUR_PHONE_NUMBER]):
         return JSONResponse({"error": "Missing Twilio credentials"}, status_code=500)
     try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        call = client.calls.create(
+        call = await asyncio.to_thread(
+            get_twilio_client().calls.create,
             to=YOUR_PHONE_NUMBER,
             from_=TWILIO_PHONE_NUMBER,
             url=f"{BACKEND_URL}/voice",
@@ -76,111 +159,185 @@ async def start_call():
             status_callback_event=["initiated", "ringing", "answered", "completed"],
             method="POST"
         )
-        push_to_dashboard("system", f"📞 Outbound call initiated — SID: {call.sid}")
+        push_to_dashboard("system", f"📞 Outbound call initiated — SID: {call.sid}", call.sid)
         return JSONResponse({"status": "success", "sid": call.sid})
     except Exception as e:
         logging.exception("start-call failed")
         return JSONResponse({"error": str(e)}, status_code=500)
 
+@app.post("/campaigns")
+async def create_campaign(request: Request):
+    """{"kind": "emi" | "claim", "limit": 50000, "name": "emi-2025-11"} -> dial every matching customer."""
+    if denied := campaigns_forbidden(request):
+        return denied
+    payload = await request.json()
+    kind = payload.get("kind", "emi")
+    name = payload.get("name") or f"{kind}-{datetime.now():%Y%m%d-%H%M%S}"
+    try:
+        phones = await asyncio.to_thread(campaign_targets, logic.customers, kind, payload.get("limit"))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    added = await asyncio.to_thread(dialer.store.add, name, phones, kind)
+    if dialer.owner:
+        dialer.start(name)   # otherwise the owning worker picks it up on its next check
+    return JSONResponse({"campaign": name, "targets": len(phones), "added": added})
+
+@app.get("/campaigns/{name}")
+async def campaign_status(request: Request, name: str):
+    if denied := campaigns_forbidden(request):
+        return denied
+    jobs = await asyncio.to_thread(dialer.store.counts, name)
+    outcomes = await asyncio.to_thread(dialer.store.outcomes, name)
+    running = any(jobs.get(s) for s in ("pending", "dialing", "ringing"))
+    return {"campaign": name, "running": running, "jobs": jobs, "outcomes": outcomes, "dialer": dialer.stats}
+
 # ===============================================================
 # 📞 TWILIO VOICE ROUTES
 # ===============================================================
 @app.post("/voice")
 async def voice(request: Request):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid", "SIM-" + datetime.now().isoformat())
-    conversations[call_sid] = {"phone": None, "history": []}
-
-    vr = VoiceResponse()
-    vr.say("Welcome to your bank's AI voice assistant.", voice="Polly.Joanna", language="en-IN")
-
-    g = Gather(
-        input="speech",
-        action="/get-phone",
-        method="POST",
-        timeout=8,
-        speech_timeout="auto",
-        hints="zero one two three four five six seven eight nine",
-        enhanced=True,
-        language="en-IN"
-    )
-    g.say("Please say your 10 digit mobile number.", voice="Polly.Joanna")
-    vr.append(g)
-    vr.say("I didn't catch that. Please call again. Goodbye!")
-    return Response(str(vr), media_type="application/xml")
+    with stage("session"):
+        conversations.set(call_sid, {"phone": None, "history": []})
+
+    with stage("twiml"):
+        body = twiml.VOICE_WELCOME
+    return Response(body, media_type="application/xml")
 
 @app.post("/get-phone")
 async def get_phone(request: Request, SpeechResult: str = Form(None)):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid")
-    said = (SpeechResult or "").lower().replace(" ", "")
-    digits = "".join(ch for ch in said if ch.isdigit())
-    phone = "+91" + digits[-10:] if len(digits) >= 10 else None
+    with stage("session"):
+        partial = (conversations.get(call_sid) or {}).get("phone_partial", "")
+    with stage("normalise_phone"):
+        parsed = parse_spoken_phone(SpeechResult, partial)
+    phone = parsed.phone if parsed.confidence >= PHONE_MIN_CONFIDENCE else None
+    REGISTRY.inc("bfsi_phone_capture_total", result="identified" if phone else "reprompt")
 
-    vr = VoiceResponse()
     if not phone:
-        g = Gather(input="speech", action="/get-phone", method="POST",
-                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-        g.say("Sorry, I couldn't understand. Please say your mobile number clearly.")
-        vr.append(g)
-        return Response(str(vr), media_type="application/xml")
+        # Keep a short capture so the caller only has to say the rest
+        partial = parsed.digits if parsed.phone is None else ""
+        with stage("session"):
+            conversations.update(call_sid, phone_partial=partial)
+        push_to_dashboard("system", "🔁 Phone number not caught, asked again", call_sid, kind="phone_reprompt")
+        with stage("twiml"):
+            body = twiml.PHONE_PARTIAL.render(count=len(partial)) if partial else twiml.PHONE_RETRY
+        return Response(body, media_type="application/xml")
 
-    conversations.setdefault(call_sid, {})["phone"] = phone
+    with stage("session"):
+        conversations.update(call_sid, phone=phone, phone_partial="")
+    # Speculatively render read-only answers while the caller hears the prompt
+    logic.prefetch.start(call_sid, phone)
     demo_data["phone"] = phone  # ✅ update top panel
-    push_to_dashboard("system", f"User identified: {phone}")
+    push_to_dashboard("system", f"User identified: {phone}", call_sid)
 
-    vr.say(f"Thanks. I have your number as {phone}.", voice="Polly.Joanna", language="en-IN")
-    g = Gather(input="speech", action="/process", method="POST",
-               timeout=10, speech_timeout="auto", enhanced=True, language="en-IN")
-    g.say("How can I help you today? Ask about balance, blocking a card, EMI, claim status, or contact update.")
-    vr.append(g)
-    vr.say("I didn't hear anything. Goodbye!")
-    return Response(str(vr), media_type="application/xml")
+    with stage("twiml"):
+        body = IDENTIFIED.render(phone=phone)
+    return Response(body, media_type="application/xml")
 
 @app.post("/process")
 async def process(request: Request, SpeechResult: str = Form(None)):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_sid = form.get("CallSid")
     user_text = (SpeechResult or "").strip()
-    phone = conversations.get(call_sid, {}).get("phone")
+    with stage("session"):
+        phone = conversations.phone(call_sid)
 
-    vr = VoiceResponse()
     if not phone:
-        vr.say("I need your verified number first.", voice="Polly.Joanna")
-        g = Gather(input="speech", action="/get-phone", method="POST",
-                   timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-        g.say("Please say your mobile number.")
-        vr.append(g)
-        return Response(str(vr), media_type="application/xml")
+        with stage("twiml"):
+            body = NEED_PHONE
+        return Response(body, media_type="application/xml")
 
-    push_to_dashboard("user", user_text or "(no speech)")
+    push_to_dashboard("user", user_text or "(no speech)", call_sid)
 
-    answer = logic.generate_response(phone, user_text)
-    push_to_dashboard("agent", answer)
+    # classify_intent / find_customer / rephrase stages are timed inside
+    answer = await logic.generate_response(phone, user_text, call_sid)
+    push_to_dashboard("agent", answer, call_sid, llm_ms=stage_ms("rephrase"))
 
     # if user blocked a card, update UI
     if "block" in user_text.lower():
         demo_data["card_status"] = "Blocked"
 
-    vr.say(answer, voice="Polly.Joanna", language="en-IN")
-    g = Gather(input="speech", action="/process", method="POST",
-               timeout=8, speech_timeout="auto", enhanced=True, language="en-IN")
-    g.say("Anything else?")
-    vr.append(g)
-    vr.say("Thank you for calling. Goodbye!")
-    return Response(str(vr), media_type="application/xml")
+    with stage("twiml"):
+        body = twiml.ANSWER.render(answer=answer)
+    return Response(body, media_type="application/xml")
+
+@app.post("/campaign-voice")
+async def campaign_voice(request: Request):
+    """An answered campaign call: the reminder for the customer dialled, then the usual questions."""
+    with stage("parse_form", since_start=True):
+        form = await request.form()
+    call_sid = form.get("CallSid")
+    with stage("session"):
+        target = await asyncio.to_thread(dialer.store.call_target, call_sid) if dialer and call_sid else None
+    if target is None:
+        # Not a call the dialer placed: identify the caller as on an inbound call
+        return await voice(request)
+    kind, phone = target
+    with stage("session"):
+        conversations.set(call_sid, {"phone": phone, "history": []})
+    logic.prefetch.start(call_sid, phone)
+    reminder = logic.handle(CAMPAIGN_INTENTS[kind], phone)["message"]
+    push_to_dashboard("system", f"User identified: {phone}", call_sid)
+    push_to_dashboard("agent", reminder, call_sid)
+    with stage("twiml"):
+        body = twiml.ANSWER.render(answer=f"Hello, this is your bank calling. {reminder}")
+    return Response(body, media_type="application/xml")
+
+@app.post("/voice-stream")
+async def voice_stream(request: Request):
+    """Streaming mode: hand the call to the speech bridge (and /media-stream) instead of <Gather> turns."""
+    with stage("parse_form", since_start=True):
+        form = await request.form()
+    with stage("session"):
+        phone = conversations.phone(form.get("CallSid"))  # carried over if /get-phone already ran
+    with stage("twiml"):
+        if STREAM_BRIDGE_URL:
+            body = stream_twiml(phone=phone)
+        else:
+            # No speech bridge configured: carry on with <Gather> turns
+            body = IDENTIFIED.render(phone=phone) if phone else twiml.VOICE_WELCOME
+    return Response(body, media_type="application/xml")
+
+@app.websocket("/media-stream")
+async def media_stream(websocket: WebSocket):
+    if not STREAM_BRIDGE_URL:
+        await websocket.close(code=1008)
+        return
+    await StreamSession(websocket, logic, conversations, push_to_dashboard).run()
 
 @app.post("/call-status")
 async def call_status(request: Request):
-    form = await request.form()
+    with stage("parse_form", since_start=True):
+        form = await request.form()
     call_status = form.get("CallStatus")
-    push_to_dashboard("system", f"📞 Call status: {call_status}")
+    push_to_dashboard("system", f"📞 Call status: {call_status}", form.get("CallSid"),
+                      kind="call_status", status=call_status)
+    if call_status in TERMINAL_CALL_STATUSES:
+        with stage("session"):
+            conversations.delete(form.get("CallSid"))
+            logic.prefetch.drop(form.get("CallSid"))
+            if dialer:
+                await dialer.record_outcome(form.get("CallSid"), call_status)
     return JSONResponse({"ok": True, "status": call_status})
 
 # ===============================================================
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "dashboard": {**event_bus.stats, "queue_depth": event_bus.depth()},
+            "sessions": conversations.stats(), "idempotency": webhook_replays.stats,
+            "admission": admission.snapshot(),
+            "rephrase": {**logic.rephraser.stats, "cache": logic.rephraser.cache.stats,
+                         "breaker_open": logic.rephraser.breaker_open}}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/debug")
 async def debug():
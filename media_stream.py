@@ -0,0 +1,210 @@
+# media_stream.py — streaming call mode over a Twilio bidirectional Media Stream
+#
+# Opt-in (STREAM_BRIDGE_URL): Twilio Media Streams only carry audio (media,
+# mark and clear frames), so this mode needs an external speech bridge that
+# this repo does not ship. Twilio streams the call to the bridge, and the
+# bridge relays Twilio's connected/start/mark/stop events to /media-stream
+# along with its recogniser's transcripts:
+#   {"event": "transcript", "transcript": {"text": "...", "final": false}}
+# and synthesises the text of our "response" frames into audio for Twilio.
+# Unset, /voice-stream falls back to the <Gather> flow and /media-stream
+# refuses connections. With the bridge, no turn waits for
+# speech_timeout="auto" silence detection or a webhook round trip.
+# Partial hypotheses are classified as they arrive, by keywords only (the
+# n-gram model scores the final transcript). Once a read-only intent has held
+# for STREAM_STABLE_PARTIALS partials its answer (usually already
+# prefetched) is streamed back straight away, one sentence per
+#   {"event": "response", "streamSid": ..., "text": "...", "last": false}
+# before the caller has finished speaking. State-changing intents (card block,
+# contact update) only ever run on the final transcript; if the final
+# transcript means something else, a Twilio "clear" event drops the early
+# answer before the right one is sent. Each turn ends with a mark event.
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from starlette.websockets import WebSocketDisconnect
+from twilio.twiml.voice_response import Connect, VoiceResponse
+
+from intent_matcher import MATCHER, FALLBACK
+from metrics import REGISTRY
+from phone_normalizer import parse_spoken_phone, MIN_CONFIDENCE as PHONE_MIN_CONFIDENCE
+from prefetch import READ_ONLY_INTENTS
+from twiml_templates import TwimlTemplate, slot
+
+log = logging.getLogger("media_stream")
+
+STABLE_PARTIALS = int(os.getenv("STREAM_STABLE_PARTIALS", 2))
+BRIDGE_URL = os.getenv("STREAM_BRIDGE_URL", "")   # wss:// URL of the STT/TTS bridge; unset: streaming mode is off
+GREETING = "How can I help you today? You can ask about balance, blocking a card, EMI, claim status, or contact update."
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+REGISTRY.describe("bfsi_stream_answers_total", "Streamed answers by how they were produced (early, final, corrected)")
+REGISTRY.describe("bfsi_stream_answer_lead_seconds", "How long before the final transcript an early answer was ready")
+
+
+def _stream_doc(with_phone: bool) -> VoiceResponse:
+    vr = VoiceResponse()
+    connect = Connect()
+    stream = connect.stream(url=slot("url"))
+    if with_phone:
+        stream.parameter(name="phone", value=slot("phone"))
+    vr.append(connect)
+    return vr
+
+
+_STREAM = TwimlTemplate(_stream_doc(False))
+_STREAM_WITH_PHONE = TwimlTemplate(_stream_doc(True))
+
+
+def stream_twiml(phone: str = None) -> bytes:
+    """TwiML handing the call over to the speech bridge, passing the phone if already known."""
+    if phone:
+        return _STREAM_WITH_PHONE.render(url=BRIDGE_URL, phone=phone)
+    return _STREAM.render(url=BRIDGE_URL)
+
+
+class StreamSession:
+    """One call's media stream: phone capture, then incremental intent detection per utterance."""
+
+    def __init__(self, websocket, logic, sessions, publish, stable_partials: int = STABLE_PARTIALS):
+        self.ws = websocket
+        self.logic = logic
+        self.sessions = sessions
+        self.publish = publish          # publish(role, text, call_sid)
+        self.stable_partials = stable_partials
+        self.stream_sid = self.call_sid = self.phone = None
+        self.phone_partial = ""
+        self.audio_frames = 0
+        self.turn = 0
+        self._reset_turn()
+
+    def _reset_turn(self):
+        self.candidate, self.streak = None, 0
+        self.early = None               # (intent, task) for a speculative answer
+        self.early_sent = False
+        self.early_ready_at = None
+
+    async def run(self):
+        await self.ws.accept()
+        try:
+            while True:
+                event = json.loads(await self.ws.receive_text())
+                kind = event.get("event")
+                if kind == "start":
+                    await self.on_start(event["start"])
+                elif kind == "media":
+                    self.audio_frames += 1   # audio goes to the recogniser bridge, not to us
+                elif kind == "transcript":
+                    await self.on_transcript(event["transcript"].get("text", ""), event["transcript"].get("final", False))
+                elif kind == "stop":
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self.early:
+                self.early[1].cancel()
+            if self.call_sid:
+                self.sessions.delete(self.call_sid)
+                self.logic.prefetch.drop(self.call_sid)
+
+    async def on_start(self, start: dict):
+        self.stream_sid = start.get("streamSid")
+        self.call_sid = start.get("callSid") or self.stream_sid
+        params = start.get("customParameters") or {}
+        self.sessions.set(self.call_sid, {"phone": None, "history": [], "mode": "stream"})
+        parsed = parse_spoken_phone(params.get("phone", ""))
+        if parsed.phone:
+            await self._identified(parsed.phone, greet=False)
+            await self.say(GREETING)
+        else:
+            await self.say("Welcome to your bank's AI voice assistant. Please say your 10 digit mobile number.")
+        await self.mark("greeting")
+
+    async def _identified(self, phone: str, greet: bool = True):
+        self.phone = phone
+        self.sessions.update(self.call_sid, phone=phone, phone_partial="")
+        self.logic.prefetch.start(self.call_sid, phone)
+        self.publish("system", f"User identified: {phone}", self.call_sid)
+        if greet:
+            await self.say(f"Thanks. I have your number as {phone}. {GREETING}")
+
+    async def on_transcript(self, text: str, final: bool):
+        text = text.strip()
+        if self.phone is None:
+            if final:
+                await self._capture_phone(text)
+            return
+        if not final:
+            self._on_partial(text)
+            return
+        await self._on_final(text)
+
+    async def _capture_phone(self, text: str):
+        parsed = parse_spoken_phone(text, self.phone_partial)
+        REGISTRY.inc("bfsi_phone_capture_total", result="identified" if parsed.confidence >= PHONE_MIN_CONFIDENCE
+                      else "reprompt")
+        if parsed.phone and parsed.confidence >= PHONE_MIN_CONFIDENCE:
+            await self._identified(parsed.phone)
+        else:
+            self.phone_partial = parsed.digits if parsed.phone is None else ""
+            await self.say(f"I got {len(self.phone_partial)} digits. Please say the remaining digits."
+                           if self.phone_partial else "Sorry, I couldn't understand. Please say your mobile number clearly.")
+        await self.mark("phone")
+
+    def _on_partial(self, text: str):
+        # Keyword tier only: the n-gram model runs once, on the final transcript
+        intent = MATCHER.classify_keywords(text)
+        if intent == self.candidate:
+            self.streak += 1
+        else:
+            self.candidate, self.streak = intent, 1
+        if (self.early is None and intent != FALLBACK and intent in READ_ONLY_INTENTS
+                and self.streak >= self.stable_partials and not self.logic.awaiting_confirmation(self.phone)):
+            self.early = (intent, asyncio.create_task(self._respond(text, early=True)))
+
+    async def _on_final(self, text: str):
+        self.turn += 1
+        final_at = time.perf_counter()
+        intents = MATCHER.split_intents(text)
+        self.sessions.append_history(self.call_sid, {"user": text})
+        self.publish("user", text, self.call_sid)
+        answer = None
+        if self.early and intents == [self.early[0]]:
+            try:
+                answer = await self.early[1]
+                REGISTRY.inc("bfsi_stream_answers_total", mode="early")
+                REGISTRY.observe("bfsi_stream_answer_lead_seconds", max(0.0, final_at - self.early_ready_at))
+            except Exception:
+                log.exception("early answer failed for %s", self.call_sid)
+        elif self.early:
+            self.early[1].cancel()
+            if self.early_sent:
+                await self.ws.send_text(json.dumps({"event": "clear", "streamSid": self.stream_sid}))
+        if answer is None:
+            REGISTRY.inc("bfsi_stream_answers_total", mode="corrected" if self.early else "final")
+            answer = await self._respond(text)
+        self.publish("agent", answer, self.call_sid)
+        await self.mark(f"turn-{self.turn}")
+        self._reset_turn()
+
+    async def _respond(self, text: str, early: bool = False):
+        answer = await self.logic.generate_response(self.phone, text, self.call_sid)
+        if early:
+            self.early_ready_at = time.perf_counter()
+            self.early_sent = True
+        await self.say(answer)
+        return answer
+
+    async def say(self, text: str):
+        parts = [p for p in _SENTENCE.split(text) if p]
+        for i, part in enumerate(parts):
+            await self.ws.send_text(json.dumps({"event": "response", "streamSid": self.stream_sid, "text": part,
+                                                "last": i == len(parts) - 1}))
+
+    async def mark(self, name: str):
+        await self.ws.send_text(json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}}))
@@ -0,0 +1,202 @@
+# metrics.py — per-stage hot-path timing, in-process histograms and /metrics
+#
+# A TurnMetricsMiddleware starts a Turn for every webhook request and keeps it
+# in a context variable. Code on the hot path marks its stages with
+#
+#     with stage("classify_intent"):
+#         ...
+#
+# which is a no-op outside a request. When the response is sent the stage
+# timings are folded into histograms labelled by endpoint/stage/intent and
+# rendered in Prometheus text format by `REGISTRY.render()`. Turns slower than
+# SLOW_TURN_MS are logged with their stage breakdown.
+# Recording is a perf_counter() pair and a list append per stage.
+
+import contextvars
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+
+log = logging.getLogger("slow_turn")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}  # name -> {labels tuple: Histogram}
+        self._counters = {}    # name -> {labels tuple: float}
+        self._gauges = {}      # name -> callable returning {labels tuple: value} or a number
+        self._help = {}
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def observe(self, name: str, value: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        h = series.get(key)
+        if h is None:
+            h = series[key] = Histogram()
+        h.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name: str, fn):
+        """Register a callback evaluated at scrape time."""
+        self._gauges[name] = fn
+
+    def render(self) -> str:
+        out = []
+        for name, series in self._counters.items():
+            out.append(f"# HELP {name} {self._help.get(name, name)}\n# TYPE {name} counter")
+            out += [f"{name}{_fmt_labels(k)} {v}" for k, v in series.items()]
+        for name, fn in self._gauges.items():
+            out.append(f"# HELP {name} {self._help.get(name, name)}\n# TYPE {name} gauge")
+            value = fn()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            out += [f"{name}{_fmt_labels(k)} {v}" for k, v in items]
+        for name, series in self._histograms.items():
+            out.append(f"# HELP {name} {self._help.get(name, name)}\n# TYPE {name} histogram")
+            for key, h in series.items():
+                cumulative = 0
+                for le, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    out.append(f"{name}_bucket{_fmt_labels(key + (('le', le),))} {cumulative}")
+                out.append(f"{name}_bucket{_fmt_labels(key + (('le', '+Inf'),))} {h.count}")
+                out.append(f"{name}_sum{_fmt_labels(key)} {h.sum}")
+                out.append(f"{name}_count{_fmt_labels(key)} {h.count}")
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+REGISTRY.describe("bfsi_request_seconds", "Webhook latency by endpoint and intent")
+REGISTRY.describe("bfsi_stage_seconds", "Time spent in each stage of a webhook turn")
+REGISTRY.describe("bfsi_requests_total", "Webhook requests by endpoint and HTTP status")
+REGISTRY.describe("bfsi_slow_turns_total", "Turns slower than SLOW_TURN_MS")
+REGISTRY.describe("bfsi_phone_capture_total", "/get-phone attempts by result (identified or reprompt)")
+
+SLOW_TURN_SECONDS = float(os.getenv("SLOW_TURN_MS", 2000)) / 1000
+
+
+class Turn:
+    __slots__ = ("endpoint", "labels", "stages", "start")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.labels = {}
+        self.stages = []  # (name, seconds)
+        self.start = time.perf_counter()
+
+    def finish(self, status: int, registry: Registry = REGISTRY):
+        total = time.perf_counter() - self.start
+        intent = self.labels.get("intent", "")
+        registry.observe("bfsi_request_seconds", total, endpoint=self.endpoint, intent=intent)
+        registry.inc("bfsi_requests_total", endpoint=self.endpoint, status=status)
+        for name, seconds in self.stages:
+            registry.observe("bfsi_stage_seconds", seconds, endpoint=self.endpoint, stage=name, intent=intent)
+        if total >= SLOW_TURN_SECONDS:
+            registry.inc("bfsi_slow_turns_total", endpoint=self.endpoint)
+            breakdown = {}
+            for name, seconds in self.stages:
+                breakdown[name] = breakdown.get(name, 0) + seconds * 1000
+            log.warning("slow turn %s", json.dumps({
+                "endpoint": self.endpoint, "total_ms": round(total * 1000, 1), **self.labels,
+                "stages_ms": {n: round(ms, 1) for n, ms in breakdown.items()}}))
+
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class stage:
+    """Time a block as a named stage of the current turn (no-op outside a request).
+
+    With since_start=True the stage is measured from the start of the request,
+    which is how routing plus FastAPI's own Form() parsing gets attributed.
+    """
+    __slots__ = ("name", "since_start", "turn", "t0")
+
+    def __init__(self, name: str, since_start: bool = False):
+        self.name = name
+        self.since_start = since_start
+
+    def __enter__(self):
+        self.turn = _current_turn.get()
+        self.t0 = self.turn.start if self.since_start and self.turn else time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.turn is not None:
+            self.turn.stages.append((self.name, time.perf_counter() - self.t0))
+        return False
+
+
+def current_turn():
+    """The Turn being served in this context, or None outside a request."""
+    return _current_turn.get()
+
+
+def stage_ms(name: str):
+    """Milliseconds the current turn has spent in stage `name`, or None if it hasn't run."""
+    turn = _current_turn.get()
+    spent = [seconds for n, seconds in turn.stages if n == name] if turn is not None else []
+    return round(sum(spent) * 1000, 1) if spent else None
+
+
+def label_turn(**labels):
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.labels.update(labels)
+
+
+class TurnMetricsMiddleware:
+    """Pure ASGI middleware: one Turn per request to the listed paths."""
+
+    def __init__(self, app, paths=("/voice", "/get-phone", "/process", "/call-status", "/voice-stream")):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        turn = Turn(scope["path"])
+        token = _current_turn.set(turn)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_turn.reset(token)
+            turn.finish(status)
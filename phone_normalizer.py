@@ -0,0 +1,130 @@
+# phone_normalizer.py — spoken phone numbers to E.164
+#
+# Twilio's speech result for a phone number is rarely clean digits:
+#   "nine eight seven six five double four three two one"
+#   "my number is plus nine one 98765 43210"
+#   "नौ आठ सात छह ..." / "nau aath saat chhe ..."
+# `parse_spoken_phone` maps number words (en-IN and hi-IN, romanised or
+# Devanagari), digit runs, tens/teens ("ninety eight"), "double"/"triple"
+# repeats and a leading +91/91/0 prefix onto a canonical +91XXXXXXXXXX with
+# a confidence score. A capture that is too short is returned as a partial and
+# joined with the next attempt in the same call, so a caller who pauses
+# mid-number isn't asked to start over.
+
+import os
+import re
+from typing import NamedTuple
+
+COUNTRY_CODE = "91"
+NATIONAL_LENGTH = 10
+MIN_CONFIDENCE = float(os.getenv("PHONE_MIN_CONFIDENCE", 0.5))
+
+_UNITS = {
+    # en-IN
+    "zero": "0", "oh": "0", "o": "0", "nil": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+    # hi-IN, romanised as ASR tends to emit it
+    "shunya": "0", "shoonya": "0", "sunya": "0", "ek": "1", "do": "2", "teen": "3", "char": "4",
+    "chaar": "4", "paanch": "5", "panch": "5", "chhe": "6", "chhah": "6", "chah": "6", "chhey": "6",
+    "saat": "7", "sat": "7", "aath": "8", "ath": "8", "nau": "9", "no": "9",
+    # hi-IN, Devanagari
+    "शून्य": "0", "एक": "1", "दो": "2", "तीन": "3", "चार": "4", "पांच": "5", "पाँच": "5",
+    "छह": "6", "छः": "6", "छे": "6", "सात": "7", "आठ": "8", "नौ": "9",
+}
+# Tokens that are usually a digit in a phone context but could be ordinary words
+_AMBIGUOUS = {"oh", "o", "do", "no", "sat", "to", "too", "for", "won"}
+_UNITS.update({"to": "2", "too": "2", "for": "4", "won": "1"})
+
+_TEENS = {"ten": "10", "eleven": "11", "twelve": "12", "thirteen": "13", "fourteen": "14", "fifteen": "15",
+          "sixteen": "16", "seventeen": "17", "eighteen": "18", "nineteen": "19"}
+_TENS = {"twenty": "2", "thirty": "3", "forty": "4", "fifty": "5", "sixty": "6", "seventy": "7",
+         "eighty": "8", "ninety": "9"}
+_REPEAT = {"double": 2, "doubel": 2, "dubble": 2, "triple": 3, "treble": 3, "tripple": 3,
+           "डबल": 2, "ट्रिपल": 3}
+_PLUS = {"plus", "+", "प्लस"}
+_FILLER = {"my", "number", "is", "mobile", "phone", "it's", "its", "the", "and", "uh", "um", "hmm", "mera",
+           "hai", "नंबर", "मेरा", "है", "please", "yes", "ok", "okay", "sorry", "i", "said", "country", "code"}
+
+# Letters plus the Devanagari block, whose vowel signs are not \w
+_TOKEN = re.compile(r"\+|\d+|(?:[^\W\d_]|[\u0900-\u097F])+(?:'[a-z]+)?")
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+
+class PhoneParse(NamedTuple):
+    phone: str          # +91XXXXXXXXXX, or None if not enough digits yet
+    digits: str         # national digits captured so far (the partial to carry over)
+    confidence: float   # 0..1
+    unknown_tokens: int
+
+
+def spoken_digits(text: str):
+    """Digit string for a transcript, plus counts of (ambiguous, unknown) tokens."""
+    tokens = _TOKEN.findall((text or "").lower().translate(_DEVANAGARI_DIGITS))
+    out = []
+    ambiguous = unknown = 0
+    repeat = 1
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        i += 1
+        if tok in _REPEAT:
+            repeat = _REPEAT[tok]
+            continue
+        if tok.isdigit():
+            chunk = tok
+        elif tok in _TENS:
+            chunk = _TENS[tok]
+            nxt = tokens[i] if i < len(tokens) else None
+            if nxt in _UNITS and nxt not in _AMBIGUOUS and _UNITS[nxt] != "0":
+                chunk += _UNITS[nxt]
+                i += 1
+            else:
+                chunk += "0"
+        elif tok in _TEENS:
+            chunk = _TEENS[tok]
+        elif tok in _UNITS:
+            chunk = _UNITS[tok]
+            ambiguous += tok in _AMBIGUOUS
+        elif tok in _PLUS:
+            continue  # "+91" / "plus nine one": the 91 is stripped as a prefix below
+        else:
+            unknown += tok not in _FILLER
+            repeat = 1
+            continue
+        # "double five" repeats the next digit, not a whole digit run
+        out.append(chunk[0] * repeat + chunk[1:])
+        repeat = 1
+    return "".join(out), ambiguous, unknown
+
+
+def _strip_prefix(digits: str) -> str:
+    if len(digits) == NATIONAL_LENGTH + len(COUNTRY_CODE) and digits.startswith(COUNTRY_CODE):
+        return digits[len(COUNTRY_CODE):]
+    if len(digits) == NATIONAL_LENGTH + 1 and digits.startswith("0"):
+        return digits[1:]
+    return digits
+
+
+def parse_spoken_phone(text: str, partial: str = "") -> PhoneParse:
+    raw, ambiguous, unknown = spoken_digits(text)
+    digits = _strip_prefix(raw)
+
+    # Join with an earlier partial capture from the same call. Longer than a number means the
+    # caller started over: drop the partial and keep the new digits (re-prompted below)
+    if len(digits) < NATIONAL_LENGTH and partial:
+        joined = _strip_prefix(partial + digits)
+        if len(joined) <= NATIONAL_LENGTH:
+            digits = joined
+
+    if len(digits) < NATIONAL_LENGTH:
+        return PhoneParse(None, digits, 0.0, unknown)
+    national = digits[-NATIONAL_LENGTH:]
+
+    confidence = 1.0
+    confidence -= 0.1 * ambiguous
+    confidence -= 0.15 * unknown
+    if len(digits) > NATIONAL_LENGTH:
+        confidence -= 0.3   # extra digits we had to drop
+    if national[0] not in "6789":
+        confidence -= 0.4   # Indian mobile numbers start with 6-9
+    return PhoneParse("+" + COUNTRY_CODE + national, national, round(max(confidence, 0.0), 2), unknown)
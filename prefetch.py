@@ -0,0 +1,91 @@
+# prefetch.py — speculative answers once the caller is identified
+#
+# As soon as /get-phone resolves a number we know everything a read-only turn
+# could ask for. `start()` schedules a task that loads the customer snapshot
+# once and renders + rephrases the answer for every read-only intent, while the
+# caller is still hearing "How can I help you today?". /process then serves
+# from this per-call cache; a state-changing action (card block, contact
+# update) invalidates the call's entries so nothing stale is ever spoken.
+
+import asyncio
+import logging
+
+from admission import skip_rephrase
+from metrics import REGISTRY
+from ttl_cache import TTLCache
+
+log = logging.getLogger("prefetch")
+
+READ_ONLY_INTENTS = ("balance_inquiry", "emi_info", "claim_status", "fallback")
+STATE_CHANGING_INTENTS = ("card_block", "confirm_contact")
+
+REGISTRY.describe("bfsi_prefetch_total", "Prefetched answer lookups by result")
+
+
+class Prefetcher:
+    def __init__(self, logic, max_calls: int = 10000, ttl: float = 900):
+        self.logic = logic
+        self._calls = TTLCache(max_calls, ttl)  # call_sid -> (fill task, {intent: (raw message, rephrase task)})
+
+    def start(self, call_sid: str, phone: str):
+        """Schedule the prefetch; the lookup and handlers run after the webhook has answered."""
+        if not call_sid or skip_rephrase():
+            return
+        entries = {}
+        self._calls.set(call_sid, (asyncio.create_task(self._fill(phone, entries)), entries))
+
+    async def _fill(self, phone: str, entries: dict):
+        try:
+            # One repository fetch shared by every handler below
+            customer = self.logic.find_customer(phone)
+            rephraser = self.logic.rephraser
+            for intent in READ_ONLY_INTENTS:
+                r = self.logic.handle(intent, phone, customer=customer)
+                task = asyncio.create_task(
+                    rephraser.rephrase(r["message"], r["template"], r["slots"], budget=rephraser.provider_timeout))
+                entries[intent] = (r["message"], task)
+        except Exception:
+            log.exception("prefetch for %s failed", phone)
+
+    async def get(self, call_sid: str, intent: str, budget: float = None):
+        """Prefetched answer for this call/intent, or None on a miss (or if invalidated meanwhile)."""
+        call = self._calls.get(call_sid) if call_sid else None
+        if call is not None and not call[0].done():
+            try:
+                await asyncio.shield(call[0])
+            except asyncio.CancelledError:
+                if not call[0].cancelled():
+                    raise   # this turn was cancelled, not the prefetch
+        entry = call[1].get(intent) if call is not None else None
+        if entry is None:
+            REGISTRY.inc("bfsi_prefetch_total", result="miss")
+            return None
+        raw, task = entry
+        if task.done():
+            if task.cancelled():
+                REGISTRY.inc("bfsi_prefetch_total", result="miss")
+                return None
+            REGISTRY.inc("bfsi_prefetch_total", result="hit")
+            return task.result() if not task.exception() else raw
+        # Still rephrasing: wait out the turn budget, then speak the raw text
+        REGISTRY.inc("bfsi_prefetch_total", result="pending")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.logic.rephraser.budget if budget is None else budget)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None   # a state change invalidated it while we waited: answer fresh
+            raise
+        except Exception:
+            return raw
+
+    def invalidate(self, call_sid: str):
+        call = self._calls.pop(call_sid) if call_sid else None
+        if call is not None:
+            call[0].cancel()
+            for _, task in call[1].values():
+                task.cancel()
+
+    drop = invalidate
+
+    def __len__(self):
+        return len(self._calls)
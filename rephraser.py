@@ -0,0 +1,113 @@
+# rephraser.py — latency-budgeted async LLM rephrasing
+#
+# The spoken answer is built from a fixed template plus a few slot values, so
+# the rephrased text is cached on (template, slots). On top of the cache:
+#   - a hard per-turn budget: if the LLM isn't back in time we speak the raw
+#     message (the call keeps running and fills the cache for next time)
+#   - single-flight: identical in-flight requests share one provider call
+#   - a semaphore and a consecutive-failure circuit breaker around the provider
+# Works with AsyncOpenAI, the sync OpenAI client (run in a thread) or the
+# offline stand-ins in llm_stub.py.
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+from ttl_cache import TTLCache
+
+log = logging.getLogger("rephraser")
+
+PROMPT = "Rephrase for friendly voice tone: {msg}"
+
+
+class Rephraser:
+    def __init__(self, client, model: str, budget: float = None, cache_size: int = None, cache_ttl: float = None,
+                 max_concurrency: int = None, provider_timeout: float = None,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.client = client
+        self.model = model
+        self.budget = budget if budget is not None else float(os.getenv("LLM_BUDGET_MS", 1500)) / 1000
+        self.provider_timeout = provider_timeout or float(os.getenv("LLM_TIMEOUT", 10))
+        self.cache = TTLCache(cache_size or int(os.getenv("REPHRASE_CACHE_SIZE", 1024)),
+                              cache_ttl or float(os.getenv("REPHRASE_CACHE_TTL", 3600)))
+        self._sem = asyncio.Semaphore(max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 16)))
+        self._inflight = {}  # key -> asyncio.Task
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self.stats = {"requests": 0, "coalesced": 0, "over_budget": 0, "errors": 0,
+                      "short_circuited": 0, "provider_calls": 0}
+
+    @staticmethod
+    def cache_key(msg: str, template: str = None, slots: dict = None):
+        if template is None:
+            return msg
+        return template, tuple(sorted((slots or {}).items()))
+
+    @property
+    def breaker_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    async def rephrase(self, msg: str, template: str = None, slots: dict = None, budget: float = None) -> str:
+        """Return the rephrased message, or `msg` itself if it can't be had within budget."""
+        if not self.client:
+            return msg
+        self.stats["requests"] += 1
+        key = self.cache_key(msg, template, slots)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if self.breaker_open:
+            self.stats["short_circuited"] += 1
+            return msg
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, msg))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.stats["coalesced"] += 1
+
+        try:
+            # shield: a blown budget must not cancel the shared provider call
+            return await asyncio.wait_for(asyncio.shield(task), self.budget if budget is None else budget) or msg
+        except asyncio.TimeoutError:
+            self.stats["over_budget"] += 1
+            return msg
+        except Exception:
+            return msg
+
+    async def prewarm(self, messages):
+        """Fill the cache for fixed texts (e.g. the fallback sentence) at startup."""
+        await asyncio.gather(*(self.rephrase(m, budget=self.provider_timeout) for m in messages))
+
+    async def _fetch(self, key, msg: str) -> str:
+        async with self._sem:
+            self.stats["provider_calls"] += 1
+            try:
+                text = await asyncio.wait_for(self._call_provider(msg), self.provider_timeout)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self._failures += 1
+                if self._failures >= self.breaker_threshold:
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+                    log.warning("LLM circuit open for %.0fs after %d failures: %s",
+                                self.breaker_cooldown, self._failures, e)
+                raise
+        self._failures = 0
+        if text:
+            self.cache.set(key, text)
+        return text
+
+    async def _call_provider(self, msg: str) -> str:
+        kwargs = dict(model=self.model, input=PROMPT.format(msg=msg), temperature=0.7)
+        create = self.client.responses.create
+        if inspect.iscoroutinefunction(create):
+            resp = await create(**kwargs)
+        else:
+            resp = await asyncio.to_thread(create, **kwargs)
+        return resp.output_text
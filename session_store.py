@@ -0,0 +1,187 @@
+# session_store.py — bounded call-session store keyed by CallSid
+#
+# Two backends behind one interface:
+#   MemorySessionStore  — LRU + TTL in process memory (single worker)
+#   SQLiteSessionStore  — SQLite in WAL mode, shared by every uvicorn worker
+#                         on the host so /get-phone and /process may land on
+#                         different processes.
+# Pick one with SESSION_STORE=memory | sqlite:///path/to/sessions.db
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+TERMINAL_CALL_STATUSES = {"completed", "failed", "busy", "no-answer", "canceled"}
+
+
+class SessionStore(ABC):
+    """Interface shared by the backends. Sessions are plain JSON-able dicts."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000, max_history: int = 50):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_history = max_history
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "deleted": 0}
+
+    @abstractmethod
+    def get(self, call_sid: str):
+        ...
+
+    @abstractmethod
+    def set(self, call_sid: str, session: dict):
+        ...
+
+    @abstractmethod
+    def delete(self, call_sid: str):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    def update(self, call_sid: str, **fields) -> dict:
+        session = self.get(call_sid) or {"phone": None, "history": []}
+        session.update(fields)
+        self.set(call_sid, session)
+        return session
+
+    def append_history(self, call_sid: str, item: dict) -> dict:
+        session = self.get(call_sid) or {"phone": None, "history": []}
+        history = session.setdefault("history", [])
+        history.append(item)
+        del history[:-self.max_history]
+        self.set(call_sid, session)
+        return session
+
+    def phone(self, call_sid: str):
+        return (self.get(call_sid) or {}).get("phone")
+
+    def stats(self) -> dict:
+        return {**self._stats, "size": len(self), "backend": type(self).__name__}
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self._data = OrderedDict()  # call_sid -> (expires_at, session)
+        self._lock = threading.Lock()
+
+    def get(self, call_sid):
+        with self._lock:
+            entry = self._data.get(call_sid)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[call_sid]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(call_sid)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, call_sid, session):
+        with self._lock:
+            self._data[call_sid] = (time.monotonic() + self.ttl, session)
+            self._data.move_to_end(call_sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, call_sid):
+        with self._lock:
+            if self._data.pop(call_sid, None) is not None:
+                self._stats["deleted"] += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionStore(SessionStore):
+    PURGE_EVERY = 500  # writes between expired/overflow sweeps
+
+    def __init__(self, path: str = "sessions.db", **kw):
+        super().__init__(**kw)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                        call_sid TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        expires_at REAL NOT NULL)""")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires_at)")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, call_sid):
+        row = self._db().execute("SELECT data, expires_at FROM sessions WHERE call_sid = ?", (call_sid,)).fetchone()
+        if row is None or row[1] < time.time():
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, call_sid, session):
+        self._db().execute("INSERT OR REPLACE INTO sessions (call_sid, data, expires_at) VALUES (?, ?, ?)",
+                           (call_sid, json.dumps(session), time.time() + self.ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def _locked(self, fn, *args, **kw):
+        # Read-modify-write under a write lock so concurrent workers don't lose each other's changes
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            session = fn(*args, **kw)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return session
+
+    def update(self, call_sid, **fields):
+        return self._locked(super().update, call_sid, **fields)
+
+    def append_history(self, call_sid, item):
+        return self._locked(super().append_history, call_sid, item)
+
+    def delete(self, call_sid):
+        if self._db().execute("DELETE FROM sessions WHERE call_sid = ?", (call_sid,)).rowcount:
+            self._stats["deleted"] += 1
+
+    def purge(self):
+        db = self._db()
+        self._stats["expired"] += db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+        self._stats["evictions"] += db.execute(
+            """DELETE FROM sessions WHERE call_sid IN (
+                 SELECT call_sid FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)""",
+            (self.max_entries,)).rowcount
+
+    def __len__(self):
+        return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def make_session_store(url: str = None) -> SessionStore:
+    url = url or os.getenv("SESSION_STORE", "memory")
+    kw = dict(ttl=float(os.getenv("SESSION_TTL", 3600)),
+              max_entries=int(os.getenv("SESSION_MAX", 10000)),
+              max_history=int(os.getenv("SESSION_HISTORY_MAX", 50)))
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):], **kw)
+    if url == "memory":
+        return MemorySessionStore(**kw)
+    raise ValueError(f"Unknown SESSION_STORE: {url}")
@@ -0,0 +1,86 @@
+# twilio_stub.py — offline stand-in for the Twilio REST client
+#
+# Same surface as `Client(...).calls.create(...).sid` for outbound calls. Each
+# create() blocks for the API latency (like the real HTTP request), returns a
+# fake CallSid and, after a simulated ring/talk time, delivers the final
+# status callback Twilio would send: by default a form POST to the call's
+# status_callback URL, or any `deliver(url, form)` callable (the benchmark
+# feeds the dialer directly). Enable in the apps with TWILIO_STUB=1.
+
+import heapq
+import os
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+
+DEFAULT_OUTCOMES = {"completed": 0.6, "no-answer": 0.2, "busy": 0.15, "failed": 0.05}
+
+
+def post_status(url: str, form: dict):
+    try:
+        httpx.post(url, data=form, timeout=5)
+    except httpx.HTTPError:
+        pass  # Twilio doesn't retry status callbacks either
+
+
+class _Calls:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, to=None, from_=None, url=None, status_callback=None, **kwargs):
+        o = self._owner
+        time.sleep(o.latency)
+        with o._lock:
+            o.created += 1
+            o.active += 1
+            o.max_active = max(o.max_active, o.active)
+            if o.failure_rate and o.rng.random() < o.failure_rate:
+                o.active -= 1
+                raise RuntimeError("stub Twilio API error (429 Too Many Requests)")
+            status = o.rng.choices(list(o.outcomes), weights=list(o.outcomes.values()))[0]
+            duration = o.rng.uniform(*o.duration)
+        sid = "CA" + uuid.uuid4().hex
+        o._schedule(duration, status_callback, {"CallSid": sid, "CallStatus": status, "To": to, "From": from_})
+        return SimpleNamespace(sid=sid, status="queued", to=to)
+
+
+class StubTwilioClient:
+    def __init__(self, latency: float = None, duration=(1.0, 5.0), outcomes: dict = None,
+                 failure_rate: float = 0.0, deliver=post_status, seed: int = None):
+        self.latency = latency if latency is not None else float(os.getenv("TWILIO_STUB_LATENCY_MS", 150)) / 1000
+        self.duration = duration
+        self.outcomes = outcomes or DEFAULT_OUTCOMES
+        self.failure_rate = failure_rate
+        self.deliver = deliver
+        self.rng = random.Random(seed)
+        self.created = 0
+        self.active = 0      # calls created whose final status hasn't been delivered
+        self.max_active = 0
+        self.calls = _Calls(self)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._heap = []
+        self._seq = 0
+        self._thread = None
+
+    def _schedule(self, delay: float, url: str, form: dict):
+        with self._wake:
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, url, form))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="twilio-stub", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._wake.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, url, form = heapq.heappop(self._heap)
+                self.active -= 1
+            self.deliver(url, form)
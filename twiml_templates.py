@@ -0,0 +1,113 @@
+# twiml_templates.py — TwiML rendered once at import, served as bytes
+#
+# Most webhook replies are fixed documents (the /voice welcome, the
+# /get-phone retry, the /process "verified number first" prompt) or differ
+# only in one spoken string. Building them with VoiceResponse/Gather and
+# ElementTree on every request is pure per-turn CPU, so each document is
+# built once: `static()` keeps the serialised bytes and `TwimlTemplate`
+# serialises with @@slot@@ markers and splits on them, leaving an escape and
+# a join per request. The builders below are shared by main.py and app_bfsi.py.
+
+import re
+from xml.sax.saxutils import escape
+
+from twilio.twiml.voice_response import Gather, VoiceResponse
+
+_SLOT = re.compile(r"@@(\w+)@@")
+_ATTR_ENTITIES = {'"': "&quot;"}
+VOICE = dict(voice="Polly.Joanna", language="en-IN")
+SPEECH = dict(input="speech", method="POST", speech_timeout="auto", enhanced=True, language="en-IN")
+
+
+def static(vr: VoiceResponse) -> bytes:
+    return str(vr).encode()
+
+
+class TwimlTemplate:
+    """A TwiML document with @@name@@ slots, pre-serialised; render(**slots) escapes and joins."""
+
+    def __init__(self, vr: VoiceResponse):
+        parts = _SLOT.split(str(vr))
+        self._text = [p.encode() for p in parts[0::2]]
+        self.slots = parts[1::2]
+
+    def render(self, **values) -> bytes:
+        out = [self._text[0]]
+        for name, text in zip(self.slots, self._text[1:]):
+            out.append(escape(str(values[name]), _ATTR_ENTITIES).encode())
+            out.append(text)
+        return b"".join(out)
+
+
+def slot(name: str) -> str:
+    return f"@@{name}@@"
+
+
+# --- Builders (one per reply shape) ---
+
+def welcome() -> VoiceResponse:
+    vr = VoiceResponse()
+    vr.say("Welcome to your bank's AI voice assistant.", **VOICE)
+    g = Gather(action="/get-phone", timeout=8, hints="zero one two three four five six seven eight nine", **SPEECH)
+    g.say("Please say your 10 digit mobile number.", voice="Polly.Joanna")
+    vr.append(g)
+    vr.say("I didn't catch that. Please call again. Goodbye!")
+    return vr
+
+
+def ask_phone(prompt: str, preamble: str = None) -> VoiceResponse:
+    vr = VoiceResponse()
+    if preamble:
+        vr.say(preamble, voice="Polly.Joanna")
+    g = Gather(action="/get-phone", timeout=8, **SPEECH)
+    g.say(prompt)
+    vr.append(g)
+    return vr
+
+
+def identified(prompt: str) -> VoiceResponse:
+    vr = VoiceResponse()
+    vr.say(f"Thanks. I have your number as {slot('phone')}.", **VOICE)
+    g = Gather(action="/process", timeout=10, **SPEECH)
+    g.say(prompt)
+    vr.append(g)
+    vr.say("I didn't hear anything. Goodbye!")
+    return vr
+
+
+def answer() -> VoiceResponse:
+    vr = VoiceResponse()
+    vr.say(slot("answer"), **VOICE)
+    g = Gather(action="/process", timeout=8, **SPEECH)
+    g.say("Anything else?")
+    vr.append(g)
+    vr.say("Thank you for calling. Goodbye!")
+    return vr
+
+
+def hold() -> VoiceResponse:
+    vr = VoiceResponse()
+    vr.say("We're handling a very high number of calls right now. Please hold a moment.", **VOICE)
+    vr.pause(length=2)
+    g = Gather(action="/process", timeout=8, **SPEECH)
+    g.say("Please say that again.")
+    vr.append(g)
+    vr.say("Sorry for the wait. Please call us back in a few minutes. Goodbye!", **VOICE)
+    return vr
+
+
+def call_back() -> VoiceResponse:
+    vr = VoiceResponse()
+    vr.say("We're handling a very high number of calls right now. Please call us back in a few minutes. Goodbye!", **VOICE)
+    vr.hangup()
+    return vr
+
+
+# Shared by both apps
+VOICE_WELCOME = static(welcome())
+PHONE_RETRY = static(ask_phone("Sorry, I couldn't understand. Please say your mobile number clearly."))
+PHONE_PARTIAL = TwimlTemplate(ask_phone(f"I got {slot('count')} digits. Please say the remaining digits."))
+ANSWER = TwimlTemplate(answer())
+# Load shedding (admission.py)
+PLEASE_HOLD = static(hold())
+CALL_BACK = static(call_back())
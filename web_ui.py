@@ -2,33 +2,55 @@ from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import subprocess, threading
+from conversation_feed import ConversationFeed
+from conversation_journal import make_journal
+from call_me import call_me_bfsi
+import asyncio, os
 
 app = FastAPI(title="BFSI Voice Agent Dashboard")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-chat_log = []
+journal = make_journal()  # opt-in (CONVERSATION_JOURNAL); normally the agent process journals what it forwards
+chat_log = ConversationFeed(window=int(os.getenv("CONVERSATION_WINDOW", 5000)), journal=journal)
 demo_data = {"name": "Aarav Sharma", "balance": 125430.00, "card_status": "Active"}
 
+@app.on_event("startup")
+async def startup():
+    chat_log.claim()   # single worker: seq / Last-Event-ID are per process
+    if journal:
+        app.state.journal_maintenance = asyncio.create_task(journal.run_maintenance())
+
+@app.on_event("shutdown")
+async def shutdown():
+    chat_log.release()
+    if journal:
+        journal.close()
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "chat_log": chat_log, "demo_data": demo_data})
+    return templates.TemplateResponse("index.html", {"request": request, "chat_log": chat_log.events, "demo_data": demo_data})
 
 @app.get("/start-call")
 async def start_call():
-    def run_call():
-        subprocess.run(["python", "call_me.py"])
-    threading.Thread(target=run_call).start()
-    return JSONResponse({"status": "Call initiated"})
+    # In-process on the shared pooled client, instead of a `python call_me.py` per click
+    sid = await asyncio.to_thread(call_me_bfsi)
+    if sid is None:
+        return JSONResponse({"error": "Call failed"}, status_code=500)
+    return JSONResponse({"status": "Call initiated", "sid": sid})
 
 @app.get("/conversation")
-async def get_conversation():
-    return JSONResponse({"chat": chat_log})
+async def get_conversation(since: int = 0, call_sid: str = None, limit: int = 500):
+    return JSONResponse({"chat": chat_log.since(since, call_sid, limit), "cursor": chat_log.cursor})
+
+@app.get("/conversation/stream")
+async def stream_conversation(request: Request, call_sid: str = None, since: int = None):
+    return chat_log.sse_response(request, call_sid, since)
 
 @app.post("/conversation")
 async def add_conversation(request: Request):
     data = await request.json()
-    chat_log.append(data)
-    return JSONResponse({"ok": True})
+    # The dashboard bus posts batches as {"events": [...]}
+    events = data.get("events", [data]) if isinstance(data, dict) else data
+    return JSONResponse({"ok": True, "count": chat_log.extend(events)})